@@ -0,0 +1,25 @@
+from fastapi import HTTPException, UploadFile
+from app.core.config import settings
+
+# 接受的音频类型：content_type前缀或文件扩展名满足其一即可
+VALID_AUDIO_CONTENT_TYPES = ["audio/", "application/octet-stream"]
+VALID_AUDIO_EXTENSIONS = [".wav", ".mp3", ".m4a", ".ogg", ".flac"]
+
+async def read_audio_upload(audio: UploadFile) -> bytes:
+    """
+    校验上传的音频文件类型和大小并读取内容
+    不是音频时返回400，超过MAX_AUDIO_SIZE时返回413；最多读取上限加一个字节，超大文件不会整个读入内存
+    """
+    content_type = audio.content_type or ""
+    is_valid_content_type = any(content_type.startswith(prefix) for prefix in VALID_AUDIO_CONTENT_TYPES)
+    is_valid_extension = bool(audio.filename) and audio.filename.lower().endswith(tuple(VALID_AUDIO_EXTENSIONS))
+    if not (is_valid_content_type or is_valid_extension):
+        raise HTTPException(status_code=400, detail="只支持音频文件")
+
+    content = await audio.read(settings.MAX_AUDIO_SIZE + 1)
+    if len(content) > settings.MAX_AUDIO_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"音频文件大小不能超过 {settings.MAX_AUDIO_SIZE / 1024 / 1024:.1f}MB"
+        )
+    return content
@@ -0,0 +1,48 @@
+import asyncio
+from typing import Callable, Optional
+from fastapi import Request
+from app.core.config import settings
+from app.utils.deadline import set_deadline, set_disconnect_event
+
+# 客户端指定请求截止时间的请求头（秒）
+DEADLINE_HEADER = "X-Request-Timeout"
+
+def request_deadline(default_seconds: Optional[float] = None) -> Callable:
+    """
+    生成设置请求截止时间的依赖
+    截止时间取请求头X-Request-Timeout，未提供时使用接口默认值，不超过REQUEST_DEADLINE_MAX_SECONDS；
+    同时在后台检测客户端断开，截止时间和断开事件通过上下文传递给各个服务
+    """
+    async def dependency(request: Request):
+        timeout = default_seconds or settings.REQUEST_DEADLINE_SECONDS
+        header = request.headers.get(DEADLINE_HEADER)
+        if header:
+            try:
+                timeout = float(header)
+            except ValueError:
+                pass
+        set_deadline(min(max(timeout, 0.001), settings.REQUEST_DEADLINE_MAX_SECONDS))
+
+        event = asyncio.Event()
+        set_disconnect_event(event)
+        _watch_disconnect(request, event, asyncio.current_task())
+
+    return dependency
+
+def _watch_disconnect(request: Request, event: asyncio.Event, request_task: Optional[asyncio.Task]):
+    """
+    定期检查客户端是否断开，请求处理结束后停止
+    """
+    async def watch():
+        while request_task is not None and not request_task.done():
+            if await request.is_disconnected():
+                event.set()
+                return
+            await asyncio.sleep(settings.DISCONNECT_POLL_SECONDS)
+
+    task = asyncio.get_running_loop().create_task(watch())
+    _watchers.add(task)
+    task.add_done_callback(_watchers.discard)
+
+# 正在运行的断开检测任务，防止被垃圾回收
+_watchers = set()
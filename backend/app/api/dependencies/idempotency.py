@@ -0,0 +1,15 @@
+from fastapi import HTTPException
+from app.services.idempotency_service import IdempotencyError, IdempotencyInProgressError
+
+# 客户端指定幂等键的请求头，重试时使用相同的值
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# 响应是重放的首次请求结果时带上该响应头
+IDEMPOTENCY_REPLAYED_HEADER = "Idempotent-Replayed"
+
+def idempotency_http_error(error: IdempotencyError) -> HTTPException:
+    """
+    将幂等键异常转换为HTTP错误，首次请求仍在处理时提示客户端稍后重试
+    """
+    headers = {"Retry-After": "5"} if isinstance(error, IdempotencyInProgressError) else None
+    return HTTPException(status_code=error.status_code, detail=str(error), headers=headers)
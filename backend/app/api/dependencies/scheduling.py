@@ -0,0 +1,11 @@
+from typing import Optional
+from fastapi import Request
+
+def scheduling_user(user_id: Optional[str], http_request: Request) -> str:
+    """
+    获取公平调度使用的用户标识，未提供用户ID时按客户端地址区分
+    """
+    if user_id:
+        return user_id
+    client = http_request.client
+    return f"ip:{client.host}" if client else "anonymous"
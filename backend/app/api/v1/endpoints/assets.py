@@ -0,0 +1,77 @@
+import os
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from app.services.asset_store import AssetStore, ASSET_MEDIA_TYPES
+from app.services.derivative_service import DerivativeService, SVG_VARIANT
+
+router = APIRouter()
+
+# 资源按内容寻址，内容不会变化，可以永久缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _immutable_file_response(request: Request, path: str, etag: str, media_type: str) -> Response:
+    """
+    返回内容不可变的文件
+    支持ETag协商缓存，FileResponse负责Range请求，服务器支持时使用pathsend零拷贝发送
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL
+    }
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@router.get("/{asset_name}")
+async def get_asset(asset_name: str, request: Request):
+    """
+    获取本地存储的图像资源
+    """
+    asset_store = AssetStore()
+    try:
+        path = asset_store.path_for(asset_name)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="资源不存在")
+    
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="资源不存在")
+    
+    return _immutable_file_response(
+        request,
+        path,
+        etag=f'"{asset_name.split(".")[0]}"',
+        media_type=ASSET_MEDIA_TYPES[asset_name.rsplit(".", 1)[1]]
+    )
+
+@router.get("/{asset_name}/{variant}")
+async def get_asset_variant(asset_name: str, variant: str, request: Request):
+    """
+    获取图像资源的缩略图/压缩派生图，variant为svg时返回描出的矢量图
+    派生图不存在时即时生成
+    """
+    derivative_service = DerivativeService()
+    try:
+        path = derivative_service.path_for(asset_name, variant)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="资源不存在")
+    
+    if not os.path.isfile(path):
+        if not os.path.isfile(derivative_service.asset_store.path_for(asset_name)):
+            raise HTTPException(status_code=404, detail="资源不存在")
+        try:
+            if variant == SVG_VARIANT:
+                await derivative_service.ensure_svg(asset_name)
+            else:
+                await derivative_service.ensure_variants(asset_name)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"派生图生成失败: {str(e)}")
+    
+    return _immutable_file_response(
+        request,
+        path,
+        etag=f'"{asset_name.split(".")[0]}-{variant}"',
+        media_type=ASSET_MEDIA_TYPES["svg"] if variant == SVG_VARIANT else "image/webp"
+    )
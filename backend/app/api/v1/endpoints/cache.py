@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from typing import Optional
 from app.api.dependencies.database import get_db
 from app.services.cache_service import CacheService
+from app.services.hot_prompts import HOT_WINDOWS, get_hot_prompts
 
 router = APIRouter()
 
@@ -16,6 +18,19 @@ class CacheResponse(BaseModel):
     value: str
     exists: bool
 
+@router.get("/hot")
+async def hot_prompts(
+    window: Optional[str] = Query(None, description="滑动窗口：5m / 1h / 24h，不指定时返回全部窗口"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    获取热门提示词和主体
+    按滑动窗口返回估计请求次数最高的项及其图像缓存命中率，用于调整缓存时间和预热
+    """
+    if window is not None and window not in HOT_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"不支持的窗口: {window}，可选 {', '.join(HOT_WINDOWS)}")
+    return get_hot_prompts(window, limit)
+
 @router.get("/{cache_key}", response_model=CacheResponse)
 async def get_cache(
     cache_key: str,
@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, File, Form, Header, Query, Request, Response, UploadFile
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+import hashlib
+from typing import Dict, List, Literal, Optional
 from app.api.dependencies.database import get_db
-from app.models.drawing import Drawing
+from app.api.dependencies.deadline import request_deadline
+from app.api.dependencies.audio import read_audio_upload
+from app.api.dependencies.idempotency import IDEMPOTENCY_HEADER, IDEMPOTENCY_REPLAYED_HEADER, idempotency_http_error
+from app.api.dependencies.scheduling import scheduling_user
+from app.core.config import settings
+from app.services.asset_store import UntrustedAssetUrlError
+from app.services.bundle_service import BUNDLE_LAYOUT_HEADER, BundleService
 from app.services.drawing_service import DrawingService
+from app.services.idempotency_service import IdempotencyError, IdempotencyService
+from app.utils.deadline import RequestAbandonedError
 
 router = APIRouter()
 
@@ -14,36 +24,183 @@ class DrawingCreate(BaseModel):
     prompt: str
     image_url: str
     steps_images: List[str]
+    style: Optional[str] = None
     user_id: Optional[str] = None
 
+class DrawingFromTextRequest(BaseModel):
+    text: str
+    style: str = "简笔画"
+    steps: int = Field(4, ge=0, le=settings.IMAGE_MAX_STEPS)  # 分步骤数量
+    user_id: Optional[str] = None
+    quality: Literal["preview", "full"] = "full"  # preview：先保存预览图，高清图后台生成后更新画作
+
 class DrawingResponse(BaseModel):
     id: int
     title: str
     description: Optional[str]
     prompt: str
     image_url: str
+    preview_image_url: Optional[str] = None  # 预览图，quality为preview时高清图仍在生成
+    quality: str = "full"
     steps_images: List[str]
+    style: Optional[str] = None
+    steps: Optional[int] = None
+    image_variants: Dict[str, str] = {}  # 缩略图等派生图URL，键为规格名
+    steps_images_variants: List[Dict[str, str]] = []
+    svg_url: Optional[str] = None  # 描出的矢量图，可逐笔画动画显示
+    steps_svg_urls: List[Optional[str]] = []
     user_id: Optional[str]
     created_at: str
     
     class Config:
         from_attributes = True
 
+class BundleFrame(BaseModel):
+    image: str  # final 或 step_<序号>
+    source_url: str
+    x: int
+    y: int
+    width: int
+    height: int
+
+class DrawingBundleResponse(BaseModel):
+    sprite_url: str  # 精灵图，内容不可变，可永久缓存
+    width: int
+    height: int
+    frames: List[BundleFrame]
+
 @router.post("/", response_model=DrawingResponse)
 async def create_drawing(
     drawing: DrawingCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     db: Session = Depends(get_db)
 ):
     """
     保存新画作
+    带Idempotency-Key请求头时，保留期内相同键的重试返回首次保存的画作，不会重复保存
     """
     try:
-        drawing_service = DrawingService(db)
-        new_drawing = await drawing_service.create_drawing(drawing)
+        if not idempotency_key:
+            drawing_service = DrawingService(db)
+            return await drawing_service.create_drawing(drawing)
+        
+        new_drawing, replayed = await IdempotencyService(db).run(
+            "drawings.create",
+            idempotency_key,
+            drawing.model_dump(),
+            lambda task_db: DrawingService(task_db).create_drawing(drawing),
+            "保存画作"
+        )
+        if replayed:
+            response.headers[IDEMPOTENCY_REPLAYED_HEADER] = "true"
         return new_drawing
+    except UntrustedAssetUrlError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IdempotencyError as e:
+        raise idempotency_http_error(e)
+    except RequestAbandonedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"保存画作失败: {str(e)}")
 
+@router.post("/from-text", response_model=DrawingResponse, dependencies=[Depends(request_deadline())])
+async def create_drawing_from_text(
+    request: DrawingFromTextRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+    db: Session = Depends(get_db)
+):
+    """
+    根据文字生成图像并保存为画作，一次请求完成，客户端不需要再提交图像URL
+    """
+    try:
+        def create(session: Session):
+            return DrawingService(session).create_drawing_from_text(
+                text=request.text,
+                user_id=request.user_id,
+                style=request.style,
+                steps=request.steps,
+                quality=request.quality,
+                scheduling_user=scheduling_user(request.user_id, http_request)
+            )
+        
+        if not idempotency_key:
+            return await create(db)
+        
+        new_drawing, replayed = await IdempotencyService(db).run(
+            "drawings.from_text",
+            idempotency_key,
+            request.model_dump(),
+            create,
+            "文字创建画作"
+        )
+        if replayed:
+            response.headers[IDEMPOTENCY_REPLAYED_HEADER] = "true"
+        return new_drawing
+    except IdempotencyError as e:
+        raise idempotency_http_error(e)
+    except RequestAbandonedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post(
+    "/from-speech",
+    response_model=DrawingResponse,
+    dependencies=[Depends(request_deadline(settings.REQUEST_DEADLINE_SECONDS + settings.SPEECH_REQUEST_DEADLINE_SECONDS))]
+)
+async def create_drawing_from_speech(
+    http_request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    style: str = Form("简笔画"),
+    steps: int = Form(4, ge=0, le=settings.IMAGE_MAX_STEPS),
+    user_id: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+    db: Session = Depends(get_db)
+):
+    """
+    识别语音、生成图像并保存为画作，一次请求完成
+    音频的类型和大小校验与语音识别接口一致
+    """
+    try:
+        audio_content = await read_audio_upload(file)
+        
+        def create(session: Session):
+            return DrawingService(session).create_drawing_from_speech(
+                audio_content,
+                user_id=user_id,
+                style=style,
+                steps=steps,
+                scheduling_user=scheduling_user(user_id, http_request)
+            )
+        
+        if not idempotency_key:
+            return await create(db)
+        
+        payload = {
+            "audio": hashlib.sha256(audio_content).hexdigest(),
+            "style": style,
+            "steps": steps,
+            "user_id": user_id
+        }
+        new_drawing, replayed = await IdempotencyService(db).run(
+            "drawings.from_speech", idempotency_key, payload, create, "语音创建画作"
+        )
+        if replayed:
+            response.headers[IDEMPOTENCY_REPLAYED_HEADER] = "true"
+        return new_drawing
+    except HTTPException:
+        raise
+    except IdempotencyError as e:
+        raise idempotency_http_error(e)
+    except RequestAbandonedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/", response_model=List[DrawingResponse])
 async def get_drawings(
     user_id: Optional[str] = Query(None),
@@ -81,7 +238,7 @@ async def get_drawing(
     """
     try:
         drawing_service = DrawingService(db)
-        drawing = await drawing_service.get_drawing_by_id(drawing_id)
+        drawing = drawing_service.get_drawing_by_id(drawing_id)
         if not drawing:
             raise HTTPException(status_code=404, detail="画作不存在")
         return drawing
@@ -100,11 +257,61 @@ async def delete_drawing(
     """
     try:
         drawing_service = DrawingService(db)
-        success = await drawing_service.delete_drawing(drawing_id)
+        success = drawing_service.delete_drawing(drawing_id)
         if not success:
             raise HTTPException(status_code=404, detail="画作不存在")
         return {"message": "画作删除成功"}
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"删除画作失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"删除画作失败: {str(e)}")
+
+@router.get("/{drawing_id}/bundle", response_model=DrawingBundleResponse)
+async def get_drawing_bundle(
+    drawing_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    获取画作最终图像和步骤图打包成的精灵图及偏移表
+    首次请求时生成，之后直接返回缓存结果
+    """
+    try:
+        drawing_service = DrawingService(db)
+        bundle = await drawing_service.get_drawing_bundle(drawing_id)
+        if not bundle:
+            raise HTTPException(status_code=404, detail="画作不存在")
+        return bundle
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{drawing_id}/bundle/sprite")
+async def get_drawing_bundle_sprite(
+    drawing_id: int,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    直接返回画作的精灵图，偏移表放在X-Bundle-Layout响应头中，一次请求拿到全部图像
+    画作图像升级后精灵图会变化，用ETag协商缓存
+    """
+    try:
+        drawing_service = DrawingService(db)
+        bundle = await drawing_service.get_drawing_bundle(drawing_id)
+        if not bundle:
+            raise HTTPException(status_code=404, detail="画作不存在")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    bundle_service = BundleService(drawing_service.asset_store)
+    headers = {
+        "ETag": f'"{bundle_service.asset_store.name_from_url(bundle["sprite_url"]).split(".")[0]}"',
+        "Cache-Control": "no-cache",
+        BUNDLE_LAYOUT_HEADER: bundle_service.layout_header(bundle)
+    }
+    if headers["ETag"] in [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(bundle_service.sprite_path(bundle), media_type="image/webp", headers=headers)
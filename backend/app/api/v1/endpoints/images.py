@@ -1,78 +1,382 @@
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from app.api.dependencies.database import get_db
-from app.services.image_service import ImageService
-# from app.services.cache_service import CacheService
-# import hashlib
+from app.api.dependencies.deadline import request_deadline
+from app.api.dependencies.idempotency import IDEMPOTENCY_HEADER, IDEMPOTENCY_REPLAYED_HEADER, idempotency_http_error
+from app.api.dependencies.scheduling import scheduling_user
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.image_service import ImageService, get_resilience_status
+from app.services.cache_service import CacheService
+from app.services.dedup_service import ImageDedupService
+from app.services.hot_prompts import record_prompt
+from app.services.idempotency_service import IdempotencyError, IdempotencyService
+from app.services.asset_store import AssetStore
+from app.services.job_service import get_job_manager, JobQueueFullError
+from app.services.prefetch_service import get_prefetch_stats, record_prefetch_use, schedule_prefetch
+from app.services.upgrade_service import schedule_upgrade
+from app.utils.deadline import RequestAbandonedError, record_abandoned, remaining
 
 router = APIRouter()
 
 class ImageGenerationRequest(BaseModel):
     prompt: str
     style: str = "简笔画"
-    steps: int = 4  # 分步骤数量
+    steps: int = Field(4, ge=0, le=settings.IMAGE_MAX_STEPS)  # 分步骤数量
+    user_id: Optional[str] = None  # 用于公平调度，未提供时按客户端地址区分
+    quality: Literal["preview", "full"] = "full"  # preview：先返回低分辨率图，高清图后台生成后写入缓存
 
 class ImageGenerationResponse(BaseModel):
     final_image_url: str
     step_images: list[str]
     prompt: str
     from_cache: bool
+    quality: str = "full"
+    queue_wait_ms: float = 0.0  # 在上游调度器中的排队时间
 
-@router.post("/generate", response_model=ImageGenerationResponse)
+class ImagePrefetchRequest(BaseModel):
+    prompt: str  # 用户仍在输入、很可能就是最终内容的描述
+    style: str = "简笔画"
+    steps: int = Field(4, ge=0, le=settings.IMAGE_MAX_STEPS)
+    user_id: Optional[str] = None
+
+class ImagePrefetchResponse(BaseModel):
+    status: str  # scheduled / in_flight / cached / dropped / disabled
+    prompt: str
+
+class ImageCandidatesRequest(BaseModel):
+    prompt: str
+    style: str = "简笔画"
+    n: int = 4  # 候选图像数量
+    user_id: Optional[str] = None
+
+class ImageCandidatesResponse(BaseModel):
+    candidates: List[str]
+    prompt: str
+    queue_wait_ms: float = 0.0
+
+class ImageJobResponse(BaseModel):
+    job_id: str
+    status: str  # queued / running / succeeded / failed
+    prompt: str
+    style: str
+    steps: int
+    quality: str = "full"
+    final_image_url: Optional[str]
+    step_images: List[Optional[str]]  # 未完成的步骤为null
+    completed_images: int
+    from_cache: bool
+    queue_wait_ms: float
+    error: Optional[str]
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+
+async def _finish_generation(request: ImageGenerationRequest, result: dict, user_id: str, db: Session) -> dict:
+    """
+    转存生成结果到本地；全分辨率结果去重后写入缓存，预览结果在后台升级为全分辨率
+    """
+    result = await AssetStore().localize_result(result)
+    if result.get("quality") == "preview":
+        schedule_upgrade(request.prompt, request.style, request.steps, result, user_id)
+    else:
+        result = await ImageDedupService(db).deduplicate_result(result, request.prompt, request.style, request.steps)
+        await CacheService(db).set_image_generation_cache(
+            request.prompt, request.style, request.steps, result
+        )
+    return result
+
+async def _generate(request: ImageGenerationRequest, user_id: str, db: Session) -> dict:
+    """
+    查缓存或生成图像，返回响应内容
+    """
+    record_prefetch_use(request.prompt, request.style, request.steps)
+    
+    # 检查缓存
+    cache_service = CacheService(db)
+    cached_result = await cache_service.get_image_generation_cache(
+        request.prompt, request.style, request.steps
+    )
+    
+    if cached_result:
+        return ImageGenerationResponse(
+            final_image_url=cached_result["final_image_url"],
+            step_images=cached_result["step_images"],
+            prompt=request.prompt,
+            from_cache=True
+        ).model_dump()
+    
+    # 调用图像生成服务
+    image_service = ImageService()
+    result = await image_service.generate_step_by_step_drawing(
+        prompt=request.prompt,
+        style=request.style,
+        steps=request.steps,
+        user_id=user_id,
+        quality=request.quality
+    )
+    
+    # 转存到本地资源存储并缓存结果
+    result = await _finish_generation(request, result, user_id, db)
+    
+    return ImageGenerationResponse(
+        final_image_url=result["final_image_url"],
+        step_images=result["step_images"],
+        prompt=request.prompt,
+        from_cache=False,
+        quality=result.get("quality", "full"),
+        queue_wait_ms=result.get("queue_wait_ms", 0.0)
+    ).model_dump()
+
+@router.post("/generate", response_model=ImageGenerationResponse, dependencies=[Depends(request_deadline())])
 async def generate_image(
     request: ImageGenerationRequest,
+    http_request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
     db: Session = Depends(get_db)
 ):
     """
     文字生成简笔画图像接口
+    带Idempotency-Key请求头时，保留期内相同键的重试直接返回首次请求的结果
     """
     try:
-        # 生成缓存键
-        # prompt_hash = hashlib.md5(f"{request.prompt}:{request.style}:{request.steps}".encode()).hexdigest()
-        # cache_key = f"image:{prompt_hash}"
+        user_id = scheduling_user(request.user_id, http_request)
+        if not idempotency_key:
+            return await _generate(request, user_id, db)
         
-        # 检查缓存
-        # cache_service = CacheService(db)
-        # cached_result = await cache_service.get(cache_key)
+        result, replayed = await IdempotencyService(db).run(
+            "images.generate",
+            idempotency_key,
+            request.model_dump(),
+            lambda task_db: _generate(request, user_id, task_db),
+            "图像生成"
+        )
+        if replayed:
+            response.headers[IDEMPOTENCY_REPLAYED_HEADER] = "true"
+        return result
         
-        # if cached_result:
-        #     # cached_result已经是解析后的字典
-        #     return ImageGenerationResponse(
-        #         final_image_url=cached_result["final_image_url"],
-        #         step_images=cached_result["step_images"],
-        #         prompt=request.prompt,
-        #         from_cache=True
-        #     )
+    except IdempotencyError as e:
+        raise idempotency_http_error(e)
+    except RequestAbandonedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"图像生成失败: {str(e)}")
+
+def _sse_event(event: str, data: dict) -> str:
+    """
+    格式化一条SSE事件
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/generate/stream", dependencies=[Depends(request_deadline())])
+async def generate_image_stream(
+    request: ImageGenerationRequest,
+    http_request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    文字生成简笔画图像接口（SSE流式版本）
+    每张图像完成后立即推送：step事件为分步骤图像，final事件为最终图像；
+    全部完成后推送done事件（图像已转存本地），出错时推送error事件，
+    等待期间定期推送heartbeat事件；超过请求截止时间时推送error事件并停止生成
+    """
+    record_prefetch_use(request.prompt, request.style, request.steps)
+    cache_service = CacheService(db)
+    cached_result = await cache_service.get_image_generation_cache(
+        request.prompt, request.style, request.steps
+    )
+    
+    async def cached_events():
+        for index, url in enumerate(cached_result["step_images"]):
+            yield _sse_event("step", {"index": index, "total": request.steps, "url": url})
+        yield _sse_event("final", {"url": cached_result["final_image_url"]})
+        yield _sse_event("done", {
+            "final_image_url": cached_result["final_image_url"],
+            "step_images": cached_result["step_images"],
+            "prompt": request.prompt,
+            "from_cache": True,
+            "quality": "full",
+            "queue_wait_ms": 0.0
+        })
+    
+    async def generation_events():
+        queue: asyncio.Queue = asyncio.Queue()
+        generation = asyncio.ensure_future(image_service.generate_step_by_step_drawing(
+            prompt=request.prompt,
+            style=request.style,
+            steps=request.steps,
+            on_image=lambda index, url: queue.put_nowait((index, url)),
+            user_id=user_id,
+            quality=request.quality
+        ))
+        generation.add_done_callback(lambda _: queue.put_nowait(None))
         
-        # 调用图像生成服务
+        try:
+            while True:
+                left = remaining()
+                if left is not None and left <= 0:
+                    record_abandoned("deadline", "图像生成")
+                    yield _sse_event("error", {"detail": "请求超过截止时间，已停止图像生成"})
+                    return
+                timeout = settings.SSE_HEARTBEAT_SECONDS if left is None else min(settings.SSE_HEARTBEAT_SECONDS, left)
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    if remaining() is None or remaining() > 0:
+                        yield _sse_event("heartbeat", {})
+                    continue
+                
+                if item is None:
+                    break
+                index, url = item
+                if index == 0:
+                    yield _sse_event("final", {"url": url})
+                else:
+                    yield _sse_event("step", {"index": index - 1, "total": request.steps, "url": url})
+            
+            result = generation.result()
+            
+            # 转存到本地资源存储并缓存结果
+            stream_db = SessionLocal()
+            try:
+                result = await _finish_generation(request, result, user_id, stream_db)
+            finally:
+                stream_db.close()
+            
+            yield _sse_event("done", {
+                "final_image_url": result["final_image_url"],
+                "step_images": result["step_images"],
+                "prompt": request.prompt,
+                "from_cache": False,
+                "quality": result.get("quality", "full"),
+                "queue_wait_ms": result.get("queue_wait_ms", 0.0)
+            })
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"图像生成失败: {str(e)}"})
+        finally:
+            # 客户端断开时停止等待；相同请求的其他等待者不受影响
+            if not generation.done():
+                generation.cancel()
+    
+    if cached_result:
+        return _sse_response(cached_events())
+    
+    user_id = scheduling_user(request.user_id, http_request)
+    
+    try:
         image_service = ImageService()
-        result = await image_service.generate_step_by_step_drawing(
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"图像生成失败: {str(e)}")
+    
+    return _sse_response(generation_events())
+
+def _sse_response(events) -> StreamingResponse:
+    """
+    包装SSE响应，禁止代理缓冲
+    """
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@router.post("/prefetch", response_model=ImagePrefetchResponse, status_code=202)
+async def prefetch_image(
+    request: ImagePrefetchRequest,
+    http_request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    用户输入过程中预先生成图像，立即返回
+    预取的调度优先级低于真实请求，上游繁忙时直接丢弃；结果写入图像生成缓存，正式请求到达时直接命中
+    """
+    if not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="描述不能为空")
+    if not settings.PREFETCH_ENABLED:
+        return ImagePrefetchResponse(status="disabled", prompt=request.prompt)
+    
+    try:
+        status = await schedule_prefetch(
+            db,
+            request.prompt,
+            request.style,
+            request.steps,
+            scheduling_user(request.user_id, http_request)
+        )
+        return ImagePrefetchResponse(status=status, prompt=request.prompt)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"预取失败: {str(e)}")
+
+@router.post("/candidates", response_model=ImageCandidatesResponse, dependencies=[Depends(request_deadline())])
+async def generate_candidates(request: ImageCandidatesRequest, http_request: Request):
+    """
+    为同一描述生成多张候选图像，供用户挑选
+    """
+    if request.n < 1 or request.n > settings.IMAGE_MAX_CANDIDATES:
+        raise HTTPException(status_code=400, detail=f"候选数量需在1到{settings.IMAGE_MAX_CANDIDATES}之间")
+    
+    record_prompt(request.prompt)
+    try:
+        result = await ImageService().generate_candidates(
             prompt=request.prompt,
             style=request.style,
-            steps=request.steps
+            n=request.n,
+            user_id=scheduling_user(request.user_id, http_request)
         )
+        candidates = result["candidates"]
+        if settings.ASSET_STORE_ENABLED:
+            candidates = await AssetStore().localize_urls(candidates)
         
-        # 缓存结果
-        # cache_data = {
-        #     "final_image_url": result["final_image_url"],
-        #     "step_images": result["step_images"]
-        # }
-        # await cache_service.set(cache_key, cache_data)
-        
-        return ImageGenerationResponse(
-            final_image_url=result["final_image_url"],
-            step_images=result["step_images"],
+        return ImageCandidatesResponse(
+            candidates=candidates,
             prompt=request.prompt,
-            from_cache=False
+            queue_wait_ms=result["queue_wait_ms"]
         )
-        
+    except RequestAbandonedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"图像生成失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"候选图像生成失败: {str(e)}")
+
+@router.post("/jobs", response_model=ImageJobResponse, status_code=202)
+async def create_image_job(request: ImageGenerationRequest, http_request: Request):
+    """
+    提交异步图像生成任务，立即返回任务ID
+    """
+    try:
+        ImageService()
+        job = get_job_manager().submit(
+            request.prompt, request.style, request.steps,
+            user_id=scheduling_user(request.user_id, http_request),
+            quality=request.quality
+        )
+        return job.to_dict()
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"提交生成任务失败: {str(e)}")
+
+@router.get("/jobs/{job_id}", response_model=ImageJobResponse)
+async def get_image_job(job_id: str):
+    """
+    查询异步图像生成任务状态和已完成的部分结果
+    """
+    job = get_job_manager().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job.to_dict()
 
 @router.get("/test")
 async def test_image_generation():
     """
     测试图像生成服务
     """
-    return {"message": "图像生成服务正常"}
\ No newline at end of file
+    return {"message": "图像生成服务正常", **get_resilience_status(), "prefetch": get_prefetch_stats()}
\ No newline at end of file
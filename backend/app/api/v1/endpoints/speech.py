@@ -1,7 +1,11 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from sqlalchemy.orm import Session
+from app.api.dependencies.audio import read_audio_upload
 from app.api.dependencies.database import get_db
+from app.api.dependencies.deadline import request_deadline
+from app.core.config import settings
 from app.services.speech_service import SpeechService
+from app.utils.deadline import RequestAbandonedError
 # from app.services.cache_service import CacheService
 # import hashlib
 import logging
@@ -10,7 +14,7 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.post("/recognize")
+@router.post("/recognize", dependencies=[Depends(request_deadline(settings.SPEECH_REQUEST_DEADLINE_SECONDS))])
 async def recognize_speech(
     audio: UploadFile = File(...),
     db: Session = Depends(get_db)
@@ -19,22 +23,10 @@ async def recognize_speech(
     语音识别接口
     """
     try:
-        # 验证文件类型 - 检查content_type或文件扩展名
-        valid_content_types = ['audio/', 'application/octet-stream']
-        valid_extensions = ['.wav', '.mp3', '.m4a', '.ogg', '.flac']
-        
-        is_valid_content_type = any(audio.content_type.startswith(ct) for ct in valid_content_types)
-        is_valid_extension = any(audio.filename.lower().endswith(ext) for ext in valid_extensions) if audio.filename else False
-        
-        if not (is_valid_content_type or is_valid_extension):
-            logger.warning(f"无效的文件类型: content_type={audio.content_type}, filename={audio.filename}")
-            raise HTTPException(status_code=400, detail="只支持音频文件")
-        
+        # 验证文件类型和大小并读取音频内容
+        audio_content = await read_audio_upload(audio)
         logger.info(f"接收到音频文件: content_type={audio.content_type}, filename={audio.filename}")
         
-        # 读取音频内容
-        audio_content = await audio.read()
-        
         # 生成音频文件的哈希值用于缓存
         # audio_hash = hashlib.md5(audio_content).hexdigest()
         # cache_key = f"speech:{audio_hash}"
@@ -55,6 +47,11 @@ async def recognize_speech(
         
         return {"text": recognized_text, "from_cache": False}
         
+    except HTTPException:
+        raise
+    except RequestAbandonedError as e:
+        logger.warning(f"语音识别已放弃: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         logger.error(f"语音识别失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"语音识别失败: {str(e)}")
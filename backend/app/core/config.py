@@ -40,6 +40,69 @@ class Settings(BaseSettings):
     
     # 通义万相图像生成
     DASHSCOPE_API_KEY: Optional[str] = None
+    DASHSCOPE_BASE_URL: str = "https://dashscope.aliyuncs.com/api/v1"
+    DASHSCOPE_POOL_SIZE: int = 32  # 上游连接池大小，同时也是调用线程池大小
+    DASHSCOPE_CONNECT_TIMEOUT: float = 5.0  # 连接超时（秒）
+    DASHSCOPE_READ_TIMEOUT: float = 30.0  # 读取超时（秒）
+    DASHSCOPE_SPEECH_TIMEOUT: float = 60.0  # 单次语音识别超时（秒）
+    
+    # 图像生成服务提供商
+    IMAGE_PROVIDER: str = "auto"  # auto / tongyi / local，auto使用通义万相，未配置密钥时报错；local只能显式指定
+    LOCAL_PROVIDER_LATENCY_SECONDS: float = 0.0  # 本地绘制的模拟延迟（秒）
+    LOCAL_PROVIDER_LATENCY_JITTER: float = 0.0  # 模拟延迟的随机抖动范围（秒）
+    LOCAL_PROVIDER_ERROR_RATE: float = 0.0  # 本地绘制的模拟错误率（0~1）
+    LOCAL_PROVIDER_IMAGE_SIZE: int = 1024  # 本地绘制的最大图像边长（像素）
+    IMAGE_BATCH_WINDOW_MS: float = 0.0  # 微批处理窗口（毫秒），相同提示词的并发请求合并成一个多图任务，0为关闭
+    IMAGE_BATCH_MAX_SIZE: int = 4  # 一个微批次最多合并的请求数
+    IMAGE_MAX_CANDIDATES: int = 8  # 候选图像接口单次最多生成的图像数量
+    IMAGE_MAX_STEPS: int = 10  # 单次请求最多的分步骤数量
+    IMAGE_SIZE_FULL: str = "1024*1024"  # 全分辨率图像尺寸
+    IMAGE_SIZE_PREVIEW: str = "512*512"  # 预览图和步骤图尺寸，生成更快
+    IMAGE_UPGRADE_WEIGHT: float = 0.25  # 后台升级全分辨率时的调度权重，低于用户正在等待的请求
+    PREFETCH_ENABLED: bool = True  # 是否接受输入过程中的预取请求
+    PREFETCH_WEIGHT: float = 0.1  # 预取的调度权重，低于用户正在等待的请求和后台升级
+    PREFETCH_MAX_LOAD: float = 0.5  # 上游并发占用超过该比例或有调用排队时丢弃预取
+    PREFETCH_MAX_PENDING: int = 8  # 同时进行的预取上限
+    PREFETCH_HIT_WINDOW_SECONDS: int = 600  # 预取结果在该时间内未被请求使用计为浪费
+    STEP_IMAGE_MAX_SIDE: int = 512  # 本地拆分的步骤图最长边（像素）
+    STEP_MODE: str = "local"  # local：只生成最终图像，本地按笔画拆出步骤图；provider：每个步骤单独生成
+    STEP_LOCAL_STYLES: List[str] = ["简笔画"]  # 本地拆分只适用于这些线条画风格，其他风格的色块无法按笔画拆出，仍逐步骤生成
+    
+    # 图像生成并发设置
+    IMAGE_REQUEST_CONCURRENCY: int = 5  # 单个请求内同时生成的图像数量
+    IMAGE_GLOBAL_CONCURRENCY: int = 20  # 整个进程同时生成的图像数量
+    UPSTREAM_RATE_LIMIT_QPS: float = 2.0  # 每秒提交的上游生成任务数，与服务商QPS配额一致
+    UPSTREAM_RATE_BURST: int = 5  # 令牌桶容量，允许的瞬时突发任务数
+    USER_MAX_CONCURRENCY: int = 5  # 单个用户同时进行的上游调用数量
+    IMAGE_MAX_RETRIES: int = 1  # 单张图像生成失败后的重试次数
+    IMAGE_GENERATION_TIMEOUT: float = 60.0  # 单张图像最长等待时间（秒）
+    SSE_HEARTBEAT_SECONDS: float = 15.0  # 流式生成接口的心跳间隔（秒）
+    
+    # 服务商熔断与对冲请求
+    CIRCUIT_BREAKER_ENABLED: bool = True  # 是否启用熔断器
+    CIRCUIT_WINDOW_SECONDS: float = 60.0  # 统计失败率的时间窗口（秒）
+    CIRCUIT_MIN_CALLS: int = 10  # 窗口内至少有这么多调用才判断是否熔断
+    CIRCUIT_FAILURE_RATIO: float = 0.5  # 失败率达到该比例时熔断（慢调用计为失败）
+    CIRCUIT_SLOW_CALL_SECONDS: float = 30.0  # 超过该耗时的调用视为慢调用
+    CIRCUIT_OPEN_SECONDS: float = 30.0  # 熔断后多久进入半开探测（秒）
+    CIRCUIT_HALF_OPEN_PROBES: int = 2  # 半开状态放行的探测调用数，全部成功后恢复
+    IMAGE_HEDGING_ENABLED: bool = False  # 是否启用对冲请求
+    IMAGE_HEDGE_QUANTILE: float = 0.95  # 超过历史耗时的该分位数仍未完成时发起对冲
+    IMAGE_HEDGE_MIN_SAMPLES: int = 20  # 至少积累这么多耗时样本才开始对冲
+    IMAGE_HEDGE_MAX_RATIO: float = 0.1  # 对冲调用占全部调用的比例上限
+    
+    # 异步生成任务设置
+    JOB_WORKERS: int = 4  # 后台worker数量
+    JOB_QUEUE_MAX_SIZE: int = 100  # 排队任务上限，超出时拒绝提交
+    JOB_RESULT_TTL_SECONDS: int = 3600  # 已结束任务的保留时间
+    JOB_MAX_RETAINED: int = 1000  # 最多保留的任务数
+    
+    # 任务轮询设置
+    TASK_POLL_INITIAL_ESTIMATE: float = 5.0  # 任务耗时的初始估计（秒），之后按实际耗时自适应
+    TASK_POLL_FIRST_POLL_RATIO: float = 0.8  # 首次查询时间占估计耗时的比例
+    TASK_POLL_MIN_INTERVAL: float = 0.3  # 最小查询间隔（秒）
+    TASK_POLL_MAX_INTERVAL: float = 3.0  # 最大查询间隔（秒）
+    TASK_POLL_BACKOFF: float = 1.5  # 查询间隔退避倍数
     
     # 讯飞语音识别
     XFYUN_APP_ID: Optional[str] = None
@@ -49,10 +112,45 @@ class Settings(BaseSettings):
     # 文件存储设置
     UPLOAD_DIR: str = "./uploads"
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
+    MAX_AUDIO_SIZE: int = 10 * 1024 * 1024  # 上传音频的大小上限
+    ASSET_STORE_ENABLED: bool = True  # 是否把生成的图像转存到本地
+    PUBLIC_BASE_URL: str = "http://localhost:8000"  # 本地资源URL的前缀，需要能被前端访问
+    ASSET_TRUSTED_HOSTS: List[str] = ["dashscope-result-*.aliyuncs.com"]  # 允许下载转存的图像主机（支持通配符），其他地址一律拒绝
+    IMAGE_WORKER_PROCESSES: int = 2  # 图像处理进程数
+    DERIVATIVE_WEBP_QUALITY: int = 80  # 派生图WebP质量
+    SVG_VECTORIZE_ENABLED: bool = True  # 是否把生成的线条画描成SVG
+    SVG_VECTORIZE_STYLES: List[str] = ["简笔画"]  # 只有这些线条画风格描SVG，彩色风格描出来没有意义
+    SVG_MAX_SIDE: int = 512  # 描图前把图像缩小到的最长边像素
+    SVG_SIMPLIFY_TOLERANCE: float = 0.75  # 路径简化容差（像素），越大文件越小
+    SVG_MIN_AREA: float = 2.0  # 小于该面积（像素）的轮廓视为噪点丢弃
+    BUNDLE_CELL_SIZE: int = 512  # 打包精灵图中每张图像的最长边像素
+    IMAGE_DEDUP_ENABLED: bool = True  # 是否按感知哈希合并近似重复的生成结果
+    IMAGE_DEDUP_HASH_SIZE: int = 16  # 差值哈希的边长，哈希位数为其平方
+    IMAGE_DEDUP_MAX_DISTANCE: int = 10  # 视为近似重复的最大汉明距离
+    IMAGE_DEDUP_INDEX_MAX_ENTRIES: int = 100000  # 内存中感知哈希索引的最大条目数，超出时淘汰最久未命中的
+    IMAGE_DEDUP_DELETE_DUPLICATES: bool = True  # 是否删除被合并的重复图像文件
+    IMAGE_DEDUP_DELETE_GRACE_SECONDS: int = 86400  # 重复图像合并后保留的时间，客户端可能已经收到其地址
+    
+    # 请求截止时间设置
+    REQUEST_DEADLINE_SECONDS: float = 180.0  # 未指定X-Request-Timeout时的默认截止时间（秒）
+    REQUEST_DEADLINE_MAX_SECONDS: float = 600.0  # 客户端可指定的最长截止时间
+    SPEECH_REQUEST_DEADLINE_SECONDS: float = 60.0  # 语音识别接口的默认截止时间
+    DISCONNECT_POLL_SECONDS: float = 1.0  # 检查客户端是否断开的间隔
+    
+    # 幂等键设置
+    IDEMPOTENCY_TTL_SECONDS: int = 24 * 3600  # 幂等键及首次响应的保留时间
+    IDEMPOTENCY_PROCESSING_TIMEOUT: int = 900  # 处理中的记录超过该时间视为已中断，允许重新执行
     
     # 缓存设置
     CACHE_TTL: int = 3600  # 1小时
     CACHE_TTL_SECONDS: int = 3600  # 1小时，用于缓存服务
+    IMAGE_CACHE_TTL_SECONDS: int = 24 * 3600  # 图像生成结果缓存时间，不超过图像URL的有效期
+    CACHE_URL_EXPIRY_MARGIN: int = 600  # 图像URL过期前预留的安全时间（秒）
+    CACHE_HOT_MAX_ENTRIES: int = 2048  # 进程内热点缓存最大条目数
+    HOT_PROMPTS_ENABLED: bool = True  # 是否统计热门提示词
+    HOT_PROMPTS_CAPACITY: int = 100  # 每个时间桶保留的提示词计数器数量
+    PROMPT_SIMILARITY_THRESHOLD: float = 0.75  # 近似提示词复用缓存的相似度阈值，设为1关闭
+    PROMPT_INDEX_MAX_ENTRIES: int = 10000  # 近似提示词索引最大条目数
     
     # 日志设置
     LOG_LEVEL: str = "INFO"
@@ -3,6 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.api import api_router
 from app.core.config import settings
 from app.core.logging import setup_logging, get_logger
+from app.services.bundle_service import BUNDLE_LAYOUT_HEADER
+from app.services.dashscope_client import close_dashscope_client
+from app.services.derivative_service import shutdown_image_process_pool
 import logging
 
 # 初始化日志系统
@@ -25,11 +28,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[BUNDLE_LAYOUT_HEADER],
 )
 
 # 包含API路由
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.on_event("shutdown")
+async def shutdown():
+    # 释放上游连接池
+    close_dashscope_client()
+    shutdown_image_process_pool()
+    logger.info("BabyDraw API 应用关闭")
+
 @app.get("/")
 async def root():
     logger.info("根路径访问")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import Boolean, Column, Integer, Float, String, Text, DateTime, JSON, UniqueConstraint
 from sqlalchemy.sql import func
 from datetime import datetime
 from app.core.database import Base
@@ -11,7 +11,12 @@ class Drawing(Base):
     description = Column(Text)
     prompt = Column(Text, nullable=False)
     image_url = Column(String(255))
+    preview_image_url = Column(String(255))  # 低分辨率预览图
+    quality = Column(String(20), default="full")  # preview：高清图后台生成中 / full
+    seed = Column(Integer)  # 预览图的随机种子，升级高清图时使用同一种子
     steps_images = Column(JSON)  # 存储分步骤图片URL列表
+    style = Column(String(50))  # 绘画风格，如简笔画
+    steps = Column(Integer)  # 分步骤数量
     user_id = Column(String(50))  # 简化用户标识
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -23,4 +28,60 @@ class Cache(Base):
     cache_key = Column(String(255), unique=True, index=True)
     content = Column(Text)
     expires_at = Column(DateTime(timezone=True))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ImageFingerprint(Base):
+    __tablename__ = "image_fingerprints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    asset_name = Column(String(80), index=True)  # 最终图像的本地资源名
+    dhash = Column(String(64), nullable=False)  # 感知哈希（十六进制）
+    prompt = Column(Text)  # 规范化提示词，只合并同一提示词的结果
+    style = Column(String(50))
+    steps = Column(Integer)
+    result = Column(Text)  # 生成结果JSON：最终图像和步骤图URL
+    hits = Column(Integer, default=0)  # 被近似重复图像复用的次数
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class DuplicateAsset(Base):
+    __tablename__ = "duplicate_assets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    asset_name = Column(String(80), unique=True, index=True)  # 被合并的重复图像资源名
+    canonical_url = Column(String(255), nullable=False)  # 替代它的已有图像URL
+    delete_after = Column(DateTime(timezone=True), index=True)  # 宽限期结束后删除文件
+    deleted_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("scope", "idempotency_key"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String(50), nullable=False)  # 接口，如images.generate
+    idempotency_key = Column(String(255), nullable=False, index=True)
+    request_hash = Column(String(64), nullable=False)  # 请求体哈希，同一键不同请求体时拒绝
+    status = Column(String(20), nullable=False)  # processing / completed
+    status_code = Column(Integer)
+    response = Column(Text)  # 首次请求的响应JSON，重试时直接返回
+    expires_at = Column(DateTime(timezone=True), index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class GenerationJobRecord(Base):
+    __tablename__ = "generation_jobs"
+    
+    id = Column(String(32), primary_key=True)  # 任务ID
+    status = Column(String(20), nullable=False)  # queued / running / succeeded / failed
+    prompt = Column(Text, nullable=False)
+    style = Column(String(50))
+    steps = Column(Integer)
+    quality = Column(String(20))
+    user_id = Column(String(100))  # 调度标识
+    final_image_url = Column(String(255))
+    step_images = Column(JSON)  # 步骤图URL列表，未完成的为null
+    from_cache = Column(Boolean, default=False)
+    queue_wait_ms = Column(Float, default=0.0)
+    error = Column(Text)
+    created_at = Column(Float)  # Unix时间戳，与任务接口返回的时间一致
+    started_at = Column(Float)
+    finished_at = Column(Float, index=True)
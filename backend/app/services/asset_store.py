@@ -0,0 +1,177 @@
+import asyncio
+import fnmatch
+import hashlib
+import io
+import os
+import re
+import tempfile
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+from app.core.config import settings
+from app.services.dashscope_client import get_dashscope_client
+
+# 资源文件名：sha256十六进制 + 扩展名
+ASSET_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.(png|jpg|webp|gif|svg)$")
+
+_CONTENT_TYPE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+    "image/svg+xml": "svg",
+}
+
+ASSET_MEDIA_TYPES = {ext: content_type for content_type, ext in _CONTENT_TYPE_EXTENSIONS.items()}
+ASSET_MEDIA_TYPES["jpg"] = "image/jpeg"
+
+class UntrustedAssetUrlError(ValueError):
+    """
+    图像地址既不是本地资源也不在可信主机上
+    """
+
+def _verify_image(data: bytes):
+    """
+    确认下载的内容能按图像解码，否则抛出ValueError（阻塞）
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except Exception:
+        raise ValueError("下载的文件不是有效的图像")
+
+def _guess_extension(data: bytes, content_type: str) -> str:
+    """
+    根据文件头和Content-Type推断扩展名
+    """
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return _CONTENT_TYPE_EXTENSIONS.get(content_type.split(";")[0].strip().lower(), "png")
+
+class AssetStore:
+    """
+    本地内容寻址资源存储
+    文件以内容的sha256命名，按哈希前缀分两级目录存放，同样的内容只存一份
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.path.join(settings.UPLOAD_DIR, "assets")
+        self.url_prefix = f"{settings.PUBLIC_BASE_URL.rstrip('/')}{settings.API_V1_STR}/assets/"
+
+    def path_for(self, name: str) -> str:
+        """
+        获取资源文件路径，文件名不合法时抛出ValueError
+        """
+        if not ASSET_NAME_PATTERN.match(name):
+            raise ValueError(f"非法的资源名: {name}")
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+    def url_for(self, name: str) -> str:
+        """
+        获取资源的访问URL
+        """
+        return f"{self.url_prefix}{name}"
+
+    def name_from_url(self, url: str) -> Optional[str]:
+        """
+        从本地资源URL中取出资源名，不是本地资源时返回None
+        """
+        if url and url.startswith(self.url_prefix):
+            name = url[len(self.url_prefix):]
+            if ASSET_NAME_PATTERN.match(name):
+                return name
+        return None
+
+    def is_trusted_url(self, url: str) -> bool:
+        """
+        是否为本地资源或可信图像主机（ASSET_TRUSTED_HOSTS）上的https地址
+        """
+        if self.name_from_url(url):
+            return True
+        try:
+            parsed = urlparse(url)
+            port = parsed.port
+        except ValueError:
+            return False
+        if parsed.scheme != "https" or not parsed.hostname or port not in (None, 443) or parsed.username:
+            return False
+        host = parsed.hostname.lower()
+        return any(fnmatch.fnmatch(host, pattern.lower()) for pattern in settings.ASSET_TRUSTED_HOSTS)
+
+    def check_urls(self, urls: List[str]):
+        """
+        确认一组图像地址都可信，否则抛出UntrustedAssetUrlError
+        """
+        for url in urls:
+            if not self.is_trusted_url(url):
+                raise UntrustedAssetUrlError(f"不支持的图像地址: {url}")
+
+    def put_bytes(self, data: bytes, extension: str) -> str:
+        """
+        保存文件内容，返回资源名（阻塞）
+        """
+        name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = self.path_for(name)
+        if os.path.exists(path):
+            return name
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再原子替换，并发写同一内容也不会读到半个文件
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
+
+    async def store_url(self, url: str) -> str:
+        """
+        下载远程图像并保存到本地，返回本地URL
+        已经是本地资源时直接返回；只下载可信主机上的地址，内容必须能按图像解码
+        """
+        if self.name_from_url(url):
+            return url
+        self.check_urls([url])
+
+        data, content_type = await get_dashscope_client().download(url)
+        await asyncio.to_thread(_verify_image, data)
+        name = await asyncio.to_thread(self.put_bytes, data, _guess_extension(data, content_type))
+        return self.url_for(name)
+
+    async def localize_urls(self, urls: List[str]) -> List[str]:
+        """
+        并发把一组远程URL转存到本地
+        单张下载失败时保留原URL，不影响其他图像
+        """
+        async def localize(url: str) -> str:
+            try:
+                return await self.store_url(url)
+            except Exception as e:
+                print(f"图像转存失败，保留原地址 {url}: {e}")
+                return url
+
+        return list(await asyncio.gather(*(localize(url) for url in urls)))
+
+    async def localize_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        转存图像生成结果中的所有图像
+        """
+        if not settings.ASSET_STORE_ENABLED:
+            return result
+
+        step_images = result.get("step_images", [])
+        urls = await self.localize_urls([result["final_image_url"], *step_images])
+        return {**result, "final_image_url": urls[0], "step_images": urls[1:]}
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import io
+import json
+import math
+import os
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.asset_store import AssetStore
+from app.services.derivative_service import get_image_process_pool
+from app.services.single_flight import SingleFlight
+from app.utils.async_utils import LoopLocal
+
+# 同一组图像的并发打包只执行一次
+_single_flight = LoopLocal(SingleFlight)
+
+# 直接返回精灵图时，偏移表（不含sprite_url）以JSON放在该响应头中，前端一次请求即可拿到图像和偏移
+BUNDLE_LAYOUT_HEADER = "X-Bundle-Layout"
+
+def _render_sprite(paths: List[str], cell_size: int, quality: int) -> Tuple[bytes, int, int, List[Tuple[int, int, int, int]]]:
+    """
+    在子进程中把多张图像拼成一张精灵图，返回(WebP数据, 宽, 高, 各图像的x/y/宽/高)
+    每张图像缩放到不超过cell_size的格子中，按行排列
+    """
+    from PIL import Image
+
+    columns = math.ceil(math.sqrt(len(paths)))
+    rows = math.ceil(len(paths) / columns)
+    width, height = min(columns, len(paths)) * cell_size, rows * cell_size
+    sheet = Image.new("RGB", (width, height), "white")
+
+    frames = []
+    for index, path in enumerate(paths):
+        with Image.open(path) as image:
+            image.load()
+            image = image.convert("RGBA")
+        image.thumbnail((cell_size, cell_size), Image.LANCZOS)
+        x, y = (index % columns) * cell_size, (index // columns) * cell_size
+        sheet.paste(image, (x, y), image)
+        frames.append((x, y, image.width, image.height))
+
+    buffer = io.BytesIO()
+    sheet.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue(), width, height, frames
+
+class BundleService:
+    """
+    画作图像打包服务
+    把最终图像和步骤图拼成一张精灵图并生成偏移表，前端一次请求即可拿到全部图像；
+    精灵图保存在本地资源存储中，偏移表按图像列表的哈希缓存在磁盘上，同样的图像只打包一次
+    """
+
+    def __init__(self, asset_store: Optional[AssetStore] = None):
+        self.asset_store = asset_store or AssetStore()
+        self.root = os.path.join(settings.UPLOAD_DIR, "bundles")
+
+    def bundle_key(self, urls: List[str]) -> str:
+        """
+        图像列表和格子大小决定打包结果
+        """
+        source = json.dumps([settings.BUNDLE_CELL_SIZE, urls])
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def manifest_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def sprite_path(self, manifest: Dict[str, Any]) -> str:
+        """
+        偏移表对应的精灵图文件路径
+        """
+        return self.asset_store.path_for(self.asset_store.name_from_url(manifest["sprite_url"]))
+
+    @staticmethod
+    def layout_header(manifest: Dict[str, Any]) -> str:
+        """
+        偏移表的响应头值，只含ASCII字符
+        """
+        layout = {key: value for key, value in manifest.items() if key != "sprite_url"}
+        return json.dumps(layout, separators=(",", ":"))
+
+    async def get_bundle(self, image_url: str, steps_images: List[str]) -> Dict[str, Any]:
+        """
+        获取画作的精灵图和偏移表，没有缓存时生成
+        """
+        urls = [image_url, *steps_images]
+        key = self.bundle_key(urls)
+        manifest = await asyncio.to_thread(self._read_manifest, key)
+        if manifest is not None:
+            return manifest
+
+        return await _single_flight.get().do(("bundle", key), lambda _: self._build(key, urls))
+
+    async def _build(self, key: str, urls: List[str]) -> Dict[str, Any]:
+        """
+        打包图像并保存偏移表
+        """
+        local_urls = await self.asset_store.localize_urls(urls)
+        names = [self.asset_store.name_from_url(url) for url in local_urls]
+        if not all(names):
+            raise Exception("部分图像无法转存到本地，不能打包")
+
+        loop = asyncio.get_running_loop()
+        data, width, height, frames = await loop.run_in_executor(
+            get_image_process_pool(),
+            _render_sprite,
+            [self.asset_store.path_for(name) for name in names],
+            settings.BUNDLE_CELL_SIZE,
+            settings.DERIVATIVE_WEBP_QUALITY
+        )
+        sprite_name = await asyncio.to_thread(self.asset_store.put_bytes, data, "webp")
+
+        manifest = {
+            "sprite_url": self.asset_store.url_for(sprite_name),
+            "width": width,
+            "height": height,
+            "frames": [
+                {
+                    "image": "final" if index == 0 else f"step_{index}",
+                    "source_url": url,
+                    "x": x,
+                    "y": y,
+                    "width": frame_width,
+                    "height": frame_height
+                }
+                for index, (url, (x, y, frame_width, frame_height)) in enumerate(zip(urls, frames))
+            ]
+        }
+        await asyncio.to_thread(self._write_manifest, key, manifest)
+        return manifest
+
+    def _read_manifest(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存的偏移表，精灵图已被清理时视为没有缓存
+        """
+        try:
+            with open(self.manifest_path(key), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        name = self.asset_store.name_from_url(manifest.get("sprite_url", ""))
+        if not name or not os.path.exists(self.asset_store.path_for(name)):
+            return None
+        return manifest
+
+    def _write_manifest(self, key: str, manifest: Dict[str, Any]):
+        path = self.manifest_path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
@@ -1,15 +1,86 @@
+import copy
 import json
 import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Tuple
+from urllib.parse import urlparse, parse_qs
 from sqlalchemy.orm import Session
 from app.models.drawing import Cache
 from app.core.config import settings
+from app.services.dedup_service import get_dedup_stats
+from app.services.hot_prompts import record_prompt
+from app.services.prompt_index import PromptIndex
+from app.utils.prompt_utils import canonicalize_prompt
+
+class HotCache:
+    """
+    进程内热点缓存
+    LRU淘汰，条目数有上限，过期时间与数据库缓存一致
+    """
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.time():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return copy.deepcopy(value)
+    
+    def set(self, key: str, value: Any, expires_at: float):
+        if self.max_entries <= 0:
+            return
+        self._items[key] = (expires_at, copy.deepcopy(value))
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+    
+    def delete(self, key: str):
+        self._items.pop(key, None)
+    
+    def __len__(self) -> int:
+        return len(self._items)
+
+# 进程内热点缓存，所有CacheService实例共享
+_hot_cache = HotCache(settings.CACHE_HOT_MAX_ENTRIES)
+
+# 缓存命中统计
+_cache_counters = {"hot_hits": 0, "db_hits": 0, "similar_hits": 0, "misses": 0}
+
+# 图像缓存的近似提示词索引
+_prompt_index = PromptIndex(max_entries=settings.PROMPT_INDEX_MAX_ENTRIES)
+_prompt_index_loaded = False
+
+def _url_expiry_ttl(urls: List[str]) -> Optional[int]:
+    """
+    根据签名URL中的Expires参数计算可缓存的剩余秒数
+    没有过期参数时返回None
+    """
+    now = time.time()
+    ttl = None
+    for url in urls:
+        expires = parse_qs(urlparse(url).query).get("Expires")
+        if not expires:
+            continue
+        try:
+            remaining = int(expires[0]) - now - settings.CACHE_URL_EXPIRY_MARGIN
+        except ValueError:
+            continue
+        ttl = remaining if ttl is None else min(ttl, remaining)
+    return None if ttl is None else int(ttl)
 
 class CacheService:
     """
     缓存服务
-    支持数据库缓存，可扩展支持Redis
+    进程内热点缓存 + 数据库缓存两级结构，可扩展支持Redis
     """
     
     def __init__(self, db: Session):
@@ -34,7 +105,20 @@ class CacheService:
     async def get(self, key: str) -> Optional[Any]:
         """
         获取缓存
+        先查进程内热点缓存，未命中再查数据库并回填
         """
+        value, tier = self._lookup(key)
+        self._count(tier)
+        return value
+    
+    def _lookup(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """
+        两级查找，返回 (值, 命中层级)
+        """
+        value = _hot_cache.get(key)
+        if value is not None:
+            return value, "hot"
+        
         try:
             cache_item = self.db.query(Cache).filter(
                 Cache.cache_key == key,
@@ -44,14 +128,29 @@ class CacheService:
             if cache_item:
                 # 尝试解析JSON，如果失败则返回原始字符串
                 try:
-                    return json.loads(cache_item.content)
+                    value = json.loads(cache_item.content)
                 except json.JSONDecodeError:
-                    return cache_item.content
+                    value = cache_item.content
+                
+                remaining = (cache_item.expires_at.replace(tzinfo=None) - datetime.utcnow()).total_seconds()
+                _hot_cache.set(key, value, time.time() + remaining)
+                return value, "db"
             
-            return None
+            return None, None
         except Exception as e:
             print(f"缓存获取失败: {str(e)}")
-            return None
+            return None, None
+    
+    def _count(self, tier: Optional[str]):
+        """
+        记录命中统计
+        """
+        if tier == "hot":
+            _cache_counters["hot_hits"] += 1
+        elif tier == "db":
+            _cache_counters["db_hits"] += 1
+        else:
+            _cache_counters["misses"] += 1
     
     async def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None) -> bool:
         """
@@ -88,6 +187,7 @@ class CacheService:
                 self.db.add(cache_item)
             
             self.db.commit()
+            _hot_cache.set(key, value, time.time() + ttl_seconds)
             return True
         except Exception as e:
             self.db.rollback()
@@ -98,6 +198,7 @@ class CacheService:
         """
         删除缓存
         """
+        _hot_cache.delete(key)
         try:
             cache_item = self.db.query(Cache).filter(Cache.cache_key == key).first()
             if cache_item:
@@ -141,11 +242,17 @@ class CacheService:
             ).count()
             active_count = total_count - expired_count
             
+            hits = _cache_counters["hot_hits"] + _cache_counters["db_hits"]
+            lookups = hits + _cache_counters["misses"]
+            
             return {
                 "total_count": total_count,
                 "active_count": active_count,
                 "expired_count": expired_count,
-                "hit_rate": 0.0  # 这里可以实现更复杂的命中率统计
+                "hot_count": len(_hot_cache),
+                **_cache_counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "image_dedup": get_dedup_stats()
             }
         except Exception as e:
             print(f"获取缓存统计失败: {str(e)}")
@@ -172,17 +279,77 @@ class CacheService:
         key = self._generate_cache_key("speech", audio_hash)
         return await self.set(key, result, settings.CACHE_TTL_SECONDS)
     
-    async def get_image_generation_cache(self, prompt: str, style: str, steps: int) -> Optional[Dict[str, Any]]:
+    def _image_cache_key(self, prompt: str, style: str, steps: int) -> str:
         """
-        获取图像生成缓存
+        生成图像缓存键，提示词已规范化
         """
         cache_data = {
             "prompt": prompt,
             "style": style,
             "steps": steps
         }
-        key = self._generate_cache_key("image", cache_data)
-        return await self.get(key)
+        return self._generate_cache_key("image", cache_data)
+    
+    def _ensure_prompt_index(self):
+        """
+        首次使用时从数据库中未过期的图像缓存重建提示词索引
+        """
+        global _prompt_index_loaded
+        if _prompt_index_loaded:
+            return
+        _prompt_index_loaded = True
+        
+        try:
+            rows = self.db.query(Cache.content).filter(
+                Cache.cache_key.like("image:%"),
+                Cache.expires_at > datetime.utcnow()
+            ).order_by(Cache.created_at.desc()).limit(_prompt_index.max_entries).all()
+            
+            # 按时间从旧到新加入，保证最新的条目最后被淘汰
+            for (content,) in reversed(rows):
+                try:
+                    meta = json.loads(content).get("cache_meta")
+                except (json.JSONDecodeError, AttributeError):
+                    continue
+                if meta:
+                    _prompt_index.add((meta["style"], meta["steps"]), meta["prompt"])
+        except Exception as e:
+            print(f"加载提示词索引失败: {str(e)}")
+    
+    async def get_image_generation_cache(
+        self,
+        prompt: str,
+        style: str,
+        steps: int,
+        record_stats: bool = True
+    ) -> Optional[Dict[str, Any]]:
+        """
+        获取图像生成缓存
+        先按规范化提示词精确匹配，未命中时查找相似度超过阈值的已缓存提示词
+        record_stats为False时不计入命中统计，用于预取等内部查询
+        """
+        canonical = canonicalize_prompt(prompt)
+        value, tier = self._lookup(self._image_cache_key(canonical, style, steps))
+        
+        if value is None and settings.PROMPT_SIMILARITY_THRESHOLD < 1:
+            self._ensure_prompt_index()
+            match = _prompt_index.find_similar(
+                (style, steps), canonical, settings.PROMPT_SIMILARITY_THRESHOLD
+            )
+            if match is not None:
+                value, tier = self._lookup(self._image_cache_key(match[0], style, steps))
+                if value is None:
+                    # 对应缓存已过期
+                    _prompt_index.discard((style, steps), match[0])
+                elif record_stats:
+                    _cache_counters["similar_hits"] += 1
+        
+        if record_stats:
+            self._count(tier)
+            record_prompt(prompt, lookup=True, hit=value is not None)
+        if isinstance(value, dict):
+            value.pop("cache_meta", None)
+        return value
     
     async def set_image_generation_cache(
         self, 
@@ -194,11 +361,21 @@ class CacheService:
         """
         设置图像生成缓存
         """
-        cache_data = {
-            "prompt": prompt,
-            "style": style,
-            "steps": steps
-        }
-        key = self._generate_cache_key("image", cache_data)
-        # 图像生成结果缓存时间更长
-        return await self.set(key, result, settings.CACHE_TTL_SECONDS * 24)  # 24倍时间
\ No newline at end of file
+        canonical = canonicalize_prompt(prompt)
+        key = self._image_cache_key(canonical, style, steps)
+        
+        # 图像URL是带过期时间的签名地址，缓存不能比URL活得更久
+        ttl_seconds = settings.IMAGE_CACHE_TTL_SECONDS
+        url_ttl = _url_expiry_ttl([result["final_image_url"], *result.get("step_images", [])])
+        if url_ttl is not None:
+            ttl_seconds = min(ttl_seconds, url_ttl)
+        if ttl_seconds <= 0:
+            return False
+        
+        # 记录规范化参数，用于重启后重建提示词索引
+        value = {**result, "cache_meta": {"prompt": canonical, "style": style, "steps": steps}}
+        value.pop("queue_wait_ms", None)
+        stored = await self.set(key, value, ttl_seconds)
+        if stored:
+            _prompt_index.add((style, steps), canonical)
+        return stored
@@ -0,0 +1,167 @@
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Tuple
+from app.core.config import settings
+
+class CircuitOpenError(Exception):
+    """
+    熔断器打开，拒绝调用
+    """
+
+class CircuitBreaker:
+    """
+    服务商熔断器
+    - closed：正常调用，统计时间窗口内的失败率（超时和慢调用都算失败）
+    - open：失败率超过阈值后直接拒绝调用，一段时间后进入half_open
+    - half_open：只放行少量探测调用，全部成功则恢复closed，任一失败重新open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60.0,
+        min_calls: int = 10,
+        failure_ratio: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 2,
+        enabled: bool = True
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.enabled = enabled
+
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        # (完成时间, 是否失败)
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.rejected = 0
+        self.trips = 0
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """
+        包裹一次服务商调用：熔断时抛出CircuitOpenError，否则记录调用结果
+        调用被取消时不计入统计
+        """
+        probe = self._before_call()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self._record(probe, failed=True)
+            raise
+        except BaseException:
+            if probe:
+                self._probes_in_flight -= 1
+            raise
+        else:
+            self._record(probe, failed=time.monotonic() - started > self.slow_call_seconds)
+
+    def _before_call(self) -> bool:
+        """
+        检查是否允许调用，返回本次调用是否为半开探测
+        """
+        if not self.enabled:
+            return False
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                raise CircuitOpenError("图像生成服务暂时不可用，请稍后再试")
+            self.state = self.HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._probes_in_flight + self._probe_successes >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError("图像生成服务恢复中，请稍后再试")
+            self._probes_in_flight += 1
+            return True
+
+        return False
+
+    def _record(self, probe: bool, failed: bool):
+        """
+        记录一次调用结果并更新状态
+        """
+        if not self.enabled:
+            return
+
+        now = time.monotonic()
+        if probe:
+            self._probes_in_flight -= 1
+            if failed:
+                self._trip(now)
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+            return
+
+        if self.state != self.CLOSED:
+            # 半开期间返回的旧调用不影响探测结果
+            return
+
+        self._outcomes.append((now, failed))
+        self._expire(now)
+        failures = sum(1 for _, is_failed in self._outcomes if is_failed)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_ratio:
+            self._trip(now)
+
+    def _trip(self, now: float):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.trips += 1
+        self._outcomes.clear()
+        print(f"{self.name}熔断器打开，{self.open_seconds}秒后尝试恢复")
+
+    def _expire(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        获取熔断器状态
+        """
+        now = time.monotonic()
+        self._expire(now)
+        failures = sum(1 for _, is_failed in self._outcomes if is_failed)
+        state = self.state
+        if state == self.OPEN and now - self.opened_at >= self.open_seconds:
+            state = self.HALF_OPEN
+        return {
+            "enabled": self.enabled,
+            "state": state,
+            "window_calls": len(self._outcomes),
+            "window_failure_ratio": round(failures / len(self._outcomes), 3) if self._outcomes else 0.0,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "retry_after_seconds": round(max(0.0, self.open_seconds - (now - self.opened_at)), 1) if state == self.OPEN else 0.0
+        }
+
+# 图像生成服务商熔断器，状态为进程级
+image_provider_breaker = CircuitBreaker(
+    "图像生成服务",
+    window_seconds=settings.CIRCUIT_WINDOW_SECONDS,
+    min_calls=settings.CIRCUIT_MIN_CALLS,
+    failure_ratio=settings.CIRCUIT_FAILURE_RATIO,
+    slow_call_seconds=settings.CIRCUIT_SLOW_CALL_SECONDS,
+    open_seconds=settings.CIRCUIT_OPEN_SECONDS,
+    half_open_probes=settings.CIRCUIT_HALF_OPEN_PROBES,
+    enabled=settings.CIRCUIT_BREAKER_ENABLED
+)
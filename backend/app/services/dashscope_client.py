@@ -0,0 +1,172 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from app.core.config import settings
+
+class DashScopeClient:
+    """
+    DashScope上游客户端
+    阻塞的HTTP调用在有界线程池中执行，不占用事件循环；
+    所有请求共用一个连接池，复用长连接
+    """
+
+    def __init__(self):
+        self.base_url = settings.DASHSCOPE_BASE_URL.rstrip("/")
+        self.timeout = (settings.DASHSCOPE_CONNECT_TIMEOUT, settings.DASHSCOPE_READ_TIMEOUT)
+
+        # 共享连接池，连接数与线程数一致
+        pool_size = max(1, settings.DASHSCOPE_POOL_SIZE)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=pool_size,
+            thread_name_prefix="dashscope"
+        )
+
+    async def run_blocking(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在线程池中执行阻塞调用
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(func, *args, **kwargs)
+        )
+
+    def _headers(self, async_task: bool = False) -> Dict[str, str]:
+        """
+        构造请求头
+        """
+        if not settings.DASHSCOPE_API_KEY:
+            raise Exception("未配置DASHSCOPE_API_KEY")
+
+        headers = {
+            "Authorization": f"Bearer {settings.DASHSCOPE_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        if async_task:
+            headers["X-DashScope-Async"] = "enable"
+        return headers
+
+    def _request(self, method: str, path: str, async_task: bool = False, json_body: Optional[dict] = None) -> Dict[str, Any]:
+        """
+        发送HTTP请求并解析响应（阻塞）
+        """
+        response = self.session.request(
+            method,
+            f"{self.base_url}{path}",
+            headers=self._headers(async_task),
+            json=json_body,
+            timeout=self.timeout
+        )
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+
+        if response.status_code != 200:
+            message = data.get("message") or response.text
+            raise Exception(f"API调用失败({response.status_code}): {message}")
+
+        return data
+
+    async def submit_image_synthesis(
+        self,
+        prompt: str,
+        model: str = "wan2.2-t2i-flash",
+        n: int = 1,
+        size: str = "1024*1024",
+        seed: Optional[int] = None
+    ) -> str:
+        """
+        提交文生图异步任务，返回任务ID
+        指定seed时相同提示词和种子得到相同构图，多图任务的各张图依次使用seed、seed+1……
+        """
+        parameters = {"n": n, "size": size}
+        if seed is not None:
+            parameters["seed"] = seed
+        body = {
+            "model": model,
+            "input": {"prompt": prompt},
+            "parameters": parameters
+        }
+        data = await self.run_blocking(
+            self._request, "POST", "/services/aigc/text2image/image-synthesis",
+            async_task=True, json_body=body
+        )
+
+        task_id = data.get("output", {}).get("task_id")
+        if not task_id:
+            raise Exception(f"API返回缺少任务ID: {data}")
+        return task_id
+
+    async def fetch_task(self, task_id: str) -> Dict[str, Any]:
+        """
+        查询异步任务状态，返回output字段
+        """
+        data = await self.run_blocking(self._request, "GET", f"/tasks/{task_id}")
+        return data.get("output", {})
+
+    async def cancel_task(self, task_id: str):
+        """
+        取消排队中的异步任务，已开始执行的任务无法取消
+        """
+        await self.run_blocking(self._request, "POST", f"/tasks/{task_id}/cancel")
+
+    def _download(self, url: str) -> Tuple[bytes, str]:
+        """
+        下载上游生成的文件（阻塞）
+        """
+        # 不跟随重定向，避免可信地址被重定向到内网
+        with self.session.get(url, timeout=self.timeout, stream=True, allow_redirects=False) as response:
+            response.raise_for_status()
+            if response.is_redirect:
+                raise Exception(f"下载地址发生重定向，已拒绝: {url}")
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > settings.MAX_FILE_SIZE:
+                    raise Exception(f"下载文件超过大小限制: {url}")
+                chunks.append(chunk)
+            return b"".join(chunks), response.headers.get("Content-Type", "")
+
+    async def download(self, url: str) -> Tuple[bytes, str]:
+        """
+        下载上游生成的文件，返回 (内容, Content-Type)
+        """
+        return await self.run_blocking(self._download, url)
+
+    def close(self):
+        """
+        关闭连接池和线程池
+        """
+        self.session.close()
+        self.executor.shutdown(wait=False)
+
+_client: Optional[DashScopeClient] = None
+
+def get_dashscope_client() -> DashScopeClient:
+    """
+    获取进程共享的DashScope客户端
+    """
+    global _client
+    if _client is None:
+        _client = DashScopeClient()
+    return _client
+
+def close_dashscope_client():
+    """
+    关闭进程共享的DashScope客户端
+    """
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import String, cast, or_
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.drawing import Cache, Drawing, DuplicateAsset, GenerationJobRecord, ImageFingerprint
+from app.services.asset_store import AssetStore
+from app.services.derivative_service import get_image_process_pool
+from app.services.image_index import ImageIndex
+from app.utils.prompt_utils import canonicalize_prompt
+
+# 最终图像的感知哈希索引，所有ImageDedupService实例共享
+_image_index = ImageIndex(settings.IMAGE_DEDUP_INDEX_MAX_ENTRIES)
+_image_index_loaded = False
+
+# 去重统计
+_dedup_counters = {"deduplicated": 0, "files_deleted": 0, "files_kept": 0, "bytes_saved": 0}
+
+def _image_dhash(path: str, hash_size: int) -> int:
+    """
+    在子进程中计算差值哈希（dHash）
+    缩小到(hash_size+1)*hash_size的灰度图，比较每行相邻像素的明暗，得到hash_size²位
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.load()
+        gray = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+class ImageDedupService:
+    """
+    近似重复图像去重服务
+    同一规范化提示词、风格和步骤数下，新生成结果的最终图像与已有结果近似重复（感知哈希的汉明距离足够小）时，
+    直接复用已有结果的图像，同一张图只占一份存储
+    只在同一规范化提示词内合并：不同主体的简笔画感知哈希可能非常接近，跨提示词合并会返回另一个主体的画；
+    因此去重只节省重复生成占用的存储，不提供新的缓存命中，跨提示词的命中由近似提示词索引负责
+    重复的文件可能已经通过流式事件发给客户端，宽限期结束后才删除；客户端保存画作时引用的重复图像
+    会被替换为已有图像（见resolve_duplicates）。资源按内容寻址，其他画作、缓存或任务可能引用同一个文件，
+    删除前确认没有引用
+    """
+
+    def __init__(self, db: Session, asset_store: Optional[AssetStore] = None):
+        self.db = db
+        self.asset_store = asset_store or AssetStore()
+
+    def _ensure_index(self):
+        """
+        首次使用时从数据库重建感知哈希索引
+        """
+        global _image_index_loaded
+        if _image_index_loaded:
+            return
+        _image_index_loaded = True
+
+        try:
+            rows = self.db.query(
+                ImageFingerprint.asset_name, ImageFingerprint.dhash, ImageFingerprint.prompt,
+                ImageFingerprint.style, ImageFingerprint.steps
+            ).order_by(ImageFingerprint.created_at).all()
+            # 按时间从旧到新加入，哈希相同时保留最早的结果
+            for asset_name, dhash, prompt, style, steps in rows:
+                _image_index.add((prompt, style, steps), int(dhash, 16), asset_name)
+        except Exception as e:
+            print(f"加载图像感知哈希索引失败: {str(e)}")
+
+    async def deduplicate_result(self, result: Dict[str, Any], prompt: str, style: str, steps: int) -> Dict[str, Any]:
+        """
+        对已转存到本地的生成结果去重
+        找到同一提示词下近似重复的已有结果时返回已有结果的图像，否则登记新结果并原样返回；出错时不影响生成流程
+        """
+        if not settings.IMAGE_DEDUP_ENABLED:
+            return result
+        name = self.asset_store.name_from_url(result["final_image_url"])
+        if not name or name.endswith(".svg"):
+            return result
+
+        try:
+            loop = asyncio.get_running_loop()
+            value_hash = await loop.run_in_executor(
+                get_image_process_pool(),
+                _image_dhash,
+                self.asset_store.path_for(name),
+                settings.IMAGE_DEDUP_HASH_SIZE
+            )
+
+            await self._purge_duplicates()
+            self._ensure_index()
+            prompt = canonicalize_prompt(prompt)
+            group = (prompt, style, steps)
+            match = _image_index.find_nearest(group, value_hash, settings.IMAGE_DEDUP_MAX_DISTANCE)
+            if match is not None:
+                _, matched_name, matched_hash = match
+                if matched_name == name:
+                    return result
+                canonical = self._load_canonical(matched_name, prompt, style, steps)
+                if canonical is not None:
+                    _dedup_counters["deduplicated"] += 1
+                    self._record_duplicates(result, canonical)
+                    return {**result, **canonical}
+                # 已有结果的图像已被清理，改为登记新结果
+                _image_index.discard(group, matched_hash)
+
+            self.db.add(ImageFingerprint(
+                asset_name=name,
+                dhash=f"{value_hash:0{(settings.IMAGE_DEDUP_HASH_SIZE ** 2 + 3) // 4}x}",
+                prompt=prompt,
+                style=style,
+                steps=steps,
+                result=json.dumps({
+                    "final_image_url": result["final_image_url"],
+                    "step_images": list(result.get("step_images", []))
+                })
+            ))
+            self.db.commit()
+            _image_index.add(group, value_hash, name)
+        except Exception as e:
+            self.db.rollback()
+            print(f"图像去重失败: {str(e)}")
+        return result
+
+    def _load_canonical(self, asset_name: str, prompt: str, style: str, steps: int) -> Optional[Dict[str, Any]]:
+        """
+        读取已登记的结果，图像文件已不存在时删除登记并返回None
+        """
+        row = self.db.query(ImageFingerprint).filter(
+            ImageFingerprint.asset_name == asset_name,
+            ImageFingerprint.prompt == prompt,
+            ImageFingerprint.style == style,
+            ImageFingerprint.steps == steps
+        ).first()
+        if row is None:
+            return None
+
+        canonical = json.loads(row.result)
+        urls = [canonical["final_image_url"], *canonical["step_images"]]
+        names = [self.asset_store.name_from_url(url) for url in urls]
+        if not all(name and os.path.exists(self.asset_store.path_for(name)) for name in names):
+            self.db.delete(row)
+            self.db.commit()
+            return None
+
+        row.hits = (row.hits or 0) + 1
+        self.db.commit()
+        return canonical
+
+    def _record_duplicates(self, result: Dict[str, Any], canonical: Dict[str, Any]):
+        """
+        登记被合并的重复图像及替代它的已有图像，宽限期结束后删除文件
+        同组结果的步骤数相同，重复图像按位置对应已有图像
+        """
+        if not settings.IMAGE_DEDUP_DELETE_DUPLICATES:
+            return
+
+        urls = [result["final_image_url"], *result.get("step_images", [])]
+        canonical_urls = [canonical["final_image_url"], *canonical["step_images"]]
+        kept = set(canonical_urls)
+        delete_after = datetime.utcnow() + timedelta(seconds=settings.IMAGE_DEDUP_DELETE_GRACE_SECONDS)
+        for url, canonical_url in zip(urls, canonical_urls):
+            name = self.asset_store.name_from_url(url)
+            if not name or url in kept:
+                continue
+            if self.db.query(DuplicateAsset.id).filter(DuplicateAsset.asset_name == name).first():
+                continue
+            self.db.add(DuplicateAsset(asset_name=name, canonical_url=canonical_url, delete_after=delete_after))
+        self.db.commit()
+
+    async def _purge_duplicates(self, limit: int = 100):
+        """
+        删除宽限期已结束的重复图像文件，登记保留用于替换客户端之后提交的旧地址
+        """
+        if not settings.IMAGE_DEDUP_DELETE_DUPLICATES:
+            return
+
+        now = datetime.utcnow()
+        rows = self.db.query(DuplicateAsset).filter(
+            DuplicateAsset.deleted_at.is_(None),
+            DuplicateAsset.delete_after <= now
+        ).limit(limit).all()
+        for row in rows:
+            if self._is_referenced(row.asset_name):
+                # 同样内容的文件被其他记录引用，保留文件
+                _dedup_counters["files_kept"] += 1
+            else:
+                size = await asyncio.to_thread(self._delete_file, self.asset_store.path_for(row.asset_name))
+                if size:
+                    _dedup_counters["files_deleted"] += 1
+                    _dedup_counters["bytes_saved"] += size
+            row.deleted_at = now
+        if rows:
+            self.db.commit()
+
+    def resolve_duplicates(self, urls: List[str]) -> List[str]:
+        """
+        把被合并的重复图像地址替换为已有图像地址
+        客户端可能保存流式事件中收到的重复图像，画作中只引用保留的图像
+        """
+        names = {url: self.asset_store.name_from_url(url) for url in urls}
+        local_names = [name for name in names.values() if name]
+        if not local_names:
+            return list(urls)
+
+        replacements = dict(self.db.query(DuplicateAsset.asset_name, DuplicateAsset.canonical_url).filter(
+            DuplicateAsset.asset_name.in_(local_names)
+        ).all())
+        return [replacements.get(names[url], url) for url in urls]
+
+    def _is_referenced(self, name: str) -> bool:
+        """
+        画作、缓存、已登记的结果或生成任务是否引用了该资源
+        只在删除宽限期结束的重复文件时按批检查，不在生成路径上扫描
+        """
+        pattern = f"%{name}%"
+        return bool(
+            self.db.query(Drawing.id).filter(or_(
+                Drawing.image_url.like(pattern),
+                Drawing.preview_image_url.like(pattern),
+                cast(Drawing.steps_images, String).like(pattern)
+            )).first()
+            or self.db.query(Cache.id).filter(Cache.content.like(pattern)).first()
+            or self.db.query(ImageFingerprint.id).filter(ImageFingerprint.result.like(pattern)).first()
+            or self.db.query(GenerationJobRecord.id).filter(or_(
+                GenerationJobRecord.final_image_url.like(pattern),
+                cast(GenerationJobRecord.step_images, String).like(pattern)
+            )).first()
+        )
+
+    @staticmethod
+    def _delete_file(path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+            return size
+        except FileNotFoundError:
+            return 0
+
+def get_dedup_stats() -> Dict[str, Any]:
+    """
+    获取图像去重统计信息
+    """
+    return {"indexed": len(_image_index), **_dedup_counters}
@@ -0,0 +1,209 @@
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.asset_store import AssetStore
+from app.services.vectorizer import trace_svg
+
+# 派生图规格：名称 -> 最长边像素
+VARIANT_SIZES = {
+    "thumb": 128,
+    "small": 256,
+    "medium": 512,
+}
+
+# 矢量派生图规格名
+SVG_VARIANT = "svg"
+
+def vectorizes_style(style: Optional[str]) -> bool:
+    """
+    该风格的画作是否描成SVG，只有线条画风格才描
+    """
+    return settings.SVG_VECTORIZE_ENABLED and style in settings.SVG_VECTORIZE_STYLES
+
+def _render_variants(source_path: str, targets: List[Tuple[str, int]], quality: int) -> int:
+    """
+    在子进程中生成派生图，返回生成数量
+    源图只解码一次，从大到小依次缩放
+    """
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        rendered = 0
+        for path, size in sorted(targets, key=lambda target: -target[1]):
+            if os.path.exists(path):
+                continue
+            # 逐级缩小，后面的尺寸直接基于前一个结果计算
+            image.thumbnail((size, size), Image.LANCZOS)
+
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    image.save(f, format="WEBP", quality=quality, method=4)
+                os.replace(temp_path, path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+            rendered += 1
+
+    return rendered
+
+def _render_svg(source_path: str, path: str, max_side: int, tolerance: float, min_area: float) -> int:
+    """
+    在子进程中把线条画描成SVG并写入文件
+    """
+    svg = trace_svg(source_path, max_side, tolerance, min_area)
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(svg)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return len(svg)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def get_image_process_pool() -> ProcessPoolExecutor:
+    """
+    获取图像处理进程池，Pillow等CPU密集的工作都放在这里执行
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max(1, settings.IMAGE_WORKER_PROCESSES))
+    return _executor
+
+def shutdown_image_process_pool():
+    """
+    关闭图像处理进程池
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+# 正在执行的后台生成任务，防止被垃圾回收
+_background_tasks: Set[asyncio.Task] = set()
+
+class DerivativeService:
+    """
+    缩略图和压缩派生图服务
+    为本地资源生成不同尺寸的WebP图和描出的SVG，派生图文件名由源资源名和规格决定
+    """
+
+    def __init__(self, asset_store: Optional[AssetStore] = None):
+        self.asset_store = asset_store or AssetStore()
+        self.root = os.path.join(self.asset_store.root, "derivatives")
+
+    def path_for(self, asset_name: str, variant: str) -> str:
+        """
+        获取派生图路径
+        """
+        if variant not in VARIANT_SIZES and variant != SVG_VARIANT:
+            raise ValueError(f"未知的派生图规格: {variant}")
+        # 校验源资源名
+        self.asset_store.path_for(asset_name)
+        if variant == SVG_VARIANT and asset_name.endswith(".svg"):
+            raise ValueError("SVG资源不需要矢量化")
+        base = asset_name.rsplit(".", 1)[0]
+        extension = "svg" if variant == SVG_VARIANT else "webp"
+        return os.path.join(self.root, base[:2], base[2:4], f"{base}_{variant}.{extension}")
+
+    def variant_urls(self, url: Optional[str]) -> Dict[str, str]:
+        """
+        获取图像各规格派生图的URL，非本地资源返回空字典
+        """
+        name = self.asset_store.name_from_url(url) if url else None
+        if not name or name.endswith(".svg"):
+            return {}
+        return {variant: f"{self.asset_store.url_for(name)}/{variant}" for variant in VARIANT_SIZES}
+
+    def svg_url(self, url: Optional[str], style: Optional[str]) -> Optional[str]:
+        """
+        获取图像矢量化SVG的URL，未开启矢量化、非线条画风格或非本地资源返回None
+        """
+        if not vectorizes_style(style):
+            return None
+        name = self.asset_store.name_from_url(url) if url else None
+        if not name or name.endswith(".svg"):
+            return None
+        return f"{self.asset_store.url_for(name)}/{SVG_VARIANT}"
+
+    async def ensure_variants(self, asset_name: str, variants: Optional[List[str]] = None) -> int:
+        """
+        确保派生图存在，缺失的在进程池中生成
+        """
+        variants = variants or list(VARIANT_SIZES)
+        targets = [
+            (self.path_for(asset_name, variant), VARIANT_SIZES[variant])
+            for variant in variants
+        ]
+        targets = [target for target in targets if not os.path.exists(target[0])]
+        if not targets:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_image_process_pool(),
+            _render_variants,
+            self.asset_store.path_for(asset_name),
+            targets,
+            settings.DERIVATIVE_WEBP_QUALITY
+        )
+
+    async def ensure_svg(self, asset_name: str) -> bool:
+        """
+        确保矢量化SVG存在，缺失时在进程池中描图，返回是否新生成
+        """
+        path = self.path_for(asset_name, SVG_VARIANT)
+        if os.path.exists(path):
+            return False
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            get_image_process_pool(),
+            _render_svg,
+            self.asset_store.path_for(asset_name),
+            path,
+            settings.SVG_MAX_SIDE,
+            settings.SVG_SIMPLIFY_TOLERANCE,
+            settings.SVG_MIN_AREA
+        )
+        return True
+
+    async def generate_for_urls(self, urls: List[str], style: Optional[str] = None):
+        """
+        为一组本地资源URL生成全部派生图（线条画风格且开启矢量化时包括SVG），失败只记录日志
+        """
+        for url in urls:
+            name = self.asset_store.name_from_url(url)
+            if not name or name.endswith(".svg"):
+                continue
+            try:
+                await self.ensure_variants(name)
+                if vectorizes_style(style):
+                    await self.ensure_svg(name)
+            except Exception as e:
+                print(f"派生图生成失败 {name}: {e}")
+
+    def schedule_for_urls(self, urls: List[str], style: Optional[str] = None):
+        """
+        在后台生成派生图，不阻塞当前请求
+        """
+        task = asyncio.get_running_loop().create_task(self.generate_for_urls(urls, style))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
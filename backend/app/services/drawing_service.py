@@ -4,7 +4,17 @@ from sqlalchemy.orm import Session
 from app.models.drawing import Drawing
 from app.services.speech_service import SpeechService
 from app.services.image_service import ImageService
-# from app.services.cache_service import CacheService
+from app.services.cache_service import CacheService
+from app.services.dedup_service import ImageDedupService
+from app.services.asset_store import AssetStore
+from app.services.bundle_service import BundleService
+from app.services.derivative_service import DerivativeService
+from app.services.idempotency_service import get_idempotency_stats
+from app.services.prefetch_service import get_prefetch_stats, record_prefetch_use
+from app.services.scheduler import get_upstream_scheduler
+from app.services.upgrade_service import schedule_upgrade
+from app.core.config import settings
+from app.utils.deadline import RequestAbandonedError, check_deadline, get_abandoned_stats
 
 class DrawingService:
     """
@@ -14,19 +24,104 @@ class DrawingService:
     
     def __init__(self, db: Session):
         self.db = db
-        self.speech_service = SpeechService()
-        self.image_service = ImageService()
-        # self.cache_service = CacheService(db)
+        self._speech_service: Optional[SpeechService] = None
+        self._image_service: Optional[ImageService] = None
+        self.cache_service = CacheService(db)
+        self.asset_store = AssetStore()
+        self.derivative_service = DerivativeService(self.asset_store)
+    
+    @property
+    def speech_service(self) -> SpeechService:
+        """
+        语音识别服务，首次使用时创建；未配置密钥时只有用到语音识别的接口会报错
+        """
+        if self._speech_service is None:
+            self._speech_service = SpeechService()
+        return self._speech_service
+    
+    @property
+    def image_service(self) -> ImageService:
+        """
+        图像生成服务，首次使用时创建；查询和删除画作不依赖图像生成服务的配置
+        """
+        if self._image_service is None:
+            self._image_service = ImageService()
+        return self._image_service
+    
+    async def create_drawing(self, drawing_data) -> Dict[str, Any]:
+        """
+        保存前端提交的画作
+        图像先转存到本地资源存储，数据库中只保存本地URL；不可信的图像地址抛出UntrustedAssetUrlError
+        """
+        image_urls = [drawing_data.image_url, *drawing_data.steps_images]
+        # 图像地址来自客户端，只接受本地资源和可信图像主机，防止服务端请求伪造
+        self.asset_store.check_urls(image_urls)
+        # 流式事件中发出的图像可能已被去重合并，替换为保留的图像
+        image_urls = ImageDedupService(self.db, self.asset_store).resolve_duplicates(image_urls)
+        try:
+            if settings.ASSET_STORE_ENABLED:
+                image_urls = await self.asset_store.localize_urls(image_urls)
+            
+            drawing = Drawing(
+                title=drawing_data.title,
+                description=drawing_data.description,
+                prompt=drawing_data.prompt,
+                image_url=image_urls[0],
+                steps_images=image_urls[1:],
+                style=drawing_data.style,
+                steps=len(image_urls) - 1,
+                user_id=drawing_data.user_id or "anonymous"
+            )
+            
+            self.db.add(drawing)
+            self.db.commit()
+            self.db.refresh(drawing)
+            
+            # 后台生成缩略图
+            self.derivative_service.schedule_for_urls(image_urls, drawing.style)
+            
+            return self._drawing_summary(drawing)
+        except Exception as e:
+            self.db.rollback()
+            raise Exception(f"保存画作失败: {str(e)}")
+    
+    def _drawing_summary(self, drawing: Drawing) -> Dict[str, Any]:
+        """
+        画作列表项，包含各图像的缩略图和矢量图URL
+        """
+        steps_images = drawing.steps_images or []
+        return {
+            "id": drawing.id,
+            "title": drawing.title,
+            "description": drawing.description,
+            "prompt": drawing.prompt,
+            "image_url": drawing.image_url,
+            "preview_image_url": drawing.preview_image_url,
+            "quality": drawing.quality or "full",
+            "steps_images": steps_images,
+            "style": drawing.style,
+            "steps": drawing.steps,
+            "image_variants": self.derivative_service.variant_urls(drawing.image_url),
+            "steps_images_variants": [
+                self.derivative_service.variant_urls(url) for url in steps_images
+            ],
+            "svg_url": self.derivative_service.svg_url(drawing.image_url, drawing.style),
+            "steps_svg_urls": [self.derivative_service.svg_url(url, drawing.style) for url in steps_images],
+            "user_id": drawing.user_id,
+            "created_at": drawing.created_at.isoformat()
+        }
     
     async def create_drawing_from_speech(
         self, 
         audio_content: bytes, 
         user_id: Optional[str] = None,
         style: str = "简笔画",
-        steps: int = 4
+        steps: int = 4,
+        scheduling_user: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         从语音创建绘画
+        请求截止时间通过上下文传递，识别完成后已超时或客户端已断开时不再生成图像
         """
         try:
             # 1. 语音识别
@@ -43,12 +138,16 @@ class DrawingService:
                 # await self.cache_service.set_speech_recognition_cache(audio_hash, recognized_text)
             
             # 2. 生成图像
+            check_deadline("图像生成")
             return await self.create_drawing_from_text(
                 text=recognized_text,
                 user_id=user_id,
                 style=style,
-                steps=steps
+                steps=steps,
+                scheduling_user=scheduling_user
             )
+        except RequestAbandonedError:
+            raise
         except Exception as e:
             raise Exception(f"从语音创建绘画失败: {str(e)}")
     
@@ -57,25 +156,39 @@ class DrawingService:
         text: str, 
         user_id: Optional[str] = None,
         style: str = "简笔画",
-        steps: int = 4
+        steps: int = 4,
+        quality: str = "full",
+        scheduling_user: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         从文字创建绘画
+        quality为preview时先保存预览图，全分辨率图像在后台生成后更新到绘画记录
+        scheduling_user为上游公平调度使用的标识，默认使用user_id
         """
+        scheduling_user = scheduling_user or user_id
         try:
-            # 1. 检查图像生成缓存
-            # cached_images = await self.cache_service.get_image_generation_cache(text, style, steps)
-            # if cached_images:
-            #     image_result = cached_images
-            # else:
-            # 2. 生成图像
-            image_result = await self.image_service.generate_step_by_step_drawing(
-                prompt=text,
-                style=style,
-                steps=steps
-            )
-            # 缓存图像生成结果
-            # await self.cache_service.set_image_generation_cache(text, style, steps, image_result)
+            record_prefetch_use(text, style, steps)
+            
+            # 1. 检查图像生成缓存（缓存中只有全分辨率结果）
+            image_result = await self.cache_service.get_image_generation_cache(text, style, steps)
+            if image_result:
+                quality = "full"
+            else:
+                # 2. 生成图像
+                image_result = await self.image_service.generate_step_by_step_drawing(
+                    prompt=text,
+                    style=style,
+                    steps=steps,
+                    user_id=scheduling_user,
+                    quality=quality
+                )
+                # 转存到本地并缓存图像生成结果
+                image_result = await self.asset_store.localize_result(image_result)
+                if quality == "full":
+                    image_result = await ImageDedupService(self.db, self.asset_store).deduplicate_result(
+                        image_result, text, style, steps
+                    )
+                    await self.cache_service.set_image_generation_cache(text, style, steps, image_result)
             
             # 3. 保存到数据库
             drawing = Drawing(
@@ -83,32 +196,50 @@ class DrawingService:
                 description=f"使用{style}风格绘制的{text}",
                 prompt=text,
                 image_url=image_result["final_image_url"],
-                step_images=image_result["step_images"],
-                user_id=user_id or "anonymous",
+                preview_image_url=image_result["final_image_url"] if quality == "preview" else None,
+                quality=quality,
+                seed=image_result.get("seed"),
+                steps_images=image_result["step_images"],
                 style=style,
-                steps=steps
+                steps=steps,
+                user_id=user_id or "anonymous"
             )
             
             self.db.add(drawing)
             self.db.commit()
             self.db.refresh(drawing)
             
-            return {
-                "id": drawing.id,
-                "title": drawing.title,
-                "description": drawing.description,
-                "prompt": drawing.prompt,
-                "image_url": drawing.image_url,
-                "step_images": drawing.step_images,
-                "style": drawing.style,
-                "steps": drawing.steps,
-                "created_at": drawing.created_at.isoformat(),
-                "provider": image_result.get("provider", "unknown")
-            }
+            # 后台生成缩略图
+            self.derivative_service.schedule_for_urls(
+                [image_result["final_image_url"], *image_result["step_images"]],
+                style
+            )
+            if quality == "preview":
+                schedule_upgrade(text, style, steps, image_result, scheduling_user, drawing.id)
+            
+            return self._drawing_summary(drawing)
+        except RequestAbandonedError:
+            self.db.rollback()
+            raise
         except Exception as e:
             self.db.rollback()
             raise Exception(f"从文字创建绘画失败: {str(e)}")
     
+    async def get_drawing_bundle(self, drawing_id: int) -> Optional[Dict[str, Any]]:
+        """
+        获取画作全部图像打包成的精灵图和偏移表，画作不存在时返回None
+        """
+        drawing = self.db.query(Drawing).filter(Drawing.id == drawing_id).first()
+        if not drawing:
+            return None
+        
+        try:
+            return await BundleService(self.asset_store).get_bundle(
+                drawing.image_url, drawing.steps_images or []
+            )
+        except Exception as e:
+            raise Exception(f"图像打包失败: {str(e)}")
+    
     def get_drawing_by_id(self, drawing_id: int) -> Optional[Dict[str, Any]]:
         """
         根据ID获取绘画
@@ -118,19 +249,7 @@ class DrawingService:
             if not drawing:
                 return None
             
-            return {
-                "id": drawing.id,
-                "title": drawing.title,
-                "description": drawing.description,
-                "prompt": drawing.prompt,
-                "image_url": drawing.image_url,
-                "step_images": drawing.step_images,
-                "style": drawing.style,
-                "steps": drawing.steps,
-                "user_id": drawing.user_id,
-                "created_at": drawing.created_at.isoformat(),
-                "updated_at": drawing.updated_at.isoformat()
-            }
+            return self._drawing_summary(drawing)
         except Exception as e:
             raise Exception(f"获取绘画失败: {str(e)}")
     
@@ -151,16 +270,7 @@ class DrawingService:
             ).offset(skip).limit(limit).all()
             
             return [
-                {
-                    "id": drawing.id,
-                    "title": drawing.title,
-                    "description": drawing.description,
-                    "prompt": drawing.prompt,
-                    "image_url": drawing.image_url,
-                    "steps_images": drawing.step_images,
-                    "user_id": drawing.user_id,
-                    "created_at": drawing.created_at.isoformat()
-                }
+                self._drawing_summary(drawing)
                 for drawing in drawings
             ]
         except Exception as e:
@@ -176,16 +286,7 @@ class DrawingService:
             ).offset(skip).limit(limit).all()
             
             return [
-                {
-                    "id": drawing.id,
-                    "title": drawing.title,
-                    "description": drawing.description,
-                    "prompt": drawing.prompt,
-                    "image_url": drawing.image_url,
-                    "steps_images": drawing.step_images,
-                    "user_id": drawing.user_id,
-                    "created_at": drawing.created_at.isoformat()
-                }
+                self._drawing_summary(drawing)
                 for drawing in drawings
             ]
         except Exception as e:
@@ -221,7 +322,7 @@ class DrawingService:
             # 获取各服务的状态信息
             speech_info = self.speech_service.get_provider_info()
             image_info = self.image_service.get_provider_info()
-            # cache_stats = await self.cache_service.get_stats()
+            cache_stats = await self.cache_service.get_stats()
             
             # 获取数据库统计
             total_drawings = self.db.query(Drawing).count()
@@ -229,7 +330,11 @@ class DrawingService:
             return {
                 "speech_service": speech_info,
                 "image_service": image_info,
-                # "cache_stats": cache_stats,
+                "cache_stats": cache_stats,
+                "scheduler_stats": get_upstream_scheduler().get_stats(),
+                "abandoned_work": get_abandoned_stats(),
+                "idempotency_stats": get_idempotency_stats(),
+                "prefetch_stats": get_prefetch_stats(),
                 "database_stats": {
                     "total_drawings": total_drawings
                 },
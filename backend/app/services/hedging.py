@@ -0,0 +1,112 @@
+import asyncio
+import math
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+class LatencyTracker:
+    """
+    记录最近的调用耗时，计算分位数
+    """
+
+    def __init__(self, max_samples: int = 200):
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """
+        返回q分位数（0~1），样本不足时返回None
+        """
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
+
+class Hedger:
+    """
+    对冲请求
+    调用超过历史耗时的分位数仍未完成时，再发起一次相同调用，取先成功的结果；
+    对冲调用数量受比例上限约束，避免服务商整体变慢时请求量翻倍
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        quantile: float = 0.95,
+        min_samples: int = 20,
+        max_ratio: float = 0.1
+    ):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        当前的对冲等待时间，不满足对冲条件时返回None
+        """
+        if not self.enabled:
+            return None
+        if self.hedged + 1 > self.max_ratio * max(1, self.calls):
+            return None
+        return self.latency.percentile(self.quantile, self.min_samples)
+
+    async def run(
+        self,
+        func: Callable[[], Awaitable[Any]],
+        allow_hedge: Optional[Callable[[], bool]] = None
+    ) -> Any:
+        """
+        执行调用，必要时发起对冲
+        allow_hedge在发起对冲前调用，返回False时放弃对冲（例如上游限流令牌不足）
+        """
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        primary = asyncio.ensure_future(self._timed(func, loop))
+        pending = {primary}
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and (allow_hedge is None or allow_hedge()):
+                    self.hedged += 1
+                    pending.add(asyncio.ensure_future(self._timed(func, loop)))
+
+            last_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed(self, func: Callable[[], Awaitable[Any]], loop: asyncio.AbstractEventLoop) -> Any:
+        started = loop.time()
+        result = await func()
+        self.latency.record(loop.time() - started)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取对冲统计信息
+        """
+        p95 = self.latency.percentile(self.quantile, self.min_samples)
+        return {
+            "enabled": self.enabled,
+            "hedge_after_seconds": round(p95, 2) if p95 is not None else None,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins
+        }
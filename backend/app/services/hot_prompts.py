@@ -0,0 +1,173 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.prompt_utils import canonicalize_prompt
+
+# 滑动窗口：名称 -> (窗口长度, 分桶长度)，单位秒；每个桶一份独立的摘要，过期的桶整体丢弃
+HOT_WINDOWS: Dict[str, Tuple[int, int]] = {
+    "5m": (300, 30),
+    "1h": (3600, 300),
+    "24h": (86400, 3600)
+}
+
+# 记录的原始提示词最大长度，限制内存占用
+_MAX_PROMPT_LENGTH = 100
+
+class SpaceSaving:
+    """
+    Space-Saving高频项摘要
+    最多保留capacity个计数器；新项在计数器已满时替换计数最小的项，并继承其计数作为误差上界，
+    因此count是真实次数的上界，count - error是下界
+    计数器按次数分桶（Stream-Summary），找最小计数的项和增加计数都是O(1)
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        # 项 -> [估计次数, 误差, 缓存查询次数, 缓存命中次数]；查询和命中只统计该项进入摘要之后的部分
+        self.counters: Dict[str, List[int]] = {}
+        self.total = 0
+        # 估计次数 -> 该次数的项（按进入该桶的先后排列），以及当前最小的次数
+        self._buckets: Dict[int, Dict[str, None]] = {}
+        self._min = 0
+
+    def add(self, item: str, lookup: bool = False, hit: bool = False):
+        self.total += 1
+        counter = self.counters.get(item)
+        if counter is None:
+            if len(self.counters) < self.capacity:
+                counter = [0, 0, 0, 0]
+            else:
+                # 替换最小计数桶中最早进入的项
+                victim = next(iter(self._buckets[self._min]))
+                self._unlink(victim, self._min)
+                floor = self.counters.pop(victim)[0]
+                counter = [floor, floor, 0, 0]
+            self.counters[item] = counter
+        else:
+            self._unlink(item, counter[0])
+        counter[0] += 1
+        self._buckets.setdefault(counter[0], {})[item] = None
+        if not self._min or counter[0] < self._min or self._min not in self._buckets:
+            # 只有新项（次数为1）或原最小桶被移空时最小次数才会变化，新的最小值就是该项的次数
+            self._min = counter[0]
+        if lookup:
+            counter[2] += 1
+            if hit:
+                counter[3] += 1
+
+    def _unlink(self, item: str, count: int):
+        bucket = self._buckets[count]
+        del bucket[item]
+        if not bucket:
+            del self._buckets[count]
+
+    @property
+    def min_count(self) -> int:
+        """
+        未被记录的项在本摘要中的次数上界
+        """
+        if len(self.counters) < self.capacity:
+            return 0
+        return self._min
+
+class HotPromptTracker:
+    """
+    滑动窗口高频项统计
+    每个窗口由若干时间桶组成，每个桶是一份Space-Saving摘要；查询时合并窗口内各桶的摘要
+    """
+
+    def __init__(self, capacity: int, windows: Dict[str, Tuple[int, int]] = HOT_WINDOWS):
+        self.capacity = capacity
+        self.windows = windows
+        self._rings: Dict[str, "OrderedDict[int, SpaceSaving]"] = {name: OrderedDict() for name in windows}
+
+    def add(self, item: str, lookup: bool = False, hit: bool = False, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        for name, (span, bucket) in self.windows.items():
+            ring = self._rings[name]
+            index = int(now // bucket)
+            summary = ring.get(index)
+            if summary is None:
+                summary = ring[index] = SpaceSaving(self.capacity)
+                # 丢弃已滑出窗口的桶
+                oldest = index - span // bucket
+                while ring and next(iter(ring)) <= oldest:
+                    ring.popitem(last=False)
+            summary.add(item, lookup, hit)
+
+    def top(self, window: str, limit: int, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        窗口内估计次数最高的项
+        count为估计次数（上界），guaranteed为保证达到的次数（下界），hit_ratio为图像缓存命中率
+        """
+        now = time.time() if now is None else now
+        span, bucket = self.windows[window]
+        oldest = int(now // bucket) - span // bucket
+        summaries = [summary for index, summary in self._rings[window].items() if index > oldest]
+
+        merged: Dict[str, List[int]] = {}
+        for summary in summaries:
+            for item in summary.counters:
+                merged.setdefault(item, [0, 0, 0, 0])
+        for summary in summaries:
+            floor = summary.min_count
+            for item, totals in merged.items():
+                counter = summary.counters.get(item)
+                if counter is None:
+                    # 该桶中没有记录，真实次数不超过该桶的最小计数
+                    totals[0] += floor
+                    totals[1] += floor
+                else:
+                    for position in range(4):
+                        totals[position] += counter[position]
+
+        ranked = sorted(merged.items(), key=lambda entry: entry[1][0], reverse=True)[:limit]
+        return {
+            "total": sum(summary.total for summary in summaries),
+            "items": [
+                {
+                    "prompt": item,
+                    "count": count,
+                    "guaranteed": count - error,
+                    "lookups": lookups,
+                    "hits": hits,
+                    "hit_ratio": round(hits / lookups, 3) if lookups else None
+                }
+                for item, (count, error, lookups, hits) in ranked
+            ]
+        }
+
+# 原始提示词和规范化后的主体分别统计
+_trackers = {
+    "prompts": HotPromptTracker(settings.HOT_PROMPTS_CAPACITY),
+    "subjects": HotPromptTracker(settings.HOT_PROMPTS_CAPACITY)
+}
+
+def record_prompt(prompt: str, lookup: bool = False, hit: bool = False):
+    """
+    记录一次生成或识别请求的提示词
+    lookup表示这次请求查询了图像生成缓存，hit表示命中
+    """
+    if not settings.HOT_PROMPTS_ENABLED:
+        return
+    text = prompt.strip()[:_MAX_PROMPT_LENGTH]
+    if not text:
+        return
+    now = time.time()
+    _trackers["prompts"].add(text, lookup, hit, now)
+    _trackers["subjects"].add(canonicalize_prompt(text) or text, lookup, hit, now)
+
+def get_hot_prompts(window: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+    """
+    获取各滑动窗口内的热门提示词和主体
+    """
+    names = [window] if window else list(HOT_WINDOWS)
+    now = time.time()
+    return {
+        name: {
+            kind: tracker.top(name, limit, now)
+            for kind, tracker in _trackers.items()
+        }
+        for name in names
+    }
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.drawing import IdempotencyRecord
+from app.utils.async_utils import LoopLocal
+from app.utils.deadline import detached_context, run_with_deadline
+
+PROCESSING = "processing"
+COMPLETED = "completed"
+
+# 幂等键最大长度，与数据库列一致
+MAX_KEY_LENGTH = 255
+
+# 本进程中正在执行的幂等请求：(接口, 幂等键) -> (请求体哈希, 任务)
+_running = LoopLocal(dict)
+
+# 幂等请求统计
+_idempotency_counters = {"started": 0, "joined": 0, "replayed": 0, "rejected": 0}
+
+class IdempotencyError(Exception):
+    """
+    幂等键无效
+    """
+    status_code = 400
+
+class IdempotencyKeyReusedError(IdempotencyError):
+    """
+    同一幂等键被用于不同的请求体
+    """
+    status_code = 422
+
+class IdempotencyInProgressError(IdempotencyError):
+    """
+    同一幂等键的首次请求仍在其他进程中处理
+    """
+    status_code = 409
+
+def _request_hash(payload: Dict[str, Any]) -> str:
+    """
+    计算请求体哈希
+    """
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+class IdempotencyService:
+    """
+    幂等键服务
+    首次请求登记为处理中并在后台执行，结果写入数据库，保留期内相同键的重试直接返回首次的响应；
+    首次请求仍在执行时，本进程内的重试等待同一个任务，不会重复调用上游或重复写入
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    async def run(
+        self,
+        scope: str,
+        key: str,
+        payload: Dict[str, Any],
+        work: Callable[[Session], Awaitable[Dict[str, Any]]],
+        stage: str
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        按幂等键执行work，返回 (响应, 是否为重放的响应)
+        work使用独立的数据库会话，发起请求的客户端超时或断开后仍会执行完并记录结果，供重试使用
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyError(f"幂等键长度需在1到{MAX_KEY_LENGTH}之间")
+
+        request_hash = _request_hash(payload)
+        running = _running.get()
+        entry = running.get((scope, key))
+        if entry is None:
+            record, claimed = self._claim(scope, key, request_hash)
+            if not claimed:
+                if record.status == COMPLETED:
+                    _idempotency_counters["replayed"] += 1
+                    return json.loads(record.response), True
+                _idempotency_counters["rejected"] += 1
+                raise IdempotencyInProgressError("相同幂等键的请求正在处理中，请稍后重试")
+
+            task = asyncio.get_running_loop().create_task(
+                self._execute(scope, key, work),
+                context=detached_context()
+            )
+            entry = (request_hash, task)
+            running[(scope, key)] = entry
+            task.add_done_callback(lambda done: self._forget(running, scope, key, done))
+            _idempotency_counters["started"] += 1
+            replayed = False
+        else:
+            if entry[0] != request_hash:
+                _idempotency_counters["rejected"] += 1
+                raise IdempotencyKeyReusedError("幂等键已用于不同的请求")
+            _idempotency_counters["joined"] += 1
+            replayed = True
+
+        # shield保证等待者超时或断开时任务继续执行
+        response = await run_with_deadline(asyncio.shield(entry[1]), stage)
+        return response, replayed
+
+    def _claim(self, scope: str, key: str, request_hash: str) -> Tuple[IdempotencyRecord, bool]:
+        """
+        查找幂等键记录，不存在时登记为处理中
+        返回 (记录, 是否由本次请求登记)；过期的记录（包括中断的处理中记录）视为不存在
+        """
+        now = datetime.utcnow()
+        self.db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.expires_at <= now
+        ).delete(synchronize_session=False)
+        self.db.commit()
+
+        record = self.db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.scope == scope,
+            IdempotencyRecord.idempotency_key == key
+        ).first()
+        if record is not None:
+            if record.request_hash != request_hash:
+                _idempotency_counters["rejected"] += 1
+                raise IdempotencyKeyReusedError("幂等键已用于不同的请求")
+            return record, False
+
+        record = IdempotencyRecord(
+            scope=scope,
+            idempotency_key=key,
+            request_hash=request_hash,
+            status=PROCESSING,
+            expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_PROCESSING_TIMEOUT)
+        )
+        try:
+            self.db.add(record)
+            self.db.commit()
+            return record, True
+        except IntegrityError:
+            # 其他进程同时登记了相同的键
+            self.db.rollback()
+            return self._claim(scope, key, request_hash)
+
+    async def _execute(
+        self,
+        scope: str,
+        key: str,
+        work: Callable[[Session], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        执行请求并记录响应；失败时删除处理中的记录，允许重试重新执行
+        """
+        db = SessionLocal()
+        try:
+            try:
+                response = await work(db)
+            except BaseException:
+                db.rollback()
+                self._finish(db, scope, key, None)
+                raise
+            self._finish(db, scope, key, response)
+            return response
+        finally:
+            db.close()
+
+    def _finish(self, db: Session, scope: str, key: str, response: Optional[Dict[str, Any]]):
+        """
+        更新幂等键记录：有响应时保存为已完成，否则删除
+        """
+        try:
+            query = db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.scope == scope,
+                IdempotencyRecord.idempotency_key == key
+            )
+            if response is None:
+                query.delete(synchronize_session=False)
+            else:
+                query.update({
+                    IdempotencyRecord.status: COMPLETED,
+                    IdempotencyRecord.response: json.dumps(response, ensure_ascii=False, default=str),
+                    IdempotencyRecord.expires_at: datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+                }, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"更新幂等键记录失败: {str(e)}")
+
+    @staticmethod
+    def _forget(running: Dict, scope: str, key: str, task: asyncio.Task):
+        """
+        移除已结束的任务；没有等待者时取出异常，避免未处理异常的警告
+        """
+        if running.get((scope, key), (None, None))[1] is task:
+            del running[(scope, key)]
+        if not task.cancelled():
+            task.exception()
+
+def get_idempotency_stats() -> Dict[str, int]:
+    """
+    获取幂等请求统计信息
+    """
+    return dict(_idempotency_counters)
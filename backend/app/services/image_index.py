@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """
+    按汉明距离组织的BK树
+    子节点按与父节点的距离分支，查询时利用三角不等式只访问可能命中的分支
+    """
+
+    def __init__(self):
+        # 节点：[哈希值, 值, {距离: 子节点}]
+        self._root: Optional[list] = None
+        self._size = 0
+        # 节点总数，包括已移除条目留下的节点
+        self.nodes = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def items(self) -> Iterator[Tuple[int, str]]:
+        """
+        遍历未移除的条目，返回(哈希值, 值)
+        """
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            if node[1] is not None:
+                yield node[0], node[1]
+            stack.extend(node[2].values())
+
+    def add(self, value_hash: int, value: str):
+        """
+        添加一个哈希值，已存在相同哈希值时保留原有的值（已移除的除外）
+        """
+        if self._root is None:
+            self._root = [value_hash, value, {}]
+            self._size += 1
+            self.nodes += 1
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(value_hash, node[0])
+            if distance == 0:
+                if node[1] is None:
+                    node[1] = value
+                    self._size += 1
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value_hash, value, {}]
+                self._size += 1
+                self.nodes += 1
+                return
+            node = child
+
+    def discard(self, value_hash: int):
+        """
+        移除哈希值对应的条目，节点保留用于维持树结构
+        """
+        node = self._root
+        while node is not None:
+            distance = hamming_distance(value_hash, node[0])
+            if distance == 0:
+                if node[1] is not None:
+                    node[1] = None
+                    self._size -= 1
+                return
+            node = node[2].get(distance)
+
+    def find(self, value_hash: int, max_distance: int) -> List[Tuple[int, str, int]]:
+        """
+        查找距离不超过max_distance的全部条目，按距离从小到大返回(距离, 值, 哈希值)
+        """
+        if self._root is None:
+            return []
+
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value_hash, node[0])
+            if distance <= max_distance and node[1] is not None:
+                matches.append((distance, node[1], node[0]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        matches.sort()
+        return matches
+
+class ImageIndex:
+    """
+    图像感知哈希索引
+    每个分组（风格、步骤数等必须一致的参数）一棵BK树，查找汉明距离相近的图像
+    最多保留max_entries个条目，超出时淘汰最久未命中的条目
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max(1, max_entries)
+        self._trees: Dict[Hashable, BKTree] = {}
+        # 条目按最近使用排列：(分组, 哈希值) -> None
+        self._recent: "OrderedDict[Tuple[Hashable, int], None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def add(self, group: Hashable, value_hash: int, value: str):
+        tree = self._trees.setdefault(group, BKTree())
+        tree.add(value_hash, value)
+        self._recent[(group, value_hash)] = None
+        self._recent.move_to_end((group, value_hash))
+        while len(self._recent) > self.max_entries:
+            self.discard(*next(iter(self._recent)))
+
+    def discard(self, group: Hashable, value_hash: int):
+        self._recent.pop((group, value_hash), None)
+        tree = self._trees.get(group)
+        if tree is None:
+            return
+        tree.discard(value_hash)
+        if not len(tree):
+            del self._trees[group]
+        elif tree.nodes > 2 * len(tree) + 16:
+            # 已移除条目留下的节点过多时重建，内存只随保留的条目增长
+            rebuilt = BKTree()
+            for item_hash, value in tree.items():
+                rebuilt.add(item_hash, value)
+            self._trees[group] = rebuilt
+
+    def find_nearest(self, group: Hashable, value_hash: int, max_distance: int) -> Optional[Tuple[int, str, int]]:
+        """
+        查找分组内距离最近且不超过max_distance的图像，返回(距离, 值, 哈希值)
+        """
+        tree = self._trees.get(group)
+        if tree is None:
+            return None
+        matches = tree.find(value_hash, max_distance)
+        if not matches:
+            return None
+        self._recent.move_to_end((group, matches[0][2]))
+        return matches[0]
@@ -0,0 +1,53 @@
+from typing import Dict, Type
+from app.core.config import settings
+from app.services.image_providers.base import ImageProvider
+from app.services.image_providers.local import LocalProvider
+from app.services.image_providers.tongyi import TongyiProvider
+
+# 已注册的图像生成服务提供商
+PROVIDERS: Dict[str, Type[ImageProvider]] = {}
+
+def register_provider(provider_class: Type[ImageProvider]):
+    """
+    注册图像生成服务提供商
+    """
+    PROVIDERS[provider_class.name] = provider_class
+    return provider_class
+
+register_provider(TongyiProvider)
+register_provider(LocalProvider)
+
+def resolve_provider_name() -> str:
+    """
+    根据配置选择图像生成服务提供商
+    IMAGE_PROVIDER为auto时使用通义万相，未配置密钥时报错；本地绘制只在显式配置为local时使用，
+    避免生产环境漏配密钥时悄悄返回本地生成的图形
+    """
+    name = (settings.IMAGE_PROVIDER or "auto").strip().lower()
+    if name == "auto":
+        if not TongyiProvider.is_available():
+            raise Exception("未配置DASHSCOPE_API_KEY，无法使用图像生成服务；离线运行请设置IMAGE_PROVIDER=local")
+        return TongyiProvider.name
+
+    provider_class = PROVIDERS.get(name)
+    if provider_class is None:
+        raise Exception(f"未知的图像生成服务: {name}")
+    if not provider_class.is_available():
+        raise Exception(f"图像生成服务{name}不可用，请检查配置")
+    return name
+
+def create_provider(name: str) -> ImageProvider:
+    """
+    创建图像生成服务提供商实例
+    """
+    return PROVIDERS[name]()
+
+__all__ = [
+    "ImageProvider",
+    "LocalProvider",
+    "TongyiProvider",
+    "PROVIDERS",
+    "register_provider",
+    "resolve_provider_name",
+    "create_provider",
+]
@@ -0,0 +1,45 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+class ImageProvider(ABC):
+    """
+    图像生成服务提供商接口
+    每个提供商负责把一条提示词变成一张图像的URL
+    """
+
+    # 注册名
+    name: str = ""
+    # 展示信息：名称、描述、特性
+    info: Dict[str, Any] = {}
+    # 单个任务最多生成的图像数量
+    max_batch_size: int = 1
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """
+        当前配置下是否可用
+        """
+        return True
+
+    @abstractmethod
+    async def generate(self, prompt: str, size: Optional[str] = None, seed: Optional[int] = None) -> str:
+        """
+        生成单张图像，返回图像URL
+        size为"宽*高"，默认使用IMAGE_SIZE_FULL；seed为随机种子，相同提示词和种子得到相同构图
+        """
+
+    async def generate_batch(
+        self,
+        prompt: str,
+        n: int,
+        size: Optional[str] = None,
+        seed: Optional[int] = None
+    ) -> List[str]:
+        """
+        用同一提示词生成n张不同的图像，n不超过max_batch_size
+        默认逐张生成，支持多图任务的提供商应覆盖此方法
+        """
+        return list(await asyncio.gather(*(
+            self.generate(prompt, size, None if seed is None else seed + index) for index in range(n)
+        )))
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import io
+import random
+import re
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.asset_store import AssetStore
+from app.services.derivative_service import get_image_process_pool
+from app.services.image_providers.base import ImageProvider
+
+# 分步骤提示词中的步骤标记，例如 "step 2 of 4"
+_STEP_PATTERN = re.compile(r",?\s*step (\d+) of (\d+)[^,]*(, progressive drawing)?", re.IGNORECASE)
+
+def _parse_prompt(prompt: str) -> Tuple[str, float]:
+    """
+    拆出基础提示词和绘制进度（0~1）
+    同一主题的各个步骤使用同一个基础提示词，保证步骤图是最终图的一部分
+    """
+    match = _STEP_PATTERN.search(prompt)
+    if not match:
+        return prompt, 1.0
+    step, total = int(match.group(1)), max(1, int(match.group(2)))
+    return _STEP_PATTERN.sub("", prompt), min(1.0, step / total)
+
+def _render_line_drawing(seed: int, progress: float, size: int) -> bytes:
+    """
+    在子进程中绘制确定性的简笔画，返回PNG数据
+    同一seed总是得到相同的图形，progress决定画出前多少笔
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("L", (size, size), 255)
+    draw = ImageDraw.Draw(image)
+    width = max(2, size // 128)
+    margin = size // 8
+
+    def point():
+        return rng.randint(margin, size - margin), rng.randint(margin, size - margin)
+
+    def box():
+        (x0, y0), (x1, y1) = point(), point()
+        return min(x0, x1), min(y0, y1), max(x0, x1) + width, max(y0, y1) + width
+
+    shape_count = rng.randint(6, 12)
+    shapes = []
+    for _ in range(shape_count):
+        kind = rng.choice(["ellipse", "rectangle", "line", "arc", "polygon"])
+        if kind == "polygon":
+            shapes.append((kind, [point() for _ in range(rng.randint(3, 5))]))
+        elif kind == "line":
+            shapes.append((kind, [point(), point()]))
+        elif kind == "arc":
+            shapes.append((kind, (box(), rng.randint(0, 180), rng.randint(180, 360))))
+        else:
+            shapes.append((kind, box()))
+
+    for kind, geometry in shapes[:max(1, round(shape_count * progress))]:
+        if kind == "ellipse":
+            draw.ellipse(geometry, outline=0, width=width)
+        elif kind == "rectangle":
+            draw.rectangle(geometry, outline=0, width=width)
+        elif kind == "line":
+            draw.line(geometry, fill=0, width=width)
+        elif kind == "arc":
+            bounds, start, end = geometry
+            draw.arc(bounds, start, end, fill=0, width=width)
+        else:
+            draw.polygon(geometry, outline=0, width=width)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _side_length(size: Optional[str]) -> int:
+    """
+    解析"宽*高"格式的尺寸，本地绘制为正方形，边长不超过LOCAL_PROVIDER_IMAGE_SIZE
+    """
+    try:
+        width = int((size or settings.IMAGE_SIZE_FULL).split("*")[0])
+    except ValueError:
+        width = settings.LOCAL_PROVIDER_IMAGE_SIZE
+    return max(16, min(width, settings.LOCAL_PROVIDER_IMAGE_SIZE))
+
+class LocalProvider(ImageProvider):
+    """
+    本地确定性图像生成
+    根据提示词用Pillow绘制简笔画并保存到本地资源存储，不调用任何外部服务；
+    可配置模拟延迟和错误率，用于离线运行和压测
+    """
+
+    name = "local"
+    info = {
+        "name": "本地绘制",
+        "description": "根据提示词确定性地绘制简笔画，用于离线运行、压测和CI",
+        "features": ["无需API密钥", "结果可复现", "可配置延迟和错误率"]
+    }
+    max_batch_size = 8
+
+    def __init__(self):
+        self.asset_store = AssetStore()
+        self.rng = random.Random()
+        self._variants: Dict[str, int] = {}
+
+    async def generate(self, prompt: str, size: Optional[str] = None, seed: Optional[int] = None) -> str:
+        await self._simulate_upstream()
+        return await self._render(prompt, 0, size, seed)
+
+    async def generate_batch(
+        self,
+        prompt: str,
+        n: int,
+        size: Optional[str] = None,
+        seed: Optional[int] = None
+    ) -> List[str]:
+        """
+        一次模拟调用生成n张图像
+        同一实例对同一提示词的多次批量调用依次使用后续的候选种子，保证候选各不相同
+        """
+        start = self._variants.get(prompt, 0)
+        self._variants[prompt] = start + n
+        await self._simulate_upstream()
+        return list(await asyncio.gather(*(
+            self._render(prompt, variant, size, seed) for variant in range(start, start + n)
+        )))
+
+    async def _render(self, prompt: str, variant: int, size: Optional[str] = None, seed: Optional[int] = None) -> str:
+        base_prompt, progress = _parse_prompt(prompt)
+        seed_source = base_prompt if variant == 0 else f"{base_prompt}#{variant}"
+        if seed is not None:
+            seed_source = f"{seed_source}@{seed}"
+        seed = int.from_bytes(hashlib.sha256(seed_source.encode("utf-8")).digest()[:8], "big")
+
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            get_image_process_pool(),
+            _render_line_drawing,
+            seed,
+            progress,
+            _side_length(size)
+        )
+        name = await asyncio.to_thread(self.asset_store.put_bytes, data, "png")
+        return self.asset_store.url_for(name)
+
+    async def _simulate_upstream(self):
+        """
+        模拟上游服务的耗时和失败
+        """
+        latency = settings.LOCAL_PROVIDER_LATENCY_SECONDS
+        if latency > 0:
+            jitter = settings.LOCAL_PROVIDER_LATENCY_JITTER
+            await asyncio.sleep(max(0.0, self.rng.uniform(latency - jitter, latency + jitter)))
+        if self.rng.random() < settings.LOCAL_PROVIDER_ERROR_RATE:
+            raise Exception("本地图像服务模拟失败")
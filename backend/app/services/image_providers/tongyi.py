@@ -0,0 +1,54 @@
+from typing import List, Optional
+from app.core.config import settings
+from app.services.dashscope_client import get_dashscope_client
+from app.services.image_providers.base import ImageProvider
+from app.services.task_poller import get_task_poller
+
+class TongyiProvider(ImageProvider):
+    """
+    通义万相图像生成
+    """
+
+    name = "tongyi"
+    info = {
+        "name": "通义万相",
+        "description": "阿里云推出的AI图像生成模型，支持万相2.2极速版",
+        "features": ["中文优化", "高质量生成", "多风格支持", "分步骤生成", "真实API调用"]
+    }
+    max_batch_size = 4  # 万相单个任务最多生成4张
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return bool(settings.DASHSCOPE_API_KEY and settings.DASHSCOPE_API_KEY.strip())
+
+    async def generate(self, prompt: str, size: Optional[str] = None, seed: Optional[int] = None) -> str:
+        return (await self.generate_batch(prompt, 1, size, seed))[0]
+
+    async def generate_batch(
+        self,
+        prompt: str,
+        n: int,
+        size: Optional[str] = None,
+        seed: Optional[int] = None
+    ) -> List[str]:
+        """
+        提交一个通义万相任务并等待结果，一个任务生成n张图像
+        """
+        client = get_dashscope_client()
+
+        # 创建异步任务
+        task_id = await client.submit_image_synthesis(
+            prompt=prompt,
+            model="wan2.2-t2i-flash",  # 使用万相2.2极速版
+            n=n,
+            size=size or settings.IMAGE_SIZE_FULL,
+            seed=seed
+        )
+
+        # 由共享轮询器等待任务完成
+        output = await get_task_poller().wait(task_id, timeout=settings.IMAGE_GENERATION_TIMEOUT)
+
+        results = [item["url"] for item in output.get("results", []) if item.get("url")]
+        if not results:
+            raise Exception("API返回结果为空")
+        return results
@@ -1,11 +1,110 @@
 import asyncio
 import json
 import os
+import random
 import time
-from typing import List, Dict
-import dashscope
-from dashscope import ImageSynthesis
+from typing import Callable, List, Dict, Optional, Tuple
 from app.core.config import settings
+from app.services.image_providers import PROVIDERS, ImageProvider, create_provider, resolve_provider_name
+from app.services.single_flight import SingleFlight
+from app.services.scheduler import get_upstream_scheduler
+from app.services.circuit_breaker import image_provider_breaker
+from app.services.hedging import Hedger
+from app.services.micro_batcher import MicroBatcher
+from app.services.step_decomposer import StepDecomposer, decomposes_steps
+from app.services.task_poller import get_task_poller
+from app.utils.async_utils import LoopLocal
+from app.utils.deadline import get_abandoned_stats, record_abandoned, run_with_deadline
+from app.utils.prompt_utils import canonicalize_prompt
+
+# 随机种子上限，与通义万相的seed参数范围一致
+MAX_SEED = 2147483647
+
+# 相同生成请求合并执行
+_single_flight = LoopLocal(SingleFlight)
+
+# 单张图像生成的对冲请求，耗时统计为进程级
+_hedger = Hedger(
+    enabled=settings.IMAGE_HEDGING_ENABLED,
+    quantile=settings.IMAGE_HEDGE_QUANTILE,
+    min_samples=settings.IMAGE_HEDGE_MIN_SAMPLES,
+    max_ratio=settings.IMAGE_HEDGE_MAX_RATIO
+)
+
+async def _run_provider_batch(
+    provider: ImageProvider,
+    prompt: str,
+    n: int,
+    size: Optional[str] = None,
+    seed: Optional[int] = None
+) -> List[str]:
+    """
+    用同一提示词生成n张图像，按提供商的单任务上限拆成若干个多图任务
+    每个任务都经过熔断器和对冲请求；指定seed时各任务依次使用不重叠的种子
+    """
+    async def run(start: int, count: int) -> List[str]:
+        task_seed = None if seed is None else seed + start
+        async with image_provider_breaker.guard():
+            return await _hedger.run(
+                lambda: (
+                    provider.generate_batch(prompt, count, size, task_seed) if count > 1
+                    else _as_list(provider.generate(prompt, size, task_seed))
+                ),
+                allow_hedge=get_upstream_scheduler().try_take_token
+            )
+    
+    batch_size = max(1, provider.max_batch_size)
+    chunks = await asyncio.gather(*(run(start, min(batch_size, n - start)) for start in range(0, n, batch_size)))
+    return [url for chunk in chunks for url in chunk]
+
+async def _as_list(awaitable) -> List[str]:
+    return [await awaitable]
+
+async def _run_scheduled_batch(key: Tuple, n: int, user_id: Optional[str]) -> List[Tuple[str, float]]:
+    """
+    执行一个微批次：整个批次只在上游调度器排一次队，占一个令牌和一个并发名额
+    以开启批次的请求的用户排队，返回各图像的URL和排队时间
+    """
+    provider_name, prompt, size, seed, weight = key
+    async with get_upstream_scheduler().slot(user_id, weight) as ticket:
+        wait_time = ticket.wait_time
+        urls = await _run_provider_batch(create_provider(provider_name), prompt, n, size, seed)
+    return [(url, wait_time) for url in urls]
+
+# 相同提示词的并发单图请求在短时间窗口内合并成一个多图任务
+# 键为 (提供商, 提示词, 尺寸, 种子, 调度权重)，指定种子的请求只和同一种子的请求合并，
+# 低权重的后台请求不会把正常请求带进低权重队列
+_micro_batchers = LoopLocal(lambda: MicroBatcher(
+    _run_scheduled_batch,
+    window=settings.IMAGE_BATCH_WINDOW_MS / 1000,
+    max_size=settings.IMAGE_BATCH_MAX_SIZE
+))
+
+def get_batching_stats() -> Dict[str, any]:
+    """
+    获取当前事件循环的微批处理统计
+    """
+    try:
+        return _micro_batchers.get().get_stats()
+    except RuntimeError:
+        return {}
+
+def get_resilience_status() -> Dict[str, any]:
+    """
+    获取熔断器、对冲请求状态和被放弃的工作统计
+    """
+    return {
+        "circuit_breaker": image_provider_breaker.get_state(),
+        "hedging": _hedger.get_stats(),
+        "abandoned": get_abandoned_stats(),
+        "task_poller": _task_poller_stats()
+    }
+
+def _task_poller_stats() -> Dict[str, any]:
+    try:
+        return get_task_poller().get_stats()
+    except RuntimeError:
+        return {}
 
 class ImageService:
     """
@@ -13,120 +112,335 @@ class ImageService:
     支持多种中国文字生成图片服务
     """
     
+    # 支持的风格及对应的提示词
+    STYLE_PROMPTS = {
+        "简笔画": "simple line drawing, minimalist, black and white, clean lines",
+        "卡通": "cartoon style, cute, colorful, child-friendly",
+        "水彩": "watercolor style, soft colors, artistic",
+        "素描": "pencil sketch, hand-drawn, artistic lines"
+    }
+    
     def __init__(self):
         self.provider = self._get_available_provider()
+        self.backend = create_provider(self.provider)
     
     def _get_available_provider(self) -> str:
         """
         根据配置选择可用的图像生成服务提供商
         """
-        if settings.DASHSCOPE_API_KEY and settings.DASHSCOPE_API_KEY.strip():
-            return "tongyi"  # 通义万相
-        else:
-            raise Exception("未配置DASHSCOPE_API_KEY，无法使用图像生成服务")
+        return resolve_provider_name()
     
     async def generate_step_by_step_drawing(
         self, 
         prompt: str, 
         style: str = "简笔画", 
-        steps: int = 4
+        steps: int = 4,
+        on_image: Optional[Callable[[int, str], None]] = None,
+        user_id: Optional[str] = None,
+        quality: str = "full",
+        weight: float = 1.0
     ) -> Dict[str, any]:
         """
         生成分步骤简笔画
+        相同的并发请求只生成一次，共享同一结果；只合并权重相同的请求，
+        正式请求不会加入低权重的后台生成（例如预取）而继承其排队优先级
+        on_image在每张图像完成时回调 (序号, URL)，序号0为最终图像，1..steps为各步骤
+        user_id用于上游调用的公平调度，weight为调度权重，结果中的queue_wait_ms为排队等待时间
+        quality为preview时最终图像使用低分辨率，生成更快，结果中的seed为所用随机种子，
+        之后可用upgrade_to_full以同一种子升级
+        超过请求截止时间或客户端断开时停止等待；没有其他等待者时共享的生成任务随之取消
         """
-        return await self._generate_with_tongyi(prompt, style, steps)
+        key = (canonicalize_prompt(prompt), style, steps, quality, weight)
+        result = await run_with_deadline(_single_flight.get().do(
+            key,
+            lambda publish: self._generate_with_provider(
+                prompt, style, steps,
+                on_image=lambda index, url: publish((index, url)),
+                user_id=user_id,
+                quality=quality,
+                weight=weight
+            ),
+            on_progress=(lambda event: on_image(*event)) if on_image else None
+        ), "图像生成")
+        return {**result, "step_images": list(result["step_images"])}
     
-    async def _generate_with_tongyi(self, prompt: str, style: str, steps: int) -> Dict[str, any]:
+    async def _generate_with_provider(
+        self,
+        prompt: str,
+        style: str,
+        steps: int,
+        on_image: Optional[Callable[[int, str], None]] = None,
+        user_id: Optional[str] = None,
+        quality: str = "full",
+        weight: float = 1.0
+    ) -> Dict[str, any]:
         """
-        使用通义万相生成图像
+        使用当前服务提供商生成图像
+        STEP_MODE为local且是线条画风格时只生成最终图像，步骤图在本地按笔画拆分；
+        其他情况每个步骤单独调用一次服务提供商；步骤图展示尺寸小，始终使用预览分辨率
+        预览使用固定的随机种子，升级时用同一种子重新生成，保证高清图与预览图是同一幅画
         """
         try:
             # 优化提示词
             optimized_prompt = self._optimize_prompt_for_drawing(prompt, style)
+            final_size = settings.IMAGE_SIZE_PREVIEW if quality == "preview" else settings.IMAGE_SIZE_FULL
+            # 留出多图任务依次递增种子的余量
+            seed = random.randint(0, MAX_SEED // 2) if quality == "preview" else None
+            queue_waits: List[float] = []
             
-            # 生成最终完整图像
-            final_image_url = await self._call_tongyi_api(optimized_prompt)
+            if decomposes_steps(style) or steps <= 0:
+                final_url = (await self._generate_images_concurrently(
+                    [optimized_prompt], on_image, user_id, queue_waits, [final_size], weight, seed
+                ))[0]
+                step_urls = await self._generate_steps(
+                    optimized_prompt, final_url, steps,
+                    (lambda index, url: on_image(index + 1, url)) if on_image else None,
+                    user_id, queue_waits, weight, seed
+                )
+            else:
+                # 最终完整图像和分步骤图像并发生成，结果顺序与提示词顺序一致
+                prompts = [optimized_prompt] + self._step_prompts(optimized_prompt, steps)
+                sizes = [final_size] + [settings.IMAGE_SIZE_PREVIEW] * steps
+                image_urls = await self._generate_images_concurrently(
+                    prompts, on_image, user_id, queue_waits, sizes, weight, seed
+                )
+                final_url, step_urls = image_urls[0], image_urls[1:]
             
-            # 生成分步骤图像
-            step_images = []
-            for i in range(steps):
-                step_prompt = f"{optimized_prompt}, step {i+1} of {steps}, progressive drawing"
-                step_url = await self._call_tongyi_api(step_prompt)
-                step_images.append(step_url)
-            
-            return {
-                "final_image_url": final_image_url,
-                "step_images": step_images,
-                "provider": "tongyi"
+            result = {
+                "final_image_url": final_url,
+                "step_images": step_urls,
+                "provider": self.provider,
+                "quality": quality,
+                "queue_wait_ms": round(max(queue_waits, default=0.0) * 1000, 1)
             }
+            if seed is not None:
+                result["seed"] = seed
+            return result
         except Exception as e:
-            print(f"通义万相API调用失败: {e}")
+            print(f"图像生成服务调用失败: {e}")
             raise e
     
-    async def _call_tongyi_api(self, prompt: str) -> str:
+    async def _generate_steps(
+        self,
+        optimized_prompt: str,
+        final_url: str,
+        steps: int,
+        on_image: Optional[Callable[[int, str], None]],
+        user_id: Optional[str],
+        queue_waits: List[float],
+        weight: float = 1.0,
+        seed: Optional[int] = None
+    ) -> List[str]:
         """
-        调用通义万相API生成单张图像
+        从最终图像在本地拆出步骤图，on_image的序号从0开始
         """
+        if steps <= 0:
+            return []
+        
         try:
-            # 设置API密钥
-            dashscope.api_key = settings.DASHSCOPE_API_KEY
-            
-            # 创建异步任务
-            rsp = ImageSynthesis.async_call(
-                model="wan2.2-t2i-flash",  # 使用万相2.2极速版
-                prompt=prompt,
-                n=1,
-                size="1024*1024"
+            step_urls = await StepDecomposer().decompose(final_url, steps, settings.STEP_IMAGE_MAX_SIDE)
+            for index, url in enumerate(step_urls):
+                if on_image is not None:
+                    on_image(index, url)
+            return step_urls
+        except Exception as e:
+            # 拆分失败时退回到逐步骤生成，最终图像不再重复生成
+            print(f"本地步骤拆分失败，改为逐步骤生成: {e}")
+        
+        return await self._generate_images_concurrently(
+            self._step_prompts(optimized_prompt, steps),
+            on_image,
+            user_id,
+            queue_waits,
+            [settings.IMAGE_SIZE_PREVIEW] * steps,
+            weight,
+            seed
+        )
+    
+    async def upgrade_to_full(
+        self,
+        prompt: str,
+        style: str,
+        steps: int,
+        preview_result: Dict[str, any],
+        user_id: Optional[str] = None
+    ) -> Dict[str, any]:
+        """
+        把预览结果升级为全分辨率
+        只重新生成最终图像，使用预览的随机种子，构图与预览一致；
+        本地步骤模式下步骤图从新的最终图像重新拆分，保证与最终图一致
+        升级在后台执行，调度权重较低，不与用户正在等待的请求争抢
+        """
+        optimized_prompt = self._optimize_prompt_for_drawing(prompt, style)
+        queue_waits: List[float] = []
+        weight = settings.IMAGE_UPGRADE_WEIGHT
+        seed = preview_result.get("seed")
+        
+        final_url = (await self._generate_images_concurrently(
+            [optimized_prompt], None, user_id, queue_waits, [settings.IMAGE_SIZE_FULL], weight, seed
+        ))[0]
+        if decomposes_steps(style):
+            step_urls = await self._generate_steps(
+                optimized_prompt, final_url, steps, None, user_id, queue_waits, weight, seed
             )
+        else:
+            step_urls = list(preview_result.get("step_images", []))
+        
+        return {
+            "final_image_url": final_url,
+            "step_images": step_urls,
+            "provider": self.provider,
+            "quality": "full",
+            "preview_image_url": preview_result.get("final_image_url"),
+            "seed": seed
+        }
+    
+    def _step_prompts(self, optimized_prompt: str, steps: int) -> List[str]:
+        """
+        逐步骤生成时各步骤的提示词
+        """
+        return [
+            f"{optimized_prompt}, step {i+1} of {steps}, progressive drawing"
+            for i in range(steps)
+        ]
+    
+    async def _generate_images_concurrently(
+        self,
+        prompts: List[str],
+        on_image: Optional[Callable[[int, str], None]] = None,
+        user_id: Optional[str] = None,
+        queue_waits: Optional[List[float]] = None,
+        sizes: Optional[List[str]] = None,
+        weight: float = 1.0,
+        seed: Optional[int] = None
+    ) -> List[str]:
+        """
+        并发生成多张图像
+        受单请求并发数限制，并由上游调度器按用户公平排队、限速；
+        失败的图像单独重试，已成功的结果保留，每次调用的排队时间追加到queue_waits
+        sizes为各图像的尺寸，默认全分辨率；weight为调度权重，seed为所有图像共用的随机种子
+        """
+        request_semaphore = asyncio.Semaphore(max(1, settings.IMAGE_REQUEST_CONCURRENCY))
+        
+        async def generate(index: int) -> str:
+            async with request_semaphore:
+                url = await self._call_provider(
+                    prompts[index],
+                    sizes[index] if sizes else None,
+                    seed,
+                    user_id=user_id,
+                    weight=weight,
+                    queue_waits=queue_waits
+                )
+            if on_image is not None:
+                on_image(index, url)
+            return url
+        
+        image_urls: List[Optional[str]] = [None] * len(prompts)
+        errors: Dict[int, Exception] = {}
+        pending = list(range(len(prompts)))
+        
+        for attempt in range(settings.IMAGE_MAX_RETRIES + 1):
+            if attempt > 0:
+                print(f"{len(pending)}张图像生成失败，第{attempt}次重试")
             
-            if rsp.status_code != 200:
-                raise Exception(f"API调用失败: {rsp.message}")
-            
-            task_id = rsp.output.task_id
-            
-            # 轮询任务状态直到完成
-            max_wait_time = 60  # 最大等待60秒
-            start_time = time.time()
+            try:
+                outcomes = await asyncio.gather(
+                    *(generate(index) for index in pending),
+                    return_exceptions=True
+                )
+            except asyncio.CancelledError:
+                # 没有等待者了，尚未完成的图像不再生成
+                record_abandoned("cancelled", "图像", sum(url is None for url in image_urls))
+                raise
             
-            while time.time() - start_time < max_wait_time:
-                # 等待1秒后查询状态
-                await asyncio.sleep(1)
-                
-                result = ImageSynthesis.fetch(task_id)
-                
-                if result.status_code == 200:
-                    if result.output.task_status == 'SUCCEEDED':
-                        # 任务成功，返回图像URL
-                        if result.output.results and len(result.output.results) > 0:
-                            return result.output.results[0].url
-                        else:
-                            raise Exception("API返回结果为空")
-                    elif result.output.task_status == 'FAILED':
-                        raise Exception(f"图像生成失败: {result.output.message}")
-                    # 如果状态是PENDING或RUNNING，继续等待
+            failed = []
+            for index, outcome in zip(pending, outcomes):
+                if isinstance(outcome, Exception):
+                    errors[index] = outcome
+                    failed.append(index)
+                elif isinstance(outcome, BaseException):
+                    raise outcome
                 else:
-                    raise Exception(f"查询任务状态失败: {result.message}")
-            
-            # 超时
-            raise Exception("图像生成超时")
+                    image_urls[index] = outcome
             
+            pending = failed
+            if not pending:
+                break
+        
+        if pending:
+            raise Exception(f"{len(pending)}张图像生成失败: {errors[pending[0]]}")
+        
+        return image_urls
+    
+    async def _call_provider(
+        self,
+        prompt: str,
+        size: Optional[str] = None,
+        seed: Optional[int] = None,
+        user_id: Optional[str] = None,
+        weight: float = 1.0,
+        queue_waits: Optional[List[float]] = None
+    ) -> str:
+        """
+        调用服务提供商生成单张图像
+        先由上游调度器按用户公平排队、限速，排队时间追加到queue_waits；
+        服务商持续失败或变慢时由熔断器快速失败；超过历史p95仍未完成时发起对冲请求
+        开启微批处理时，窗口内相同提示词的请求合并成一个多图任务，整个批次只排一次队
+        """
+        try:
+            if settings.IMAGE_BATCH_WINDOW_MS > 0:
+                url, wait_time = await _micro_batchers.get().submit(
+                    (self.provider, prompt, size, seed, weight), user_id
+                )
+            else:
+                async with get_upstream_scheduler().slot(user_id, weight) as ticket:
+                    wait_time = ticket.wait_time
+                    url = (await _run_provider_batch(self.backend, prompt, 1, size, seed))[0]
+            if queue_waits is not None:
+                queue_waits.append(wait_time)
+            return url
         except Exception as e:
-            print(f"通义万相API调用异常: {e}")
+            print(f"图像生成服务调用异常: {e}")
             raise e
     
-
+    async def generate_candidates(
+        self,
+        prompt: str,
+        style: str = "简笔画",
+        n: int = 4,
+        user_id: Optional[str] = None
+    ) -> Dict[str, any]:
+        """
+        为同一提示词生成n张候选图像
+        候选图像用服务提供商的多图任务批量生成，每个任务只排队和轮询一次
+        """
+        optimized_prompt = self._optimize_prompt_for_drawing(prompt, style)
+        scheduler = get_upstream_scheduler()
+        size = max(1, self.backend.max_batch_size)
+        queue_waits: List[float] = []
+        
+        async def run(count: int) -> List[str]:
+            async with scheduler.slot(user_id) as ticket:
+                queue_waits.append(ticket.wait_time)
+                return await _run_provider_batch(self.backend, optimized_prompt, count)
+        
+        chunks = await run_with_deadline(
+            asyncio.gather(*(run(min(size, n - start)) for start in range(0, n, size))),
+            "候选图像生成"
+        )
+        return {
+            "candidates": [url for chunk in chunks for url in chunk],
+            "provider": self.provider,
+            "queue_wait_ms": round(max(queue_waits, default=0.0) * 1000, 1)
+        }
     
     def _optimize_prompt_for_drawing(self, prompt: str, style: str) -> str:
         """
         优化提示词，使其更适合简笔画生成
         """
         # 简笔画风格的提示词优化
-        style_prompts = {
-            "简笔画": "simple line drawing, minimalist, black and white, clean lines",
-            "卡通": "cartoon style, cute, colorful, child-friendly",
-            "水彩": "watercolor style, soft colors, artistic",
-            "素描": "pencil sketch, hand-drawn, artistic lines"
-        }
+        style_prompts = self.STYLE_PROMPTS
         
         base_prompt = f"{prompt}, {style_prompts.get(style, style_prompts['简笔画'])}"
         
@@ -147,22 +461,22 @@ class ImageService:
         """
         获取当前使用的服务提供商信息
         """
-        provider_info = {
-            "tongyi": {
-                "name": "通义万相",
-                "description": "阿里云推出的AI图像生成模型，支持万相2.2极速版",
-                "features": ["中文优化", "高质量生成", "多风格支持", "分步骤生成", "真实API调用"]
-            }
-        }
-        
         return {
             "current_provider": self.provider,
-            "provider_info": provider_info.get(self.provider, {})
+            "provider_info": PROVIDERS[self.provider].info,
+            "available_providers": [name for name, provider in PROVIDERS.items() if provider.is_available()],
+            "micro_batching": get_batching_stats(),
+            **get_resilience_status()
         }
     
-    async def generate_single_image(self, prompt: str, style: str = "简笔画") -> str:
+    async def generate_single_image(
+        self,
+        prompt: str,
+        style: str = "简笔画",
+        user_id: Optional[str] = None
+    ) -> str:
         """
         生成单张图像
         """
         optimized_prompt = self._optimize_prompt_for_drawing(prompt, style)
-        return await self._call_tongyi_api(optimized_prompt)
\ No newline at end of file
+        return await run_with_deadline(self._call_provider(optimized_prompt, user_id=user_id), "图像生成")
\ No newline at end of file
@@ -0,0 +1,284 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.drawing import GenerationJobRecord
+from app.services.asset_store import AssetStore
+from app.services.cache_service import CacheService
+from app.services.dedup_service import ImageDedupService
+from app.services.image_service import ImageService
+from app.services.upgrade_service import schedule_upgrade
+from app.utils.async_utils import LoopLocal
+from app.utils.deadline import detached_context
+
+# 持久化到数据库的任务字段，与GenerationJobRecord的列一致
+_RECORD_FIELDS = (
+    "status", "prompt", "style", "steps", "quality", "user_id", "final_image_url", "step_images",
+    "from_cache", "queue_wait_ms", "error", "created_at", "started_at", "finished_at"
+)
+
+class JobQueueFullError(Exception):
+    """
+    任务队列已满
+    """
+
+class GenerationJob:
+    """
+    一个图像生成任务
+    """
+
+    def __init__(
+        self,
+        prompt: str,
+        style: str,
+        steps: int,
+        user_id: Optional[str] = None,
+        quality: str = "full"
+    ):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.style = style
+        self.steps = steps
+        self.user_id = user_id
+        self.quality = quality
+        self.status = "queued"  # queued / running / succeeded / failed
+        self.final_image_url: Optional[str] = None
+        self.step_images: List[Optional[str]] = [None] * steps
+        self.from_cache = False
+        self.queue_wait_ms = 0.0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @classmethod
+    def from_record(cls, record: GenerationJobRecord) -> "GenerationJob":
+        """
+        从数据库记录恢复任务，用于查询其他进程执行的任务
+        """
+        job = cls(record.prompt, record.style, record.steps, record.user_id, record.quality)
+        job.id = record.id
+        for field in _RECORD_FIELDS:
+            setattr(job, field, getattr(record, field))
+        job.step_images = list(record.step_images or [])
+        return job
+
+    def on_image(self, index: int, url: str):
+        """
+        记录已完成的单张图像（部分结果）
+        """
+        if index == 0:
+            self.final_image_url = url
+        else:
+            self.step_images[index - 1] = url
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "prompt": self.prompt,
+            "style": self.style,
+            "steps": self.steps,
+            "quality": self.quality,
+            "final_image_url": self.final_image_url,
+            "step_images": self.step_images,
+            "completed_images": sum(url is not None for url in [self.final_image_url, *self.step_images]),
+            "from_cache": self.from_cache,
+            "queue_wait_ms": self.queue_wait_ms,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class JobManager:
+    """
+    异步图像生成任务管理
+    请求只负责入队，固定数量的后台worker从有界队列中取任务执行，
+    结果保留一段时间供查询
+    任务状态和部分结果同时写入数据库，多进程部署时任一进程都能查询到其他进程执行的任务；
+    队列和worker仍在提交任务的进程内，该进程退出时未完成的任务保持原状态直到过期
+    """
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.JOB_QUEUE_MAX_SIZE))
+        self.jobs: "OrderedDict[str, GenerationJob]" = OrderedDict()
+        self.workers: List[asyncio.Task] = []
+
+    def submit(
+        self,
+        prompt: str,
+        style: str,
+        steps: int,
+        user_id: Optional[str] = None,
+        quality: str = "full"
+    ) -> GenerationJob:
+        """
+        提交任务，队列已满时抛出JobQueueFullError
+        """
+        self._purge()
+        job = GenerationJob(prompt, style, steps, user_id, quality)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError("生成任务过多，请稍后再试")
+
+        self.jobs[job.id] = job
+        self._save(job)
+        self._ensure_workers()
+        return job
+
+    def get(self, job_id: str) -> Optional[GenerationJob]:
+        """
+        查询任务，本进程中没有时从数据库读取
+        """
+        self._purge()
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+
+        db = SessionLocal()
+        try:
+            record = db.query(GenerationJobRecord).filter(GenerationJobRecord.id == job_id).first()
+            if record is None or self._expired(record):
+                return None
+            return GenerationJob.from_record(record)
+        finally:
+            db.close()
+
+    def _save(self, job: GenerationJob, purge: bool = False):
+        """
+        把任务状态写入数据库，失败只记录日志，不影响任务执行
+        purge为True时顺便删除已过期的任务记录
+        """
+        db = SessionLocal()
+        try:
+            if purge:
+                db.query(GenerationJobRecord).filter(
+                    GenerationJobRecord.finished_at < time.time() - settings.JOB_RESULT_TTL_SECONDS
+                ).delete(synchronize_session=False)
+            record = GenerationJobRecord(id=job.id)
+            for field in _RECORD_FIELDS:
+                setattr(record, field, getattr(job, field))
+            record.step_images = list(job.step_images)
+            db.merge(record)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"保存生成任务状态失败: {str(e)}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _expired(record: GenerationJobRecord) -> bool:
+        return (
+            record.finished_at is not None
+            and record.finished_at < time.time() - settings.JOB_RESULT_TTL_SECONDS
+        )
+
+    def _purge(self):
+        """
+        清理超过保留时间或超出数量上限的已结束任务
+        """
+        expire_before = time.time() - settings.JOB_RESULT_TTL_SECONDS
+        finished = [
+            job for job in self.jobs.values()
+            if job.finished_at is not None
+        ]
+        overflow = len(self.jobs) - settings.JOB_MAX_RETAINED
+        for job in finished:
+            if job.finished_at < expire_before or overflow > 0:
+                del self.jobs[job.id]
+                overflow -= 1
+
+    def _ensure_workers(self):
+        """
+        按需启动worker
+        """
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        loop = asyncio.get_running_loop()
+        while len(self.workers) < max(1, settings.JOB_WORKERS):
+            self.workers.append(loop.create_task(self._worker(), context=detached_context()))
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: GenerationJob):
+        """
+        执行单个任务，先查缓存，未命中再生成
+        预览质量的结果不写入缓存，高清图在后台生成后写入缓存
+        """
+        job.status = "running"
+        job.started_at = time.time()
+        self._save(job)
+        db = SessionLocal()
+        try:
+            cache_service = CacheService(db)
+            result = await cache_service.get_image_generation_cache(job.prompt, job.style, job.steps)
+            if result:
+                job.from_cache = True
+                job.quality = "full"
+            else:
+                result = await ImageService().generate_step_by_step_drawing(
+                    prompt=job.prompt,
+                    style=job.style,
+                    steps=job.steps,
+                    on_image=lambda index, url: self._on_image(job, index, url),
+                    user_id=job.user_id,
+                    quality=job.quality
+                )
+                job.queue_wait_ms = result.get("queue_wait_ms", 0.0)
+                result = await AssetStore().localize_result(result)
+                if job.quality == "preview":
+                    schedule_upgrade(job.prompt, job.style, job.steps, result, job.user_id)
+                else:
+                    result = await ImageDedupService(db).deduplicate_result(result, job.prompt, job.style, job.steps)
+                    await cache_service.set_image_generation_cache(job.prompt, job.style, job.steps, result)
+
+            job.final_image_url = result["final_image_url"]
+            job.step_images = list(result["step_images"])
+            job.status = "succeeded"
+        except Exception as e:
+            job.error = f"图像生成失败: {str(e)}"
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            db.close()
+            self._save(job, purge=True)
+
+    def _on_image(self, job: GenerationJob, index: int, url: str):
+        """
+        记录部分结果并写入数据库
+        """
+        job.on_image(index, url)
+        self._save(job)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取队列统计信息
+        """
+        statuses: Dict[str, int] = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "workers": len(self.workers),
+            "jobs": statuses
+        }
+
+_job_managers = LoopLocal(JobManager)
+
+def get_job_manager() -> JobManager:
+    """
+    获取当前事件循环的任务管理器
+    """
+    return _job_managers.get()
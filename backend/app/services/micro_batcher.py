@@ -0,0 +1,114 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from app.utils.deadline import detached_context
+
+class _Batch:
+    """
+    一个正在收集请求的批次
+    """
+
+    def __init__(self, owner: Any):
+        self.owner = owner
+        self.waiters: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.task: Optional[asyncio.Task] = None
+
+class MicroBatcher:
+    """
+    微批处理
+    短时间窗口内相同键的并发请求合并成一次批量调用，每个请求分到结果中的一项；
+    批次达到上限时立即执行，所有请求都取消后批量调用才会被取消
+    批量调用收到开启批次的请求提供的owner，例如用它以该请求的身份排队
+    """
+
+    def __init__(
+        self,
+        func: Callable[[Hashable, int, Any], Awaitable[List[Any]]],
+        window: float,
+        max_size: int
+    ):
+        self.func = func
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._batches: Dict[Hashable, _Batch] = {}
+        self.requests = 0
+        self.batches = 0
+
+    async def submit(self, key: Hashable, owner: Any = None) -> Any:
+        """
+        加入键对应的批次，等待分到的结果
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = _Batch(owner)
+            self._batches[key] = batch
+            batch.timer = loop.call_later(self.window, self._flush, key, batch)
+
+        waiter = loop.create_future()
+        batch.waiters.append(waiter)
+        self.requests += 1
+        if len(batch.waiters) >= self.max_size:
+            self._flush(key, batch)
+
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if batch.task is not None and all(w.cancelled() for w in batch.waiters):
+                batch.task.cancel()
+            raise
+
+    def _flush(self, key: Hashable, batch: _Batch):
+        """
+        结束收集并执行批量调用
+        """
+        if self._batches.get(key) is not batch:
+            return
+        del self._batches[key]
+        batch.timer.cancel()
+
+        waiters = [waiter for waiter in batch.waiters if not waiter.done()]
+        batch.waiters = waiters
+        if not waiters:
+            return
+
+        self.batches += 1
+        batch.task = asyncio.get_running_loop().create_task(
+            self.func(key, len(waiters), batch.owner), context=detached_context()
+        )
+        batch.task.add_done_callback(lambda task: self._distribute(batch, task))
+
+    def _distribute(self, batch: _Batch, task: asyncio.Task):
+        """
+        把批量结果依次分给各请求，结果不足时剩下的请求收到异常
+        """
+        if task.cancelled():
+            error: BaseException = asyncio.CancelledError()
+            results: List[Any] = []
+        elif task.exception() is not None:
+            error = task.exception()
+            results = []
+        else:
+            results = list(task.result())
+            error = Exception("批量任务返回的结果数量不足")
+
+        for waiter in batch.waiters:
+            if waiter.done():
+                continue
+            if results:
+                waiter.set_result(results.pop(0))
+            elif isinstance(error, asyncio.CancelledError):
+                waiter.cancel()
+            else:
+                waiter.set_exception(error)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取批处理统计信息
+        """
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "collecting": len(self._batches),
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0
+        }
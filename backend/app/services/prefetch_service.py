@@ -0,0 +1,202 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.asset_store import AssetStore
+from app.services.cache_service import CacheService
+from app.services.dedup_service import ImageDedupService
+from app.services.image_service import ImageService
+from app.services.scheduler import get_upstream_scheduler
+from app.utils.async_utils import LoopLocal
+from app.utils.deadline import detached_context
+from app.utils.prompt_utils import canonicalize_prompt
+
+# 所有预取共用的调度标识：预取作为一个低权重的整体参与公平调度，不占用户自己的份额
+PREFETCH_SCHEDULING_USER = "prefetch"
+
+class _Prefetch:
+    """
+    一个正在执行的预取
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.task: Optional[asyncio.Task] = None
+
+# 正在执行的预取：生成参数 -> _Prefetch
+_pending = LoopLocal(dict)
+
+# 每个用户最近一次预取的生成参数，用户继续输入后之前的预取被取代
+_latest_by_user = LoopLocal(dict)
+
+# 已完成、尚未被真实请求使用的预取：生成参数 -> 完成时间
+_completed: "OrderedDict[Hashable, float]" = OrderedDict()
+
+# 预取统计
+_prefetch_counters = {
+    "requested": 0,
+    "scheduled": 0,
+    "cached": 0,  # 结果已在缓存中，不需要预取
+    "coalesced": 0,  # 相同参数的预取已在进行
+    "dropped": 0,  # 上游繁忙或预取数达到上限时丢弃
+    "superseded": 0,  # 用户继续输入，未完成的预取被取消
+    "completed": 0,
+    "failed": 0,
+    "hits": 0,  # 预取完成后被真实请求使用
+    "overtaken": 0,  # 真实请求到达时预取仍在进行，预取被取消，由真实请求按正常优先级生成
+    "wasted": 0  # 完成后超过PREFETCH_HIT_WINDOW_SECONDS仍未被使用
+}
+
+def _prefetch_key(prompt: str, style: str, steps: int) -> Hashable:
+    return (canonicalize_prompt(prompt), style, steps)
+
+def _under_load() -> bool:
+    """
+    上游调度器有排队、令牌不足或并发占用超过PREFETCH_MAX_LOAD时视为繁忙
+    """
+    scheduler = get_upstream_scheduler()
+    stats = scheduler.get_stats()
+    return (
+        stats["queued"] > 0
+        or stats["tokens"] < 1
+        or stats["running"] >= scheduler.max_concurrency * settings.PREFETCH_MAX_LOAD
+    )
+
+def _sweep():
+    """
+    把超过使用窗口仍未被使用的预取结果计为浪费
+    """
+    deadline = time.monotonic() - settings.PREFETCH_HIT_WINDOW_SECONDS
+    while _completed:
+        key, finished_at = next(iter(_completed.items()))
+        if finished_at > deadline:
+            break
+        del _completed[key]
+        _prefetch_counters["wasted"] += 1
+
+async def schedule_prefetch(
+    db: Session,
+    prompt: str,
+    style: str,
+    steps: int,
+    user_id: str
+) -> str:
+    """
+    以低优先级在后台预先生成图像，结果写入图像生成缓存
+    返回 scheduled / in_flight / cached / dropped；同一用户的新预取会取消其之前未完成的预取
+    """
+    _prefetch_counters["requested"] += 1
+    _sweep()
+    key = _prefetch_key(prompt, style, steps)
+    pending: Dict[Hashable, _Prefetch] = _pending.get()
+    latest: Dict[str, Hashable] = _latest_by_user.get()
+
+    if key in pending:
+        _prefetch_counters["coalesced"] += 1
+        latest[user_id] = key
+        return "in_flight"
+
+    if await CacheService(db).get_image_generation_cache(prompt, style, steps, record_stats=False):
+        _prefetch_counters["cached"] += 1
+        return "cached"
+
+    _cancel_superseded(user_id)
+    if len(pending) >= settings.PREFETCH_MAX_PENDING or _under_load():
+        _prefetch_counters["dropped"] += 1
+        return "dropped"
+
+    prefetch = _Prefetch(user_id)
+    pending[key] = prefetch
+    latest[user_id] = key
+    prefetch.task = asyncio.get_running_loop().create_task(
+        _run_prefetch(key, prefetch, prompt, style, steps),
+        context=detached_context()
+    )
+    _prefetch_counters["scheduled"] += 1
+    return "scheduled"
+
+def _cancel_superseded(user_id: str):
+    """
+    取消用户之前未完成的预取
+    """
+    key = _latest_by_user.get().pop(user_id, None)
+    prefetch = _pending.get().get(key)
+    if prefetch is None or prefetch.user_id != user_id:
+        return
+    prefetch.task.cancel()
+    _prefetch_counters["superseded"] += 1
+
+async def _run_prefetch(key: Hashable, prefetch: _Prefetch, prompt: str, style: str, steps: int):
+    try:
+        result = await ImageService().generate_step_by_step_drawing(
+            prompt=prompt,
+            style=style,
+            steps=steps,
+            user_id=PREFETCH_SCHEDULING_USER,
+            weight=settings.PREFETCH_WEIGHT
+        )
+        result = await AssetStore().localize_result(result)
+
+        db = SessionLocal()
+        try:
+            result = await ImageDedupService(db).deduplicate_result(result, prompt, style, steps)
+            await CacheService(db).set_image_generation_cache(prompt, style, steps, result)
+        finally:
+            db.close()
+
+        _prefetch_counters["completed"] += 1
+        _completed[key] = time.monotonic()
+        _completed.move_to_end(key)
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        _prefetch_counters["failed"] += 1
+        print(f"预取图像生成失败: {e}")
+    finally:
+        pending = _pending.get()
+        if pending.get(key) is prefetch:
+            del pending[key]
+        latest = _latest_by_user.get()
+        if latest.get(prefetch.user_id) == key:
+            del latest[prefetch.user_id]
+
+def record_prefetch_use(prompt: str, style: str, steps: int):
+    """
+    真实生成请求到达时调用，统计预取命中
+    预取已完成时结果在缓存中；仍在进行时取消预取，由真实请求按正常权重重新生成，
+    不让用户正在等待的请求排在预取的低权重队列里
+    """
+    _sweep()
+    key = _prefetch_key(prompt, style, steps)
+    if _completed.pop(key, None) is not None:
+        _prefetch_counters["hits"] += 1
+        return
+    try:
+        prefetch = _pending.get().get(key)
+    except RuntimeError:
+        return
+    if prefetch is not None:
+        prefetch.task.cancel()
+        _prefetch_counters["overtaken"] += 1
+
+def get_prefetch_stats() -> Dict[str, float]:
+    """
+    获取预取统计信息
+    hit_rate为被使用的预取占已完成预取的比例，waste_rate为超过使用窗口仍未被使用的比例
+    """
+    _sweep()
+    completed = _prefetch_counters["completed"]
+    try:
+        pending = len(_pending.get())
+    except RuntimeError:
+        pending = 0
+    return {
+        **_prefetch_counters,
+        "pending": pending,
+        "awaiting_use": len(_completed),
+        "hit_rate": round(_prefetch_counters["hits"] / completed, 3) if completed else 0.0,
+        "waste_rate": round(_prefetch_counters["wasted"] / completed, 3) if completed else 0.0
+    }
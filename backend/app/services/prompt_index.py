@@ -0,0 +1,109 @@
+import random
+import zlib
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+from app.utils.prompt_utils import prompt_shingles, same_content
+
+# 大于32位哈希值的梅森素数
+_PRIME = (1 << 61) - 1
+
+class PromptIndex:
+    """
+    提示词近似重复索引
+    基于字符n-gram的MinHash签名和LSH分桶，查找与新提示词相似的已缓存提示词
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, max_entries: int = 10000, seed: int = 1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm必须是bands的整数倍")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+
+        # 每个排列对应一个 (a*x + b) mod p 哈希函数
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+        # 条目：(分组, 规范化提示词) -> 特征集合和签名
+        self._entries: "OrderedDict[Tuple[Hashable, str], Tuple[Set[str], List[int]]]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[Tuple[Hashable, str]]] = {}
+
+    def _signature(self, shingles: Set[str]) -> List[int]:
+        """
+        计算MinHash签名
+        """
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+        if not hashes:
+            return [_PRIME] * self.num_perm
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms]
+
+    def _band_keys(self, signature: List[int]):
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def add(self, group: Hashable, text: str):
+        """
+        添加一个规范化提示词
+        group用于隔离风格、步骤数等必须完全一致的参数
+        """
+        entry_key = (group, text)
+        if entry_key in self._entries:
+            self._entries.move_to_end(entry_key)
+            return
+
+        shingles = prompt_shingles(text)
+        signature = self._signature(shingles)
+        self._entries[entry_key] = (shingles, signature)
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(entry_key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_key: Tuple[Hashable, str]):
+        _, signature = self._entries.pop(entry_key)
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is None:
+                continue
+            bucket.discard(entry_key)
+            if not bucket:
+                del self._buckets[band_key]
+
+    def discard(self, group: Hashable, text: str):
+        """
+        移除提示词（对应缓存已失效时）
+        """
+        if (group, text) in self._entries:
+            self._remove((group, text))
+
+    def find_similar(self, group: Hashable, text: str, threshold: float) -> Optional[Tuple[str, float]]:
+        """
+        查找同组内最相似的提示词，返回 (提示词, 相似度)，低于阈值时返回None
+        实词不同的提示词（例如主体不同）即使字面相似也不匹配
+        """
+        shingles = prompt_shingles(text)
+        signature = self._signature(shingles)
+
+        candidates: Set[Tuple[Hashable, str]] = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+
+        best: Optional[Tuple[str, float]] = None
+        for entry_key in candidates:
+            entry_group, entry_text = entry_key
+            if entry_group != group or not same_content(text, entry_text):
+                continue
+            # LSH只负责召回，最终按精确Jaccard相似度判断
+            entry_shingles, _ = self._entries[entry_key]
+            union = len(shingles | entry_shingles)
+            similarity = len(shingles & entry_shingles) / union if union else 0.0
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (entry_text, similarity)
+
+        return best
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,206 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from app.core.config import settings
+from app.utils.async_utils import LoopLocal
+
+class Ticket:
+    """
+    一次上游调用的排队凭证
+    """
+
+    def __init__(self, user_id: str, finish_tag: float, future: asyncio.Future):
+        self.user_id = user_id
+        self.finish_tag = finish_tag
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+
+    @property
+    def wait_time(self) -> float:
+        """
+        排队等待时间（秒）
+        """
+        end = self.granted_at if self.granted_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+class UpstreamScheduler:
+    """
+    上游调用调度器
+    - 全局令牌桶：限制每秒提交的上游任务数，匹配服务商的QPS配额
+    - 全局并发上限和每用户并发上限
+    - 加权公平排队：各用户按虚拟完成时间轮流获得调用机会，
+      一个用户连续提交大量请求也不会饿死其他用户
+    """
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int, user_max_concurrency: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.max_concurrency = max(1, max_concurrency)
+        self.user_max_concurrency = max(1, user_max_concurrency)
+
+        self._queues: Dict[str, Deque[Ticket]] = {}
+        self._running: Dict[str, int] = {}
+        self._last_finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._total_running = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.granted = 0
+        self.total_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str], weight: float = 1.0) -> AsyncIterator[Ticket]:
+        """
+        获取一次上游调用机会，退出上下文时释放
+        """
+        ticket = await self.acquire(user_id, weight)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, user_id: Optional[str], weight: float = 1.0) -> Ticket:
+        """
+        排队等待一次上游调用机会
+        """
+        user_id = user_id or "anonymous"
+        loop = asyncio.get_running_loop()
+
+        # 自计时公平排队：虚拟完成时间 = max(系统虚拟时间, 该用户上一个完成时间) + 1/权重
+        start_tag = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        finish_tag = start_tag + 1.0 / max(weight, 1e-6)
+        self._last_finish[user_id] = finish_tag
+
+        ticket = Ticket(user_id, finish_tag, loop.create_future())
+        self._queues.setdefault(user_id, deque()).append(ticket)
+        self._dispatch()
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.granted_at is not None:
+                # 已经分配但调用方放弃了
+                self.release(ticket)
+            else:
+                self._remove(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """
+        释放调用机会
+        """
+        if ticket.granted_at is None:
+            return
+        ticket.granted_at = None
+        self._running[ticket.user_id] -= 1
+        if self._running[ticket.user_id] == 0:
+            del self._running[ticket.user_id]
+        self._total_running -= 1
+        self._dispatch()
+
+    def _remove(self, ticket: Ticket):
+        queue = self._queues.get(ticket.user_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.user_id]
+        self._dispatch()
+
+    def try_take_token(self) -> bool:
+        """
+        不排队地取一个令牌，用于对冲等额外调用；令牌不足时返回False
+        """
+        self._refill()
+        if self.tokens < 1 or self._queues:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def _dispatch(self):
+        """
+        按公平顺序分配调用机会，直到没有令牌、达到并发上限或队列为空
+        """
+        while self._queues and self._total_running < self.max_concurrency:
+            # 在未达到并发上限的用户中，选虚拟完成时间最小的队首
+            candidates = [
+                queue[0] for user_id, queue in self._queues.items()
+                if self._running.get(user_id, 0) < self.user_max_concurrency
+            ]
+            if not candidates:
+                return
+
+            self._refill()
+            if self.tokens < 1:
+                self._schedule_refill()
+                return
+
+            ticket = min(candidates, key=lambda t: t.finish_tag)
+            queue = self._queues[ticket.user_id]
+            queue.popleft()
+            if not queue:
+                del self._queues[ticket.user_id]
+
+            self.tokens -= 1
+            self._virtual_time = max(self._virtual_time, ticket.finish_tag - 1e-9)
+            ticket.granted_at = time.monotonic()
+            self._running[ticket.user_id] = self._running.get(ticket.user_id, 0) + 1
+            self._total_running += 1
+            self.granted += 1
+            self.total_wait += ticket.wait_time
+            ticket.future.set_result(None)
+
+        if not self._queues:
+            # 所有用户都空闲时重置虚拟时间，避免浮点数无限增长
+            if self._total_running == 0:
+                self._virtual_time = 0.0
+                self._last_finish.clear()
+
+    def _schedule_refill(self):
+        if self._timer is not None:
+            return
+        delay = (1 - self.tokens) / self.rate if self.rate > 0 else 1.0
+
+        def on_timer():
+            self._timer = None
+            self._dispatch()
+
+        self._timer = asyncio.get_running_loop().call_later(delay, on_timer)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取调度统计信息
+        """
+        self._refill()
+        return {
+            "tokens": round(self.tokens, 2),
+            "rate": self.rate,
+            "running": self._total_running,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "queued_users": len(self._queues),
+            "granted": self.granted,
+            "avg_wait_ms": round(self.total_wait / self.granted * 1000, 1) if self.granted else 0.0
+        }
+
+_schedulers = LoopLocal(lambda: UpstreamScheduler(
+    rate=settings.UPSTREAM_RATE_LIMIT_QPS,
+    burst=settings.UPSTREAM_RATE_BURST,
+    max_concurrency=settings.IMAGE_GLOBAL_CONCURRENCY,
+    user_max_concurrency=settings.USER_MAX_CONCURRENCY
+))
+
+def get_upstream_scheduler() -> UpstreamScheduler:
+    """
+    获取当前事件循环的上游调度器
+    """
+    return _schedulers.get()
@@ -0,0 +1,93 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from app.utils.deadline import detached_context
+
+class _Call:
+    """
+    一次正在执行的共享调用
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # 执行过程中发布的进度事件，后加入的等待者会先收到已发布的事件
+        self.events: List[Any] = []
+        self.listeners: List[Callable[[Any], None]] = []
+
+    def publish(self, event: Any):
+        """
+        发布进度事件
+        """
+        self.events.append(event)
+        for listener in list(self.listeners):
+            listener(event)
+
+class SingleFlight:
+    """
+    合并相同键的并发调用
+    第一个请求启动共享任务，后续相同请求只等待该任务；
+    异常会传递给所有等待者，所有等待者都取消后共享任务才会被取消
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(
+        self,
+        key: Hashable,
+        func: Callable[[Callable[[Any], None]], Awaitable[Any]],
+        on_progress: Optional[Callable[[Any], None]] = None
+    ) -> Any:
+        """
+        执行或加入键对应的共享调用
+        func接收一个发布函数，用于向所有等待者广播进度；on_progress接收广播的进度
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call()
+            # 共享任务不受发起者所在请求的截止时间限制，每个等待者各自按自己的截止时间放弃等待
+            call.task = asyncio.get_running_loop().create_task(func(call.publish), context=detached_context())
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        if on_progress is not None:
+            for event in call.events:
+                on_progress(event)
+            call.listeners.append(on_progress)
+
+        call.waiters += 1
+        try:
+            # shield保证某个等待者断开时不会取消其他人依赖的任务
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # 最后一个等待者也离开了，停止共享任务
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+            if on_progress is not None:
+                call.listeners.remove(on_progress)
+
+    def _forget(self, key: Hashable, call: _Call):
+        """
+        移除已结束的共享调用
+        """
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        获取合并统计信息
+        """
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
@@ -6,6 +6,9 @@ import os
 from typing import Optional
 from http import HTTPStatus
 from app.core.config import settings
+from app.services.dashscope_client import get_dashscope_client
+from app.services.hot_prompts import record_prompt
+from app.utils.deadline import run_with_deadline
 import requests
 import dashscope
 
@@ -34,11 +37,14 @@ class SpeechService:
         语音识别主方法
         """
         if self.provider == "xfyun":
-            return await self._recognize_with_xfyun(audio_content)
+            text = await self._recognize_with_xfyun(audio_content)
         elif self.provider == "aliyun":
-            return await self._recognize_with_aliyun(audio_content)
+            text = await self._recognize_with_aliyun(audio_content)
         else:
             raise Exception(f"不支持的语音识别提供商: {self.provider}")
+        
+        record_prompt(text)
+        return text
     
     async def _recognize_with_xfyun(self, audio_content: bytes) -> str:
         """
@@ -48,6 +54,22 @@ class SpeechService:
         raise Exception("讯飞语音识别功能尚未实现，请使用阿里云语音识别服务")
     
     async def _recognize_with_aliyun(self, audio_content: bytes) -> str:
+        """
+        使用阿里云语音识别
+        同步SDK调用放到DashScope客户端的线程池中执行，避免阻塞事件循环；
+        超过请求截止时间或客户端断开时不再等待识别结果
+        """
+        client = get_dashscope_client()
+        try:
+            return await run_with_deadline(
+                client.run_blocking(self._recognize_with_aliyun_sync, audio_content),
+                "语音识别",
+                timeout=settings.DASHSCOPE_SPEECH_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            raise Exception("语音识别超时")
+    
+    def _recognize_with_aliyun_sync(self, audio_content: bytes) -> str:
         """
         使用阿里云语音识别 - Paraformer模型（同步调用方式）
         """
@@ -0,0 +1,121 @@
+import asyncio
+import io
+import math
+from typing import List, Optional
+from app.core.config import settings
+from app.services.asset_store import AssetStore
+from app.services.dashscope_client import get_dashscope_client
+from app.services.derivative_service import get_image_process_pool
+from app.utils.image_utils import ink_mask, label_strokes, stroke_order
+
+# 连通区域分析使用的最长边像素
+LABEL_GRID_SIZE = 256
+
+def decomposes_steps(style: Optional[str]) -> bool:
+    """
+    该风格的步骤图是否在本地从最终图像拆出，只有线条画风格才拆
+    """
+    return settings.STEP_MODE == "local" and style in settings.STEP_LOCAL_STYLES
+
+def _render_steps(data: bytes, steps: int, max_side: Optional[int] = None) -> List[bytes]:
+    """
+    在子进程中把最终图像拆成逐步叠加的步骤图，返回各步骤的PNG数据
+    max_side限制步骤图的最长边，步骤图展示尺寸较小，不需要和最终图一样大
+    按连通区域（笔画）排序：面积大的轮廓先画，同等情况下从上到下、从左到右；
+    区域数不足步骤数时，在区域内按从上到下的顺序逐步显示；最后一步就是（缩放后的）最终图像
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        image = source.convert("RGB")
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    rgb = np.asarray(image)
+    gray = np.asarray(Image.fromarray(rgb).convert("L"))
+    mask = ink_mask(gray)
+
+    labels = label_strokes(mask, LABEL_GRID_SIZE)
+
+    ink_rows, ink_cols = np.nonzero(mask)
+    ink_labels = labels[ink_rows, ink_cols]
+    if ink_labels.size == 0:
+        blank = _encode_png(np.full_like(rgb, 255))
+        return [blank] * (steps - 1) + [_encode_png(rgb)]
+
+    # 每个区域的面积和重心，决定绘制顺序
+    unique, inverse, areas, order = stroke_order(ink_labels, ink_rows, ink_cols)
+    position = np.empty_like(order)
+    position[order] = np.arange(order.size)
+
+    # 像素的显示顺序：先按区域顺序，区域内从上到下
+    pixel_order = np.lexsort((ink_cols, ink_rows, position[inverse]))
+    total = pixel_order.size
+
+    if unique.size >= steps:
+        # 区域足够多时只在区域边界切分，保证每一步都是完整的笔画
+        boundaries = np.cumsum(areas[order])
+        cuts = []
+        for step in range(1, steps + 1):
+            target = total * step / steps
+            index = max(int(np.searchsorted(boundaries, target - 1e-9)), step - 1)
+            cuts.append(int(boundaries[min(index, boundaries.size - 1)]))
+        cuts[-1] = total
+    else:
+        cuts = [math.ceil(total * step / steps) for step in range(1, steps + 1)]
+
+    results = []
+    for cut in cuts[:-1]:
+        canvas = np.full_like(rgb, 255)
+        revealed = pixel_order[:cut]
+        canvas[ink_rows[revealed], ink_cols[revealed]] = rgb[ink_rows[revealed], ink_cols[revealed]]
+        results.append(_encode_png(canvas))
+    # 阈值以下的浅色像素和色块不属于笔画，最后一步直接使用完整图像，保证与最终图一致
+    results.append(_encode_png(rgb))
+    return results
+
+def _encode_png(pixels) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+class StepDecomposer:
+    """
+    本地步骤分解
+    只生成最终图像，再按笔画拆出逐步叠加的步骤图，每一步都是最终图像的一部分
+    """
+
+    def __init__(self, asset_store: Optional[AssetStore] = None):
+        self.asset_store = asset_store or AssetStore()
+
+    async def decompose(self, image_url: str, steps: int, max_side: Optional[int] = None) -> List[str]:
+        """
+        把最终图像拆成steps张步骤图，返回步骤图URL（保存在本地资源存储中）
+        """
+        data = await self._load(image_url)
+        loop = asyncio.get_running_loop()
+        images = await loop.run_in_executor(get_image_process_pool(), _render_steps, data, steps, max_side)
+
+        names = await asyncio.gather(*(
+            asyncio.to_thread(self.asset_store.put_bytes, image, "png")
+            for image in images
+        ))
+        return [self.asset_store.url_for(name) for name in names]
+
+    async def _load(self, image_url: str) -> bytes:
+        """
+        读取图像数据，本地资源直接读文件，远程图像下载
+        """
+        name = self.asset_store.name_from_url(image_url)
+        if name:
+            return await asyncio.to_thread(self._read_file, self.asset_store.path_for(name))
+        data, _ = await get_dashscope_client().download(image_url)
+        return data
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
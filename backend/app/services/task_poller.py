@@ -0,0 +1,216 @@
+import asyncio
+from typing import Any, Dict, Optional, Set
+from app.core.config import settings
+from app.services.dashscope_client import get_dashscope_client
+from app.utils.async_utils import LoopLocal
+
+class _PendingTask:
+    """
+    轮询器中等待完成的单个任务
+    """
+
+    def __init__(self, task_id: str, future: asyncio.Future, submitted_at: float, deadline: float, first_poll_at: float):
+        self.task_id = task_id
+        self.future = future
+        self.submitted_at = submitted_at
+        self.deadline = deadline
+        self.next_poll_at = first_poll_at
+        self.polls = 0
+        self.errors = 0
+        self.polling = False  # 状态查询正在进行
+
+class TaskPoller:
+    """
+    进程级异步任务轮询器
+    统一持有所有未完成的任务ID，按自适应退避间隔查询状态，
+    任务完成后解析对应的Future，调用方只需等待Future
+    """
+
+    # 连续查询失败达到该次数后判定任务失败
+    MAX_CONSECUTIVE_ERRORS = 3
+
+    def __init__(self, client=None):
+        self.client = client or get_dashscope_client()
+        self._pending: Dict[str, _PendingTask] = {}
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+
+        # 观测到的任务完成耗时（指数滑动平均），用于决定首次查询时间
+        self.estimated_duration = settings.TASK_POLL_INITIAL_ESTIMATE
+        self.total_polls = 0
+        self.completed_tasks = 0
+        self.abandoned_tasks = 0
+        self._cancellations: Set[asyncio.Task] = set()
+        # 正在进行的状态查询，每个查询独立执行，慢查询不会阻塞其他任务的轮询节奏
+        self._polls: Set[asyncio.Task] = set()
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        等待任务成功完成，返回任务output
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        timeout = timeout or settings.IMAGE_GENERATION_TIMEOUT
+
+        future = loop.create_future()
+        first_poll_at = now + max(
+            settings.TASK_POLL_MIN_INTERVAL,
+            self.estimated_duration * settings.TASK_POLL_FIRST_POLL_RATIO
+        )
+        self._pending[task_id] = _PendingTask(task_id, future, now, now + timeout, first_poll_at)
+
+        self._wakeup.set()
+        if self._runner is None or self._runner.done():
+            self._runner = loop.create_task(self._run())
+
+        # 调用方被取消时Future随之取消，轮询器丢弃该任务并尝试取消上游任务
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self._wakeup.set()
+            raise
+
+    def _next_interval(self, task: _PendingTask) -> float:
+        """
+        计算下一次查询间隔（指数退避）
+        """
+        interval = settings.TASK_POLL_MIN_INTERVAL * (settings.TASK_POLL_BACKOFF ** task.polls)
+        return min(interval, settings.TASK_POLL_MAX_INTERVAL)
+
+    def _record_duration(self, duration: float):
+        """
+        更新任务完成耗时估计
+        """
+        self.estimated_duration = 0.8 * self.estimated_duration + 0.2 * duration
+        self.completed_tasks += 1
+
+    async def _poll(self, task: _PendingTask, now: float):
+        """
+        查询单个任务状态
+        """
+        task.polls += 1
+        self.total_polls += 1
+
+        try:
+            output = await self.client.fetch_task(task.task_id)
+            task.errors = 0
+        except Exception as e:
+            task.errors += 1
+            if task.errors >= self.MAX_CONSECUTIVE_ERRORS:
+                self._finish(task, error=Exception(f"查询任务状态失败: {e}"))
+            else:
+                task.next_poll_at = now + self._next_interval(task)
+            return
+
+        task_status = output.get("task_status")
+        if task_status == "SUCCEEDED":
+            self._record_duration(asyncio.get_running_loop().time() - task.submitted_at)
+            self._finish(task, result=output)
+        elif task_status in ("FAILED", "CANCELED", "UNKNOWN"):
+            self._finish(task, error=Exception(f"图像生成失败: {output.get('message', task_status)}"))
+        else:
+            # PENDING或RUNNING，按退避间隔再次查询
+            task.next_poll_at = now + self._next_interval(task)
+
+    def _finish(self, task: _PendingTask, result: Optional[Dict[str, Any]] = None, error: Optional[Exception] = None):
+        """
+        结束任务并解析Future
+        """
+        self._pending.pop(task.task_id, None)
+        if task.future.done():
+            return
+        if error is not None:
+            task.future.set_exception(error)
+        else:
+            task.future.set_result(result)
+
+    async def _run(self):
+        """
+        轮询主循环，没有未完成任务时退出
+        """
+        loop = asyncio.get_running_loop()
+
+        while self._pending:
+            self._wakeup.clear()
+            now = loop.time()
+
+            for task in list(self._pending.values()):
+                if task.future.done():
+                    # 调用方已放弃等待
+                    self._pending.pop(task.task_id, None)
+                    self._abandon(task)
+                elif now >= task.deadline:
+                    self._finish(task, error=Exception("图像生成超时"))
+                elif now >= task.next_poll_at and not task.polling:
+                    self._start_poll(task, now)
+
+            if not self._pending:
+                break
+
+            # 查询中的任务只需关注截止时间，查询结束时会唤醒主循环
+            next_at = min(
+                task.deadline if task.polling else min(task.next_poll_at, task.deadline)
+                for task in self._pending.values()
+            )
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_at - loop.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    def _start_poll(self, task: _PendingTask, now: float):
+        """
+        在独立的任务中查询状态，结束后唤醒主循环安排下一次查询
+        """
+        task.polling = True
+
+        async def poll():
+            try:
+                await self._poll(task, now)
+            except Exception as e:
+                self._finish(task, error=e)
+            finally:
+                task.polling = False
+                self._wakeup.set()
+
+        poll_task = asyncio.get_running_loop().create_task(poll())
+        self._polls.add(poll_task)
+        poll_task.add_done_callback(self._polls.discard)
+
+    def _abandon(self, task: _PendingTask):
+        """
+        停止轮询无人等待的任务，并在后台请求取消上游任务（尽力而为）
+        """
+        self.abandoned_tasks += 1
+
+        async def cancel():
+            try:
+                await self.client.cancel_task(task.task_id)
+            except Exception:
+                # 任务已开始执行时无法取消，结果无人使用
+                pass
+
+        cancellation = asyncio.get_running_loop().create_task(cancel())
+        self._cancellations.add(cancellation)
+        cancellation.add_done_callback(self._cancellations.discard)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取轮询器统计信息
+        """
+        return {
+            "pending_tasks": len(self._pending),
+            "polls_in_flight": len(self._polls),
+            "estimated_duration": round(self.estimated_duration, 2),
+            "total_polls": self.total_polls,
+            "completed_tasks": self.completed_tasks,
+            "abandoned_tasks": self.abandoned_tasks
+        }
+
+# 每个事件循环一个轮询器
+_pollers = LoopLocal(TaskPoller)
+
+def get_task_poller() -> TaskPoller:
+    """
+    获取当前事件循环的共享轮询器
+    """
+    return _pollers.get()
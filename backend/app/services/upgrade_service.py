@@ -0,0 +1,98 @@
+import asyncio
+from typing import Any, Dict, Hashable, List, Optional
+from app.core.database import SessionLocal
+from app.models.drawing import Drawing
+from app.services.asset_store import AssetStore
+from app.services.cache_service import CacheService
+from app.services.dedup_service import ImageDedupService
+from app.services.derivative_service import DerivativeService
+from app.services.image_service import ImageService
+from app.utils.async_utils import LoopLocal
+from app.utils.deadline import detached_context
+from app.utils.prompt_utils import canonicalize_prompt
+
+class _Upgrade:
+    """
+    一个正在执行的全分辨率升级
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.drawing_ids: List[int] = []
+
+# 正在执行的升级，相同的生成参数和预览种子只升级一次
+_pending = LoopLocal(dict)
+
+def schedule_upgrade(
+    prompt: str,
+    style: str,
+    steps: int,
+    preview_result: Dict[str, Any],
+    user_id: Optional[str] = None,
+    drawing_id: Optional[int] = None
+):
+    """
+    在后台把预览结果升级为全分辨率
+    完成后写入图像缓存，并更新对应的绘画记录
+    种子不同的预览构图不同，分别升级，画作只会被替换成同一种子生成的高清图
+    """
+    key = (canonicalize_prompt(prompt), style, steps, preview_result.get("seed"))
+    pending: Dict[Hashable, _Upgrade] = _pending.get()
+    upgrade = pending.get(key)
+    if upgrade is None:
+        upgrade = _Upgrade()
+        pending[key] = upgrade
+        upgrade.task = asyncio.get_running_loop().create_task(
+            _run_upgrade(key, upgrade, prompt, style, steps, preview_result, user_id),
+            context=detached_context()
+        )
+    if drawing_id is not None:
+        upgrade.drawing_ids.append(drawing_id)
+
+async def _run_upgrade(
+    key: Hashable,
+    upgrade: _Upgrade,
+    prompt: str,
+    style: str,
+    steps: int,
+    preview_result: Dict[str, Any],
+    user_id: Optional[str]
+) -> Optional[Dict[str, Any]]:
+    try:
+        result = await ImageService().upgrade_to_full(prompt, style, steps, preview_result, user_id)
+        result = await AssetStore().localize_result(result)
+
+        db = SessionLocal()
+        try:
+            result = await ImageDedupService(db).deduplicate_result(result, prompt, style, steps)
+            await CacheService(db).set_image_generation_cache(prompt, style, steps, result)
+            if upgrade.drawing_ids:
+                drawings = db.query(Drawing).filter(Drawing.id.in_(upgrade.drawing_ids)).all()
+                for drawing in drawings:
+                    drawing.preview_image_url = drawing.preview_image_url or drawing.image_url
+                    drawing.image_url = result["final_image_url"]
+                    drawing.steps_images = result["step_images"]
+                    drawing.quality = "full"
+                    drawing.seed = result.get("seed")
+                db.commit()
+        finally:
+            db.close()
+
+        DerivativeService().schedule_for_urls([result["final_image_url"], *result["step_images"]], style)
+        return result
+    except Exception as e:
+        print(f"全分辨率图像生成失败，保留预览图: {e}")
+        return None
+    finally:
+        pending = _pending.get()
+        if pending.get(key) is upgrade:
+            del pending[key]
+
+def get_upgrade_stats() -> Dict[str, int]:
+    """
+    获取后台升级统计信息
+    """
+    try:
+        return {"pending": len(_pending.get())}
+    except RuntimeError:
+        return {"pending": 0}
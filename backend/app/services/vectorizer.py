@@ -0,0 +1,161 @@
+import math
+from typing import Dict, List, Tuple
+from app.utils.image_utils import ink_mask, label_strokes, stroke_order
+
+# 笔画分组使用的最长边像素，与步骤分解一致，保证SVG笔画顺序和步骤图相同
+STROKE_GRID_SIZE = 256
+
+# 行进方块（marching squares）各情形的轮廓线段，边编号：0上 1右 2下 3左
+# 情形编号 = 左上*8 + 右上*4 + 右下*2 + 左下；5和10为对角情形，按8邻域连通处理
+_CASE_SEGMENTS = {
+    1: [(3, 2)], 2: [(2, 1)], 3: [(3, 1)], 4: [(0, 1)],
+    5: [(3, 0), (2, 1)], 6: [(0, 2)], 7: [(3, 0)], 8: [(3, 0)],
+    9: [(0, 2)], 10: [(0, 1), (3, 2)], 11: [(0, 1)], 12: [(3, 1)],
+    13: [(2, 1)], 14: [(3, 2)],
+}
+
+# 各条边中点相对单元格左上角的坐标（以半像素为单位：dx, dy）
+_EDGE_OFFSETS = [(1, 0), (2, 1), (1, 2), (0, 1)]
+
+def _trace_contours(mask) -> List[List[Tuple[int, int]]]:
+    """
+    用行进方块提取线条掩码的全部闭合轮廓
+    坐标以半像素为单位，(2x+1, 2y+1)为像素(x, y)的中心
+    """
+    import numpy as np
+
+    padded = np.pad(mask, 1).astype(np.uint8)
+    cases = padded[:-1, :-1] * 8 + padded[:-1, 1:] * 4 + padded[1:, 1:] * 2 + padded[1:, :-1]
+
+    neighbours: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    for case, segments in _CASE_SEGMENTS.items():
+        rows, cols = np.nonzero(cases == case)
+        for start_edge, end_edge in segments:
+            sx, sy = _EDGE_OFFSETS[start_edge]
+            ex, ey = _EDGE_OFFSETS[end_edge]
+            for row, col in zip((2 * rows).tolist(), (2 * cols).tolist()):
+                start = (col + sx, row + sy)
+                end = (col + ex, row + ey)
+                neighbours.setdefault(start, []).append(end)
+                neighbours.setdefault(end, []).append(start)
+
+    # 每个边中点恰好属于两条线段，沿线段走回起点即得到一条闭合轮廓
+    contours = []
+    visited = set()
+    for start in neighbours:
+        if start in visited:
+            continue
+        contour = [start]
+        visited.add(start)
+        previous, current = start, neighbours[start][0]
+        while current != start:
+            contour.append(current)
+            visited.add(current)
+            first, second = neighbours[current]
+            previous, current = current, (second if first == previous else first)
+        contours.append(contour)
+    return contours
+
+def _simplify(points, tolerance: float):
+    """
+    Douglas-Peucker折线简化，返回保留的点
+    """
+    import numpy as np
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = points[first + 1:last] - start
+        direction = end - start
+        length = math.hypot(direction[0], direction[1])
+        if length == 0:
+            distances = np.hypot(segment[:, 0], segment[:, 1])
+        else:
+            distances = np.abs(segment[:, 0] * direction[1] - segment[:, 1] * direction[0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            middle = first + 1 + index
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+    return points[keep]
+
+def _path_data(contour, tolerance: float) -> str:
+    """
+    把闭合轮廓简化后转成SVG路径数据，坐标换算回像素
+    """
+    import numpy as np
+
+    points = np.asarray(contour, dtype=np.float64) / 2 - 0.5
+    # 闭合轮廓从离起点最远的点处断开，分两段简化
+    far = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    head = _simplify(points[:far + 1], tolerance)
+    tail = _simplify(np.vstack([points[far:], points[:1]]), tolerance)
+    simplified = np.vstack([head, tail[1:-1]])
+    coords = " ".join(f"{x:g} {y:g}" for x, y in simplified.tolist())
+    return f"M{coords}Z"
+
+def _polygon_area(contour) -> float:
+    """
+    轮廓围成的面积（像素）
+    """
+    xs = [x for x, _ in contour]
+    ys = [y for _, y in contour]
+    doubled = sum(xs[i - 1] * ys[i] - xs[i] * ys[i - 1] for i in range(len(contour)))
+    return abs(doubled) / 8
+
+def trace_svg(source_path: str, max_side: int, tolerance: float, min_area: float) -> bytes:
+    """
+    在子进程中把线条画描成SVG，返回SVG数据
+    每个笔画是一个路径（evenodd填充线条轮廓），按步骤图的绘制顺序排列并带data-order，
+    前端可以据此逐笔画地动画显示
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(source_path) as source:
+        source.load()
+        image = source.convert("L")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    gray = np.asarray(image)
+    height, width = gray.shape
+    mask = ink_mask(gray)
+
+    labels = label_strokes(mask, STROKE_GRID_SIZE)
+    ink_rows, ink_cols = np.nonzero(mask)
+    paths: List[str] = []
+    if ink_rows.size:
+        unique, _, _, order = stroke_order(labels[ink_rows, ink_cols], ink_rows, ink_cols)
+        position = {int(label): rank for rank, label in enumerate(unique[order].tolist())}
+
+        # 轮廓上的点都在线条像素和背景像素之间，用它确定轮廓所属的笔画
+        strokes: Dict[int, List[str]] = {}
+        for contour in _trace_contours(mask):
+            if _polygon_area(contour) < min_area:
+                continue
+            x0, y0 = contour[0]
+            if x0 % 2 == 0:
+                # 点在竖直边上，线条像素在上下两侧之一
+                x, y = x0 // 2 - 1, (y0 - 1) // 2 - 1
+                y = y if 0 <= y and mask[y, x] else y + 1
+            else:
+                # 点在水平边上，线条像素在左右两侧之一
+                x, y = (x0 - 1) // 2 - 1, y0 // 2 - 1
+                x = x if 0 <= x and mask[y, x] else x + 1
+            strokes.setdefault(position[int(labels[y, x])], []).append(_path_data(contour, tolerance))
+
+        for rank in sorted(strokes):
+            paths.append(f'<path data-order="{rank}" d="{"".join(strokes[rank])}"/>')
+
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}">'
+        f'<rect width="{width}" height="{height}" fill="#fff"/>'
+        f'<g fill="#000" fill-rule="evenodd">{"".join(paths)}</g></svg>'
+    )
+    return svg.encode("utf-8")
@@ -0,0 +1,26 @@
+import asyncio
+import weakref
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+class LoopLocal(Generic[T]):
+    """
+    按事件循环隔离的进程级对象
+    asyncio原语绑定在创建它的事件循环上，每个事件循环各自持有一份
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._instances: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, T]" = weakref.WeakKeyDictionary()
+
+    def get(self) -> T:
+        """
+        获取当前事件循环对应的对象，不存在时创建
+        """
+        loop = asyncio.get_running_loop()
+        instance = self._instances.get(loop)
+        if instance is None:
+            instance = self._factory()
+            self._instances[loop] = instance
+        return instance
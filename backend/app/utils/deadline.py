@@ -0,0 +1,138 @@
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 当前请求的截止时间（time.monotonic()）和客户端断开事件，随协程上下文传递到各个服务
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+_disconnected: contextvars.ContextVar[Optional[asyncio.Event]] = contextvars.ContextVar("request_disconnected", default=None)
+
+# 被放弃的工作统计：原因 -> 阶段 -> 次数
+_abandoned: Dict[str, Dict[str, int]] = {}
+
+class RequestAbandonedError(Exception):
+    """
+    请求已被放弃，后续工作不再执行
+    """
+    status_code = 504
+
+class DeadlineExceededError(RequestAbandonedError):
+    """
+    请求已超过截止时间
+    """
+    status_code = 504
+
+class ClientDisconnectedError(RequestAbandonedError):
+    """
+    客户端已断开连接
+    """
+    status_code = 499
+
+def set_deadline(timeout_seconds: Optional[float]) -> contextvars.Token:
+    """
+    设置当前上下文的截止时间，已有更早的截止时间时保留原值
+    """
+    deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+    current = _deadline.get()
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    return _deadline.set(deadline)
+
+def set_disconnect_event(event: Optional[asyncio.Event]) -> contextvars.Token:
+    """
+    设置当前上下文的客户端断开事件
+    """
+    return _disconnected.set(event)
+
+def detached_context() -> contextvars.Context:
+    """
+    复制当前上下文并去掉请求的截止时间和断开事件
+    用于后台任务和多个请求共享的任务，它们不应受创建者所在请求的限制
+    """
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    context.run(_disconnected.set, None)
+    return context
+
+def remaining() -> Optional[float]:
+    """
+    距截止时间的剩余秒数，没有截止时间时返回None
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def _abandon(stage: str) -> RequestAbandonedError:
+    """
+    记录被放弃的阶段，返回对应的异常
+    """
+    event = _disconnected.get()
+    if event is not None and event.is_set():
+        record_abandoned("disconnect", stage)
+        return ClientDisconnectedError(f"客户端已断开，已停止{stage}")
+    record_abandoned("deadline", stage)
+    return DeadlineExceededError(f"请求超过截止时间，已停止{stage}")
+
+def check_deadline(stage: str):
+    """
+    已超过截止时间或客户端已断开时抛出异常，不再开始stage阶段
+    """
+    left = remaining()
+    event = _disconnected.get()
+    if (left is not None and left <= 0) or (event is not None and event.is_set()):
+        raise _abandon(stage)
+
+async def run_with_deadline(awaitable: Awaitable[T], stage: str, timeout: Optional[float] = None) -> T:
+    """
+    在截止时间内等待，超时或客户端断开时取消等待并抛出RequestAbandonedError
+    timeout为该阶段自身的超时，先于截止时间到达时抛出asyncio.TimeoutError，由调用方处理
+    """
+    work = asyncio.ensure_future(awaitable)
+    try:
+        check_deadline(stage)
+    except RequestAbandonedError:
+        work.cancel()
+        raise
+
+    left = remaining()
+    limits = [limit for limit in (left, timeout) if limit is not None]
+    event = _disconnected.get()
+    disconnect = asyncio.ensure_future(event.wait()) if event is not None else None
+
+    try:
+        waiters = {work} if disconnect is None else {work, disconnect}
+        done, _ = await asyncio.wait(
+            waiters,
+            timeout=min(limits) if limits else None,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+        if work in done:
+            return work.result()
+        if disconnect not in done and timeout is not None and (left is None or timeout < left):
+            raise asyncio.TimeoutError()
+        raise _abandon(stage)
+    finally:
+        if not work.done():
+            work.cancel()
+        if disconnect is not None:
+            disconnect.cancel()
+
+def record_abandoned(reason: str, stage: str, count: int = 1):
+    """
+    记录被放弃的工作
+    reason为deadline（超过截止时间）、disconnect（客户端断开）或cancelled（没有等待者后取消的图像）
+    """
+    stages = _abandoned.setdefault(reason, {})
+    stages[stage] = stages.get(stage, 0) + count
+
+def get_abandoned_stats() -> Dict[str, Any]:
+    """
+    获取被放弃工作的统计信息
+    """
+    return {
+        reason: {"total": sum(stages.values()), **stages}
+        for reason, stages in _abandoned.items()
+    }
@@ -0,0 +1,107 @@
+import re
+import unicodedata
+from typing import Set
+
+# 句首的请求用语，例如“帮我”“我想要”
+_REQUEST_WORDS = re.compile(r"^(?:请|麻烦|帮我|给我|帮忙|我想要|我想|我要|想要|能不能|可不可以|可以|你)+")
+
+# 请求用语之后的绘画动词；单独的“画”可能是主体的一部分（画眉、画板），见_strip_leading_fillers
+_DRAW_VERBS = re.compile(r"^(?:画一画|画一下|画出|绘制|画)")
+
+# 数量词，例如“一只”；不带“一”的量词只在绘画动词之后去掉，避免误伤“头发”“条纹”
+_MEASURE_WORDS = re.compile(r"^(一)?(?:只|个|条|头|朵|辆|棵|座|张|架|艘|匹|位|群|些)")
+
+# 句尾的语气词
+_TRAILING_FILLERS = re.compile(r"(?:吧|呀|啊|呢|吗|么|哦|嘛|啦|哈|好吗|好不好|可以吗)+$")
+
+# 儿童常用的叠词和昵称，归一到同一个主体
+_SYNONYMS = {
+    "猫咪": "猫",
+    "狗狗": "狗",
+    "兔兔": "兔子",
+    "鱼儿": "鱼",
+    "鸟儿": "鸟",
+    "花儿": "花",
+}
+
+# 整个提示词是“小X”时与主体X等价；只列出动物昵称，“小丑”“小车”等不在此列
+_DIMINUTIVES = {
+    "小猫": "猫",
+    "小狗": "狗",
+    "小鸟": "鸟",
+    "小鱼": "鱼",
+    "小熊": "熊",
+    "小兔": "兔子",
+    "小鸡": "鸡",
+    "小鸭": "鸭",
+    "小猪": "猪",
+    "小羊": "羊",
+    "小马": "马",
+    "小牛": "牛",
+}
+
+# 不影响画面内容的虚词，近似匹配时允许两个提示词在这些字上有差异
+_FUNCTION_CHARS = set("的地得着了过在是和与跟也很")
+
+def _strip_leading_fillers(text: str) -> str:
+    """
+    去掉句首的请求用语、绘画动词和数量词
+    单独的“画”只在前面有请求用语或后面跟数量词时才视为动词
+    """
+    request = _REQUEST_WORDS.match(text)
+    if request:
+        text = text[request.end():]
+
+    verb = _DRAW_VERBS.match(text)
+    if verb:
+        rest = text[verb.end():]
+        if request or verb.group() != "画" or _MEASURE_WORDS.match(rest):
+            text = rest
+        else:
+            verb = None
+
+    measure = _MEASURE_WORDS.match(text)
+    if measure and (verb or measure.group(1)):
+        text = text[measure.end():]
+
+    return text
+
+def canonicalize_prompt(prompt: str) -> str:
+    """
+    规范化提示词，用于缓存匹配
+    全角转半角、去掉标点空白、去掉请求用语和语气词、统一叠词和昵称
+    """
+    # NFKC会把全角字母数字和标点折叠为半角
+    text = unicodedata.normalize("NFKC", prompt).lower()
+
+    # 去掉标点、符号和空白
+    text = "".join(
+        ch for ch in text
+        if not ch.isspace() and unicodedata.category(ch)[0] not in ("P", "S")
+    )
+
+    stripped = _strip_leading_fillers(_TRAILING_FILLERS.sub("", text))
+    # 只剩请求用语和语气词时保留原文，避免这类提示词都落到同一个空键
+    if not stripped:
+        return text
+    text = stripped
+
+    for word, replacement in _SYNONYMS.items():
+        text = text.replace(word, replacement)
+
+    return _DIMINUTIVES.get(text, text)
+
+def prompt_shingles(text: str) -> Set[str]:
+    """
+    提取字符级1-gram和2-gram，短提示词也能得到足够的特征
+    """
+    shingles = set(text)
+    shingles.update(text[i:i + 2] for i in range(len(text) - 1))
+    return shingles
+
+def same_content(a: str, b: str) -> bool:
+    """
+    两个规范化提示词的实词是否相同
+    只在虚词上有差异时才允许近似匹配，“小狗”和“小猫”、“男孩”和“女孩”字面相似但主体不同
+    """
+    return set(a) - _FUNCTION_CHARS == set(b) - _FUNCTION_CHARS
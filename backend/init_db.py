@@ -11,7 +11,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.core.database import create_tables, drop_tables, engine
-from app.models.drawing import Drawing, Cache
+from app.models.drawing import Drawing, Cache, ImageFingerprint, IdempotencyRecord
 from sqlalchemy import text
 
 def init_database(reset: bool = False):
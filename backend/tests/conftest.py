@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.api.dependencies.database import get_db
+from app.core.database import Base
+from app.main import app
+
+@pytest.fixture
+def session_factory():
+    """
+    内存数据库的会话工厂
+    所有连接共用同一个内存数据库，测试代码、接口和后台任务看到相同的数据
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+@pytest.fixture
+def override_db(session_factory):
+    """
+    接口的数据库依赖改用内存数据库，返回会话工厂
+    """
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    yield session_factory
+    app.dependency_overrides.pop(get_db, None)
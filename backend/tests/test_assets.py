@@ -0,0 +1,110 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.services.asset_store import AssetStore
+
+client = TestClient(app)
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+@pytest.fixture
+def asset_store(tmp_path, monkeypatch):
+    """
+    使用临时目录作为资源存储
+    """
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    return AssetStore()
+
+def test_put_bytes_is_content_addressed(asset_store, tmp_path):
+    """
+    测试相同内容只存一份，并按哈希前缀分目录
+    """
+    name = asset_store.put_bytes(PNG_BYTES, "png")
+
+    assert asset_store.put_bytes(PNG_BYTES, "png") == name
+    assert (tmp_path / "assets" / name[:2] / name[2:4] / name).read_bytes() == PNG_BYTES
+    assert asset_store.name_from_url(asset_store.url_for(name)) == name
+    assert asset_store.name_from_url("https://dashscope-result.oss/abc.png") is None
+
+def test_get_asset_caching_headers_and_range(asset_store):
+    """
+    测试资源接口的缓存头、协商缓存和Range请求
+    """
+    name = asset_store.put_bytes(PNG_BYTES, "png")
+    url = f"{settings.API_V1_STR}/assets/{name}"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == PNG_BYTES
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == f'"{name[:-4]}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    not_modified = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+    assert not_modified.status_code == 304
+
+    partial = client.get(url, headers={"Range": "bytes=0-7"})
+    assert partial.status_code == 206
+    assert partial.content == PNG_BYTES[:8]
+
+def test_get_asset_rejects_bad_names(asset_store):
+    """
+    测试非法资源名和不存在的资源
+    """
+    assert client.get(f"{settings.API_V1_STR}/assets/..%2F..%2Fetc%2Fpasswd").status_code == 404
+    assert client.get(f"{settings.API_V1_STR}/assets/{'0' * 64}.png").status_code == 404
+
+def test_get_asset_variant_generates_thumbnail(asset_store):
+    """
+    测试按需生成WebP缩略图
+    """
+    import io
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (1024, 1024), "white").save(buffer, format="PNG")
+    name = asset_store.put_bytes(buffer.getvalue(), "png")
+
+    response = client.get(f"{settings.API_V1_STR}/assets/{name}/thumb")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "immutable" in response.headers["cache-control"]
+    with Image.open(io.BytesIO(response.content)) as thumb:
+        assert max(thumb.size) == 128
+
+    assert client.get(f"{settings.API_V1_STR}/assets/{name}/huge").status_code == 404
+
+def test_store_url_only_fetches_trusted_images(asset_store, monkeypatch):
+    """
+    测试只下载可信主机上的图像，下载内容不是图像时拒绝保存
+    """
+    import asyncio
+    from app.services import asset_store as asset_module
+    from app.services.asset_store import UntrustedAssetUrlError
+
+    downloads = []
+
+    class Client:
+        async def download(self, url):
+            downloads.append(url)
+            return b"<html>not an image</html>", "image/png"
+
+    monkeypatch.setattr(asset_module, "get_dashscope_client", lambda: Client())
+
+    for url in [
+        "http://169.254.169.254/latest/meta-data/",
+        "http://dashscope-result-bj.oss-cn-beijing.aliyuncs.com/a.png",
+        "https://dashscope-result-bj.oss-cn-beijing.aliyuncs.com:8080/a.png",
+        "https://evil.example.com/dashscope-result-bj.oss-cn-beijing.aliyuncs.com/a.png",
+        "file:///etc/passwd"
+    ]:
+        assert not asset_store.is_trusted_url(url)
+        with pytest.raises(UntrustedAssetUrlError):
+            asyncio.run(asset_store.store_url(url))
+    assert downloads == []
+
+    trusted = "https://dashscope-result-bj.oss-cn-beijing.aliyuncs.com/a.png"
+    with pytest.raises(ValueError, match="不是有效的图像"):
+        asyncio.run(asset_store.store_url(trusted))
+    assert downloads == [trusted]
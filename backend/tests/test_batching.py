@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.services.image_providers import LocalProvider
+from app.services.image_service import ImageService
+from app.services.micro_batcher import MicroBatcher
+from app.services.scheduler import get_upstream_scheduler
+
+def test_micro_batcher_groups_concurrent_requests():
+    """
+    测试窗口内相同键的请求合并成一次批量调用，每个请求分到不同结果
+    """
+    calls = []
+
+    async def batch(key, n, owner):
+        calls.append((key, n))
+        return [f"{key}-{i}" for i in range(n)]
+
+    async def scenario():
+        batcher = MicroBatcher(batch, window=0.01, max_size=3)
+        results = await asyncio.gather(*(batcher.submit("a") for _ in range(4)), batcher.submit("b"))
+        return results, batcher.get_stats()
+
+    results, stats = asyncio.run(scenario())
+    assert sorted(calls) == [("a", 1), ("a", 3), ("b", 1)]
+    assert sorted(results[:4]) == ["a-0", "a-0", "a-1", "a-2"]
+    assert stats["batches"] == 3
+
+def test_micro_batcher_propagates_errors_and_short_results():
+    """
+    测试批量调用失败或结果不足时对应请求收到异常
+    """
+    async def short_batch(key, n, owner):
+        return ["only"]
+
+    async def scenario():
+        batcher = MicroBatcher(short_batch, window=0.01, max_size=4)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("a"), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert results[0] == "only"
+    assert isinstance(results[1], Exception)
+
+@pytest.fixture
+def local_service(tmp_path, monkeypatch):
+    """
+    使用本地绘制的图像服务
+    """
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", None)
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "local")
+    monkeypatch.setattr(settings, "LOCAL_PROVIDER_IMAGE_SIZE", 64)
+    batches = []
+    generate_batch = LocalProvider.generate_batch
+
+    async def counting_batch(self, prompt, n, size=None, seed=None):
+        batches.append(n)
+        return await generate_batch(self, prompt, n, size, seed)
+
+    monkeypatch.setattr(LocalProvider, "generate_batch", counting_batch)
+    monkeypatch.setattr(LocalProvider, "max_batch_size", 4)
+    return batches
+
+def test_candidates_use_multi_image_tasks(local_service):
+    """
+    测试候选图像按单任务上限分批生成，且各不相同
+    """
+    result = asyncio.run(ImageService().generate_candidates("画一只小猫", n=6))
+
+    assert sorted(local_service) == [2, 4]
+    assert len(set(result["candidates"])) == 6
+
+def test_candidates_endpoint_validates_count(local_service):
+    """
+    测试候选图像接口
+    """
+    client = TestClient(app)
+    url = f"{settings.API_V1_STR}/images/candidates"
+
+    response = client.post(url, json={"prompt": "画一只小狗", "n": 3})
+    assert response.status_code == 200
+    assert len(response.json()["candidates"]) == 3
+    assert client.post(url, json={"prompt": "画一只小狗", "n": 100}).status_code == 400
+
+def test_call_provider_uses_micro_batcher(local_service, monkeypatch):
+    """
+    测试开启微批处理后相同提示词的并发单图请求合并成一个任务，整个批次只占一个调度令牌
+    """
+    monkeypatch.setattr(settings, "IMAGE_BATCH_WINDOW_MS", 20.0)
+    service = ImageService()
+
+    async def scenario():
+        queue_waits = []
+        urls = await asyncio.gather(*(
+            service._call_provider("小猫, simple line drawing", user_id="u1", queue_waits=queue_waits)
+            for _ in range(3)
+        ))
+        return urls, queue_waits, get_upstream_scheduler().get_stats()
+
+    urls, queue_waits, stats = asyncio.run(scenario())
+    assert local_service == [3]
+    assert len(set(urls)) == 3
+    assert stats["granted"] == 1
+    assert len(queue_waits) == 3
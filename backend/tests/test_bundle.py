@@ -0,0 +1,86 @@
+import io
+import json
+import os
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.core.config import settings
+from app.main import app
+from app.models.drawing import Drawing
+from app.services.asset_store import AssetStore
+from app.services.bundle_service import BundleService
+
+client = TestClient(app)
+
+@pytest.fixture
+def drawing_id(override_db, tmp_path, monkeypatch):
+    """
+    使用内存数据库和临时资源目录，保存一幅包含最终图像和三张步骤图的画作
+    """
+    TestSession = override_db
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "BUNDLE_CELL_SIZE", 64)
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", "test-key")
+
+    asset_store = AssetStore()
+    urls = []
+    for shade in (0, 60, 120, 180):
+        buffer = io.BytesIO()
+        Image.new("RGB", (128, 128), (shade, shade, shade)).save(buffer, format="PNG")
+        urls.append(asset_store.url_for(asset_store.put_bytes(buffer.getvalue(), "png")))
+
+    db = TestSession()
+    drawing = Drawing(title="小猫", prompt="小猫", image_url=urls[0], steps_images=urls[1:], user_id="u1")
+    db.add(drawing)
+    db.commit()
+    yield drawing.id
+    db.close()
+
+def test_drawing_bundle_packs_all_images_once(drawing_id):
+    """
+    测试画作图像打包成一张精灵图，偏移表指向各图像，重复请求直接返回缓存
+    """
+    response = client.get(f"{settings.API_V1_STR}/drawings/{drawing_id}/bundle")
+    assert response.status_code == 200
+    bundle = response.json()
+
+    assert (bundle["width"], bundle["height"]) == (128, 128)
+    assert [frame["image"] for frame in bundle["frames"]] == ["final", "step_1", "step_2", "step_3"]
+    assert [(frame["x"], frame["y"]) for frame in bundle["frames"]] == [(0, 0), (64, 0), (0, 64), (64, 64)]
+
+    asset_store = AssetStore()
+    sprite_path = asset_store.path_for(asset_store.name_from_url(bundle["sprite_url"]))
+    with Image.open(sprite_path) as sprite:
+        sprite = sprite.convert("L")
+        for frame, shade in zip(bundle["frames"], (0, 60, 120, 180)):
+            center = sprite.getpixel((frame["x"] + 32, frame["y"] + 32))
+            assert abs(center - shade) < 10
+
+    key = BundleService().bundle_key([frame["source_url"] for frame in bundle["frames"]])
+    assert os.path.exists(BundleService().manifest_path(key))
+    assert client.get(f"{settings.API_V1_STR}/drawings/{drawing_id}/bundle").json() == bundle
+
+def test_drawing_bundle_sprite_in_one_request(drawing_id):
+    """
+    测试一次请求直接拿到精灵图，偏移表在响应头中，ETag未变时返回304
+    """
+    url = f"{settings.API_V1_STR}/drawings/{drawing_id}/bundle/sprite"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    with Image.open(io.BytesIO(response.content)) as sprite:
+        assert sprite.size == (128, 128)
+
+    bundle = client.get(f"{settings.API_V1_STR}/drawings/{drawing_id}/bundle").json()
+    layout = json.loads(response.headers["X-Bundle-Layout"])
+    assert layout == {key: value for key, value in bundle.items() if key != "sprite_url"}
+
+    cached = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+    assert client.get(f"{settings.API_V1_STR}/drawings/{drawing_id + 1}/bundle/sprite").status_code == 404
+
+def test_drawing_bundle_missing_drawing(drawing_id):
+    """
+    测试画作不存在时返回404
+    """
+    assert client.get(f"{settings.API_V1_STR}/drawings/{drawing_id + 1}/bundle").status_code == 404
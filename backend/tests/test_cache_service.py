@@ -0,0 +1,132 @@
+import asyncio
+import time
+import pytest
+from app.services import cache_service as cache_module
+from app.services.cache_service import CacheService, HotCache
+from app.services.prompt_index import PromptIndex
+from app.utils.prompt_utils import canonicalize_prompt
+
+@pytest.fixture
+def db(session_factory, monkeypatch):
+    """
+    使用内存数据库和空的热点缓存
+    """
+    monkeypatch.setattr(cache_module, "_hot_cache", HotCache(16))
+    monkeypatch.setattr(cache_module, "_prompt_index", PromptIndex())
+    monkeypatch.setattr(cache_module, "_prompt_index_loaded", False)
+    session = session_factory()
+    yield session
+    session.close()
+
+def test_image_cache_round_trip_and_hot_tier(db):
+    """
+    测试图像缓存读写，以及数据库命中后回填热点缓存
+    """
+    result = {"final_image_url": "https://img/final.png", "step_images": ["https://img/1.png"], "provider": "tongyi"}
+
+    async def run():
+        writer = CacheService(db)
+        assert await writer.get_image_generation_cache("小猫", "简笔画", 1) is None
+        assert await writer.set_image_generation_cache("小猫", "简笔画", 1, result)
+
+        # 清空热点缓存，模拟其他进程写入的数据
+        cache_module._hot_cache = HotCache(16)
+        reader = CacheService(db)
+        first = await reader.get_image_generation_cache("小猫", "简笔画", 1)
+        second = await reader.get_image_generation_cache("小猫", "简笔画", 1)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first == result
+    assert second == result
+    assert len(cache_module._hot_cache) == 1
+
+def test_image_cache_respects_url_expiry(db):
+    """
+    测试缓存时间不超过签名URL的有效期
+    """
+    expires = int(time.time()) + 3600
+    expired = int(time.time()) + 10
+    fresh = {"final_image_url": f"https://oss/final.png?Expires={expires}&Signature=x", "step_images": []}
+    stale = {"final_image_url": f"https://oss/final.png?Expires={expired}&Signature=x", "step_images": []}
+
+    async def run():
+        service = CacheService(db)
+        stored = await service.set_image_generation_cache("小狗", "简笔画", 0, fresh)
+        skipped = await service.set_image_generation_cache("小鸟", "简笔画", 0, stale)
+        return stored, skipped
+
+    stored, skipped = asyncio.run(run())
+
+    assert stored is True
+    assert skipped is False
+    expires_at, _ = next(iter(cache_module._hot_cache._items.values()))
+    assert expires_at <= expires
+
+def test_canonicalize_prompt():
+    """
+    测试语音识别噪声提示词的规范化
+    """
+    assert canonicalize_prompt("画一只猫。") == "猫"
+    assert canonicalize_prompt("画 一只猫") == "猫"
+    assert canonicalize_prompt("帮我画一只小猫咪") == "猫"
+    assert canonicalize_prompt("请画一辆ＢＵＳ吧！") == "bus"
+    assert canonicalize_prompt("画一只红色的小猫") == "红色的小猫"
+    # 句末的疑问和语气词
+    for text in ["可以画一只猫吗", "画一只猫呢", "画一只猫吧", "画一只猫呀？"]:
+        assert canonicalize_prompt(text) == "猫"
+
+def test_canonicalize_prompt_keeps_subject_words():
+    """
+    测试量词、“画”和“小”是主体的一部分时不会被去掉，只有请求用语时保留原文
+    """
+    assert canonicalize_prompt("画眉鸟") == "画眉鸟"
+    assert canonicalize_prompt("条纹") == "条纹"
+    assert canonicalize_prompt("头发") == "头发"
+    assert canonicalize_prompt("小丑") == "小丑"
+    assert canonicalize_prompt("画只猫") == "猫"
+    assert canonicalize_prompt("吧") == "吧"
+    assert canonicalize_prompt("帮我画一只") == "帮我画一只"
+
+def test_image_cache_near_duplicate_prompt(db):
+    """
+    测试相似提示词命中已有缓存，不同风格不互相命中
+    """
+    result = {"final_image_url": "https://img/final.png", "step_images": []}
+
+    async def run():
+        service = CacheService(db)
+        await service.set_image_generation_cache("画一只戴着红帽子在草地上玩的小熊", "简笔画", 4, result)
+
+        # 模拟进程重启：清空内存中的缓存和索引
+        cache_module._hot_cache = HotCache(16)
+        cache_module._prompt_index = PromptIndex()
+        cache_module._prompt_index_loaded = False
+
+        similar = await service.get_image_generation_cache("帮我画一只戴红帽子在草地上玩的小熊！", "简笔画", 4)
+        other_style = await service.get_image_generation_cache("画一只戴着红帽子在草地上玩的小熊", "水彩", 4)
+        unrelated = await service.get_image_generation_cache("画一辆消防车", "简笔画", 4)
+        return similar, other_style, unrelated
+
+    similar, other_style, unrelated = asyncio.run(run())
+
+    assert similar["final_image_url"] == result["final_image_url"]
+    assert other_style is None
+    assert unrelated is None
+
+def test_image_cache_similar_prompt_with_different_subject_misses(db):
+    """
+    测试字面相似但主体不同的提示词不会命中彼此的缓存
+    """
+    result = {"final_image_url": "https://img/final.png", "step_images": []}
+
+    async def run():
+        service = CacheService(db)
+        await service.set_image_generation_cache("画一只戴红帽子在草地上奔跑的小狗", "简笔画", 4, result)
+        await service.set_image_generation_cache("一个在踢足球的男孩", "简笔画", 4, result)
+        cat = await service.get_image_generation_cache("画一只戴红帽子在草地上奔跑的小猫", "简笔画", 4)
+        girl = await service.get_image_generation_cache("一个在踢足球的女孩", "简笔画", 4)
+        return cat, girl
+
+    assert asyncio.run(run()) == (None, None)
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.hedging import Hedger
+
+async def _call(breaker, fail=False):
+    async with breaker.guard():
+        if fail:
+            raise Exception("上游错误")
+    return "ok"
+
+def test_breaker_opens_and_recovers_through_half_open():
+    """
+    测试失败率超过阈值后熔断，冷却后半开探测成功即恢复
+    """
+    async def scenario():
+        breaker = CircuitBreaker("测试", min_calls=4, failure_ratio=0.5, open_seconds=0.05, half_open_probes=1)
+        await _call(breaker)
+        await _call(breaker)
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await _call(breaker, fail=True)
+        assert breaker.get_state()["state"] == "open"
+
+        with pytest.raises(CircuitOpenError):
+            await _call(breaker)
+
+        await asyncio.sleep(0.06)
+        assert await _call(breaker) == "ok"
+        return breaker.get_state()
+
+    state = asyncio.run(scenario())
+    assert state["state"] == "closed"
+    assert state["trips"] == 1
+    assert state["rejected"] == 1
+
+def test_failed_probe_reopens_breaker():
+    """
+    测试半开探测失败时重新熔断
+    """
+    async def scenario():
+        breaker = CircuitBreaker("测试", min_calls=1, failure_ratio=0.5, open_seconds=0.01)
+        with pytest.raises(Exception):
+            await _call(breaker, fail=True)
+        await asyncio.sleep(0.02)
+        with pytest.raises(Exception):
+            await _call(breaker, fail=True)
+        return breaker.get_state()
+
+    state = asyncio.run(scenario())
+    assert state["state"] == "open"
+    assert state["trips"] == 2
+
+def test_hedger_issues_second_call_after_tail_latency():
+    """
+    测试超过历史p95仍未完成时发起对冲，取先完成的结果
+    """
+    async def scenario():
+        hedger = Hedger(enabled=True, quantile=0.95, min_samples=3, max_ratio=1.0)
+        for _ in range(3):
+            hedger.latency.record(0.01)
+
+        delays = iter([1.0, 0.01])
+
+        async def call():
+            delay = next(delays)
+            await asyncio.sleep(delay)
+            return delay
+
+        result = await asyncio.wait_for(hedger.run(call), timeout=0.5)
+        return result, hedger.get_stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == 0.01
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
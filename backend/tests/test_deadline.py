@@ -0,0 +1,142 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.services.image_service import ImageService
+from app.services.task_poller import TaskPoller
+from app.utils import deadline as deadline_module
+from app.utils.deadline import DeadlineExceededError, run_with_deadline, set_deadline
+
+client = TestClient(app)
+
+@pytest.fixture
+def image_service(monkeypatch):
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "STEP_MODE", "provider")
+    monkeypatch.setattr(settings, "IMAGE_MAX_RETRIES", 0)
+    monkeypatch.setattr(deadline_module, "_abandoned", {})
+    return ImageService()
+
+def test_run_with_deadline_cancels_work():
+    """
+    测试超过截止时间时取消工作并记录被放弃的阶段
+    """
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        set_deadline(0.02)
+        with pytest.raises(DeadlineExceededError):
+            await run_with_deadline(work(), "测试")
+        # 截止时间已过，后续阶段不再开始
+        with pytest.raises(DeadlineExceededError):
+            await run_with_deadline(work(), "后续")
+
+    asyncio.run(run())
+    assert cancelled == [True]
+    stats = deadline_module.get_abandoned_stats()["deadline"]
+    assert stats["测试"] >= 1 and stats["后续"] >= 1
+
+def test_stage_timeout_is_separate_from_deadline():
+    """
+    测试阶段自身的超时仍抛出TimeoutError
+    """
+    async def run():
+        set_deadline(5)
+        with pytest.raises(asyncio.TimeoutError):
+            await run_with_deadline(asyncio.sleep(1), "测试", timeout=0.01)
+
+    asyncio.run(run())
+
+def test_deadline_skips_pending_steps_only_without_other_waiters(image_service, monkeypatch):
+    """
+    测试截止时间只影响自己的等待：还有其他等待者时共享生成继续，全部放弃后剩余步骤不再生成
+    """
+    monkeypatch.setattr(settings, "IMAGE_REQUEST_CONCURRENCY", 1)
+    calls = []
+
+    async def fake_call(prompt, size=None, seed=None, **kwargs):
+        calls.append(prompt)
+        await asyncio.sleep(0.03)
+        return f"https://img/{len(calls)}.png"
+
+    monkeypatch.setattr(image_service, "_call_provider", fake_call)
+
+    async def with_deadline(prompt, seconds):
+        set_deadline(seconds)
+        return await image_service.generate_step_by_step_drawing(prompt, steps=4)
+
+    async def run():
+        shared = await asyncio.gather(
+            with_deadline("小猫", 0.01),
+            with_deadline("小猫", None),
+            return_exceptions=True
+        )
+        shared_calls = len(calls)
+
+        with pytest.raises(DeadlineExceededError):
+            await with_deadline("小狗", 0.05)
+        await asyncio.sleep(0.1)
+        return shared, shared_calls
+
+    shared, shared_calls = asyncio.run(run())
+    assert isinstance(shared[0], DeadlineExceededError)
+    assert len(shared[1]["step_images"]) == 4
+    assert shared_calls == 5
+    # 第二个请求放弃后不再启动新的图像生成
+    assert len(calls) - shared_calls < 5
+    assert deadline_module.get_abandoned_stats()["cancelled"]["图像"] >= 1
+
+def test_generate_returns_504_after_deadline_header(image_service, monkeypatch):
+    """
+    测试请求头指定的截止时间到达后返回504
+    """
+    monkeypatch.setattr(settings, "ASSET_STORE_ENABLED", False)
+
+    async def slow_call(self, prompt, size=None, seed=None, **kwargs):
+        await asyncio.sleep(1)
+        return "https://img/slow.png"
+
+    monkeypatch.setattr(ImageService, "_call_provider", slow_call)
+    response = client.post(
+        f"{settings.API_V1_STR}/images/generate",
+        json={"prompt": "截止时间测试", "steps": 2},
+        headers={"X-Request-Timeout": "0.05"}
+    )
+    assert response.status_code == 504
+
+def test_poller_abandons_cancelled_tasks():
+    """
+    测试等待者取消后轮询器停止轮询并请求取消上游任务
+    """
+    class Client:
+        def __init__(self):
+            self.cancelled = []
+
+        async def fetch_task(self, task_id):
+            return {"task_status": "RUNNING"}
+
+        async def cancel_task(self, task_id):
+            self.cancelled.append(task_id)
+
+    fake = Client()
+
+    async def run():
+        poller = TaskPoller(client=fake)
+        waiter = asyncio.ensure_future(poller.wait("task-1", timeout=5))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.05)
+        return poller
+
+    poller = asyncio.run(run())
+    assert poller.get_stats()["pending_tasks"] == 0
+    assert poller.abandoned_tasks == 1
+    assert fake.cancelled == ["task-1"]
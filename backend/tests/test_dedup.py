@@ -0,0 +1,188 @@
+import asyncio
+import io
+import os
+import random
+from datetime import datetime
+import pytest
+from PIL import Image, ImageDraw
+from app.core.config import settings
+from app.models.drawing import Drawing, DuplicateAsset, ImageFingerprint
+from app.services import dedup_service as dedup_module
+from app.services.asset_store import AssetStore
+from app.services.dedup_service import ImageDedupService, _image_dhash
+from app.services.image_index import BKTree, ImageIndex, hamming_distance
+
+def _drawing(shapes, dot=None) -> bytes:
+    image = Image.new("RGB", (512, 512), "white")
+    draw = ImageDraw.Draw(image)
+    for box in shapes:
+        draw.ellipse(box, outline="black", width=6)
+    if dot:
+        draw.rectangle(dot, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+CAT = [(40, 40, 470, 470), (150, 160, 210, 220), (300, 160, 360, 220)]
+HOUSE = [(60, 300, 200, 460), (250, 40, 480, 260)]
+
+@pytest.fixture
+def dedup(session_factory, tmp_path, monkeypatch):
+    """
+    使用内存数据库、临时资源目录和空索引
+    """
+    db = session_factory()
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(dedup_module, "_image_index", ImageIndex())
+    monkeypatch.setattr(dedup_module, "_image_index_loaded", False)
+    yield ImageDedupService(db)
+    db.close()
+
+def _store(asset_store: AssetStore, data: bytes) -> str:
+    return asset_store.url_for(asset_store.put_bytes(data, "png"))
+
+def test_bk_tree_matches_brute_force():
+    """
+    测试BK树查询结果与逐个比较一致
+    """
+    rng = random.Random(7)
+    hashes = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for index, value_hash in enumerate(hashes):
+        tree.add(value_hash, str(index))
+
+    query = hashes[42] ^ 0b1011  # 与第42个相差3位
+    expected = sorted(
+        (hamming_distance(query, value_hash), str(index))
+        for index, value_hash in enumerate(hashes)
+        if hamming_distance(query, value_hash) <= 12
+    )
+    assert [(distance, value) for distance, value, _ in tree.find(query, 12)] == expected
+    assert tree.find(query, 3)[0][:2] == (3, "42")
+
+    tree.discard(hashes[42])
+    assert all(value != "42" for _, value, _ in tree.find(query, 12))
+    assert len(tree) == 499
+
+def test_image_index_evicts_least_recently_used():
+    """
+    测试索引条目数不超过上限，淘汰最久未命中的条目，BK树不会因移除的条目无限增长
+    """
+    index = ImageIndex(max_entries=3)
+    for value_hash in (0b0001, 0b0010, 0b0100):
+        index.add("g", value_hash, str(value_hash))
+    assert index.find_nearest("g", 0b0001, 0)[1] == "1"
+    index.add("g", 0b1000, "8")
+
+    assert len(index) == 3
+    assert index.find_nearest("g", 0b0010, 0) is None
+    assert index.find_nearest("g", 0b0001, 0)[1] == "1"
+
+    rng = random.Random(3)
+    for _ in range(1000):
+        index.add("g", rng.getrandbits(64), "x")
+    assert len(index) == 3
+    assert index._trees["g"].nodes <= 2 * 3 + 16
+
+def test_dhash_separates_near_duplicates(tmp_path):
+    """
+    测试近似重复的图像哈希距离小，不同的图像哈希距离大
+    """
+    paths = {}
+    for name, data in {
+        "cat": _drawing(CAT),
+        "cat_dot": _drawing(CAT, dot=(250, 300, 253, 303)),
+        "house": _drawing(HOUSE)
+    }.items():
+        paths[name] = tmp_path / f"{name}.png"
+        paths[name].write_bytes(data)
+
+    hashes = {name: _image_dhash(str(path), 16) for name, path in paths.items()}
+    assert hamming_distance(hashes["cat"], hashes["cat_dot"]) <= settings.IMAGE_DEDUP_MAX_DISTANCE
+    assert hamming_distance(hashes["cat"], hashes["house"]) > 4 * settings.IMAGE_DEDUP_MAX_DISTANCE
+
+def test_deduplicate_result_shares_storage(dedup):
+    """
+    测试同一提示词下近似重复的结果复用已有图像，重复文件在宽限期后删除，不同的结果单独登记
+    """
+    asset_store = dedup.asset_store
+    first = {"final_image_url": _store(asset_store, _drawing(CAT)), "step_images": [_store(asset_store, _drawing(CAT[:1]))]}
+    duplicate = {
+        "final_image_url": _store(asset_store, _drawing(CAT, dot=(250, 300, 253, 303))),
+        "step_images": [_store(asset_store, _drawing(CAT[:1], dot=(250, 300, 253, 303)))],
+        "quality": "full"
+    }
+    other = {"final_image_url": _store(asset_store, _drawing(HOUSE)), "step_images": []}
+    duplicate_urls = [duplicate["final_image_url"], *duplicate["step_images"]]
+
+    def exists(url):
+        return os.path.exists(asset_store.path_for(asset_store.name_from_url(url)))
+
+    async def run():
+        return [
+            await dedup.deduplicate_result(first, "小猫", "简笔画", 1),
+            await dedup.deduplicate_result(duplicate, "画一只小猫", "简笔画", 1),
+            await dedup.deduplicate_result(other, "房子", "简笔画", 1),
+            # 步骤数不同的结果不会合并
+            await dedup.deduplicate_result(first, "小猫", "简笔画", 2)
+        ]
+
+    results = asyncio.run(run())
+    assert results[0] == first
+    assert results[1] == {**first, "quality": "full"}
+    assert results[2] == other
+    assert results[3] == first
+
+    # 重复图像的地址可能已经发给客户端，宽限期内保留，保存画作时替换为已有图像
+    assert all(exists(url) for url in duplicate_urls)
+    assert dedup.resolve_duplicates([*duplicate_urls, other["final_image_url"]]) == [
+        first["final_image_url"], *first["step_images"], other["final_image_url"]
+    ]
+
+    # 模拟宽限期结束
+    dedup.db.query(DuplicateAsset).update({DuplicateAsset.delete_after: datetime.utcnow()})
+    dedup.db.commit()
+    asyncio.run(dedup.deduplicate_result(other, "房子", "简笔画", 1))
+    assert not any(exists(url) for url in duplicate_urls)
+    assert exists(first["final_image_url"])
+    assert dedup.resolve_duplicates(duplicate_urls) == [first["final_image_url"], *first["step_images"]]
+
+    row = dedup.db.query(ImageFingerprint).filter(ImageFingerprint.steps == 1, ImageFingerprint.prompt == "猫").first()
+    assert row.asset_name == asset_store.name_from_url(first["final_image_url"]) and row.hits == 1
+    assert dedup.db.query(ImageFingerprint).count() == 3
+
+def test_similar_images_for_different_prompts_are_not_merged(dedup):
+    """
+    测试不同提示词的近似图像不会合并，避免返回另一个主体的画
+    """
+    asset_store = dedup.asset_store
+    cat = {"final_image_url": _store(asset_store, _drawing(CAT)), "step_images": []}
+    face = {"final_image_url": _store(asset_store, _drawing(CAT, dot=(250, 300, 253, 303))), "step_images": []}
+
+    async def run():
+        await dedup.deduplicate_result(cat, "小猫", "简笔画", 0)
+        return await dedup.deduplicate_result(face, "笑脸", "简笔画", 0)
+
+    assert asyncio.run(run()) == face
+    assert dedup.db.query(ImageFingerprint).count() == 2
+
+def test_referenced_duplicate_files_are_kept(dedup):
+    """
+    测试宽限期结束时仍被画作引用的重复文件不会删除（资源按内容寻址，同一文件可能被多处引用）
+    """
+    asset_store = dedup.asset_store
+    first = {"final_image_url": _store(asset_store, _drawing(CAT)), "step_images": []}
+    duplicate = {"final_image_url": _store(asset_store, _drawing(CAT, dot=(250, 300, 253, 303))), "step_images": []}
+    dedup.db.add(Drawing(title="笑脸", prompt="笑脸", image_url=duplicate["final_image_url"], steps_images=[]))
+    dedup.db.commit()
+
+    async def run():
+        await dedup.deduplicate_result(first, "小猫", "简笔画", 0)
+        await dedup.deduplicate_result(duplicate, "小猫", "简笔画", 0)
+        dedup.db.query(DuplicateAsset).update({DuplicateAsset.delete_after: datetime.utcnow()})
+        dedup.db.commit()
+        await dedup._purge_duplicates()
+
+    asyncio.run(run())
+    assert os.path.exists(asset_store.path_for(asset_store.name_from_url(duplicate["final_image_url"])))
+    assert dedup.db.query(DuplicateAsset).one().deleted_at is not None
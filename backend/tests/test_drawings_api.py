@@ -0,0 +1,125 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.models.drawing import Drawing
+from app.services.image_service import ImageService
+from app.services.speech_service import SpeechService
+
+client = TestClient(app)
+
+@pytest.fixture
+def generate_calls():
+    """
+    记录假图像生成收到的参数
+    """
+    return []
+
+@pytest.fixture
+def TestSession(override_db, monkeypatch, generate_calls):
+    """
+    使用内存数据库，图像生成和语音识别使用假实现
+    """
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "ASSET_STORE_ENABLED", False)
+    monkeypatch.setattr(settings, "IMAGE_DEDUP_ENABLED", False)
+
+    async def fake_generate(self, prompt, style="简笔画", steps=4, **kwargs):
+        generate_calls.append(kwargs)
+        return {
+            "final_image_url": f"https://img/{prompt}/final.png",
+            "step_images": [f"https://img/{prompt}/{index}.png" for index in range(steps)]
+        }
+
+    async def fake_recognize(self, audio_content):
+        return "小狗"
+
+    monkeypatch.setattr(ImageService, "generate_step_by_step_drawing", fake_generate)
+    monkeypatch.setattr(SpeechService, "recognize", fake_recognize)
+    return override_db
+
+def test_create_drawing_from_text_generates_and_saves(TestSession):
+    """
+    测试文字创建画作一次请求完成生成和保存，保存的画作可以按ID读取
+    """
+    response = client.post(
+        f"{settings.API_V1_STR}/drawings/from-text",
+        json={"text": "小猫", "steps": 3}
+    )
+    assert response.status_code == 200
+    drawing = response.json()
+    assert drawing["image_url"] == "https://img/小猫/final.png"
+    assert len(drawing["steps_images"]) == 3
+    assert drawing["style"] == "简笔画" and drawing["steps"] == 3
+
+    fetched = client.get(f"{settings.API_V1_STR}/drawings/{drawing['id']}")
+    assert fetched.status_code == 200
+    assert fetched.json()["steps_images"] == drawing["steps_images"]
+
+    db = TestSession()
+    assert db.query(Drawing).count() == 1
+    db.close()
+
+def test_create_drawing_from_text_schedules_anonymous_users_by_address(TestSession, generate_calls):
+    """
+    测试未提供用户ID时按客户端地址参与公平调度，画作仍记为匿名用户
+    """
+    response = client.post(f"{settings.API_V1_STR}/drawings/from-text", json={"text": "小猫", "steps": 1})
+    assert response.status_code == 200
+    assert response.json()["user_id"] == "anonymous"
+    assert generate_calls[0]["user_id"] == "ip:testclient"
+
+def test_create_drawing_from_speech_validates_upload(TestSession, generate_calls, monkeypatch):
+    """
+    测试语音创建画作拒绝非音频文件和超过大小上限的音频
+    """
+    url = f"{settings.API_V1_STR}/drawings/from-speech"
+    response = client.post(url, files={"file": ("notes.txt", b"hello", "text/plain")})
+    assert response.status_code == 400
+
+    monkeypatch.setattr(settings, "MAX_AUDIO_SIZE", 8)
+    response = client.post(url, files={"file": ("recording.wav", b"RIFF" + b"\0" * 16, "audio/wav")})
+    assert response.status_code == 413
+    assert generate_calls == []
+
+def test_create_drawing_from_speech_generates_and_saves(TestSession):
+    """
+    测试语音创建画作识别后直接生成并保存
+    """
+    response = client.post(
+        f"{settings.API_V1_STR}/drawings/from-speech",
+        files={"file": ("recording.wav", b"RIFF....WAVE", "audio/wav")},
+        data={"style": "简笔画", "steps": "2"}
+    )
+    assert response.status_code == 200
+    drawing = response.json()
+    assert drawing["prompt"] == "小狗"
+    assert drawing["steps_images"] == ["https://img/小狗/0.png", "https://img/小狗/1.png"]
+
+    deleted = client.delete(f"{settings.API_V1_STR}/drawings/{drawing['id']}")
+    assert deleted.status_code == 200
+    assert client.get(f"{settings.API_V1_STR}/drawings/{drawing['id']}").status_code == 404
+
+def test_create_drawing_rejects_untrusted_image_urls(TestSession):
+    """
+    测试保存画作时拒绝不可信的图像地址，不会在服务端请求这些地址
+    """
+    response = client.post(f"{settings.API_V1_STR}/drawings/", json={
+        "title": "小猫",
+        "prompt": "小猫",
+        "image_url": "http://127.0.0.1:8000/internal",
+        "steps_images": []
+    })
+    assert response.status_code == 400
+
+    db = TestSession()
+    assert db.query(Drawing).count() == 0
+    db.close()
+
+def test_drawings_can_be_listed_without_api_key(TestSession, monkeypatch):
+    """
+    测试未配置密钥时查询画作不受影响，语音和图像服务在用到时才创建
+    """
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", None)
+    response = client.get(f"{settings.API_V1_STR}/drawings/")
+    assert response.status_code == 200
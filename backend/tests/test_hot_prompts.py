@@ -0,0 +1,112 @@
+import asyncio
+import random
+from collections import Counter
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.services import hot_prompts as hot_module
+from app.services.cache_service import CacheService
+from app.services.hot_prompts import HotPromptTracker, SpaceSaving
+
+client = TestClient(app)
+
+def test_space_saving_bounds_true_counts():
+    """
+    测试高频项的估计次数是真实次数的上界，保证次数是下界，且长尾不会挤掉高频项
+    """
+    rng = random.Random(3)
+    stream = [f"p{min(int(rng.paretovariate(1.1)), 5000)}" for _ in range(20000)]
+    truth = Counter(stream)
+
+    summary = SpaceSaving(50)
+    for item in stream:
+        summary.add(item)
+
+    assert len(summary.counters) == 50
+    for item, (count, error, _, _) in summary.counters.items():
+        assert count - error <= truth[item] <= count
+    for item, _ in truth.most_common(5):
+        assert item in summary.counters
+
+def test_space_saving_tracks_min_count():
+    """
+    测试分桶维护的最小计数与逐个扫描的结果一致
+    """
+    rng = random.Random(7)
+    summary = SpaceSaving(20)
+    for _ in range(5000):
+        summary.add(f"p{rng.randint(0, 60)}")
+        assert summary._min == min(counter[0] for counter in summary.counters.values())
+        assert sum(len(bucket) for bucket in summary._buckets.values()) == len(summary.counters)
+
+def test_tracker_windows_slide_and_report_hit_ratio():
+    """
+    测试过期的桶滑出短窗口但仍计入长窗口，命中率只按缓存查询计算
+    """
+    tracker = HotPromptTracker(capacity=10)
+    now = 1_000_000.0
+    for _ in range(5):
+        tracker.add("小猫", now=now - 1000)
+    for hit in (False, True, True):
+        tracker.add("小狗", lookup=True, hit=hit, now=now)
+    tracker.add("小狗", now=now)
+
+    short = tracker.top("5m", 10, now=now)
+    assert [entry["prompt"] for entry in short["items"]] == ["小狗"]
+    assert short["items"][0]["count"] == 4
+    assert short["items"][0]["hit_ratio"] == round(2 / 3, 3)
+
+    hour = tracker.top("1h", 10, now=now)
+    assert hour["total"] == 9
+    assert [(entry["prompt"], entry["count"]) for entry in hour["items"]] == [("小猫", 5), ("小狗", 4)]
+
+@pytest.fixture
+def trackers(monkeypatch):
+    """
+    使用空的热门提示词统计
+    """
+    trackers = {
+        "prompts": HotPromptTracker(settings.HOT_PROMPTS_CAPACITY),
+        "subjects": HotPromptTracker(settings.HOT_PROMPTS_CAPACITY)
+    }
+    monkeypatch.setattr(hot_module, "_trackers", trackers)
+    return trackers
+
+def test_hot_endpoint_lists_recorded_prompts(trackers):
+    """
+    测试热门接口返回记录的提示词和规范化主体，且不会被缓存键路由覆盖
+    """
+    for prompt in ["帮我画一只小猫", "小猫", "小猫吧", "彩虹"]:
+        hot_module.record_prompt(prompt, lookup=True, hit=prompt == "小猫")
+
+    response = client.get(f"{settings.API_V1_STR}/cache/hot", params={"window": "5m", "limit": 5})
+    assert response.status_code == 200
+    window = response.json()["5m"]
+    assert window["subjects"]["items"][0] == {
+        "prompt": "猫", "count": 3, "guaranteed": 3, "lookups": 3, "hits": 1, "hit_ratio": 0.333
+    }
+    assert window["prompts"]["total"] == 4
+
+    assert client.get(f"{settings.API_V1_STR}/cache/hot", params={"window": "1y"}).status_code == 400
+
+def test_internal_lookups_are_not_counted_as_demand(trackers, override_db, monkeypatch):
+    """
+    测试预取和缓存预热的缓存查询不计入热门统计，真实请求的查询计入
+    """
+    monkeypatch.setattr(settings, "PREFETCH_MAX_LOAD", 0)
+    response = client.post(f"{settings.API_V1_STR}/images/prefetch", json={"prompt": "小猫", "steps": 2})
+    assert response.json()["status"] == "dropped"
+
+    async def lookup(record_stats):
+        db = override_db()
+        try:
+            await CacheService(db).get_image_generation_cache("小猫", "简笔画", 2, record_stats=record_stats)
+        finally:
+            db.close()
+
+    asyncio.run(lookup(False))
+    assert trackers["prompts"].top("5m", 5)["total"] == 0
+
+    asyncio.run(lookup(True))
+    assert trackers["prompts"].top("5m", 5)["items"][0]["lookups"] == 1
@@ -0,0 +1,138 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.models.drawing import Drawing, IdempotencyRecord
+from app.services import idempotency_service as idempotency_module
+from app.services.idempotency_service import (
+    IdempotencyInProgressError,
+    IdempotencyKeyReusedError,
+    IdempotencyService,
+    _request_hash
+)
+from app.utils.deadline import DeadlineExceededError, set_deadline
+
+client = TestClient(app)
+
+@pytest.fixture
+def TestSession(override_db, monkeypatch):
+    """
+    使用内存数据库，后台任务的会话也指向它
+    """
+    monkeypatch.setattr(idempotency_module, "SessionLocal", override_db)
+    monkeypatch.setattr(settings, "ASSET_STORE_ENABLED", False)
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", "test-key")
+    return override_db
+
+def test_retries_share_one_execution(TestSession):
+    """
+    测试执行中的重试等待同一个任务，完成后的重试直接重放，不同请求体使用同一个键被拒绝
+    """
+    calls = []
+
+    async def work(db):
+        calls.append(True)
+        await asyncio.sleep(0.02)
+        return {"final_image_url": "/uploads/a.png", "n": len(calls)}
+
+    async def run():
+        service = IdempotencyService(TestSession())
+        concurrent = await asyncio.gather(
+            service.run("images.generate", "key-1", {"prompt": "小猫"}, work, "测试"),
+            service.run("images.generate", "key-1", {"prompt": "小猫"}, work, "测试")
+        )
+        later = await service.run("images.generate", "key-1", {"prompt": "小猫"}, work, "测试")
+        with pytest.raises(IdempotencyKeyReusedError):
+            await service.run("images.generate", "key-1", {"prompt": "小狗"}, work, "测试")
+        # 不同接口的键互不影响
+        other = await service.run("drawings.create", "key-1", {"prompt": "小猫"}, work, "测试")
+        return concurrent, later, other
+
+    concurrent, later, other = asyncio.run(run())
+    assert [replayed for _, replayed in concurrent] == [False, True]
+    assert concurrent[0][0] == concurrent[1][0] == later[0] == {"final_image_url": "/uploads/a.png", "n": 1}
+    assert later[1] is True
+    assert other == ({"final_image_url": "/uploads/a.png", "n": 2}, False)
+    assert len(calls) == 2
+
+def test_work_outlives_abandoned_request_and_failures_are_not_recorded(TestSession):
+    """
+    测试首次请求超过截止时间后任务继续执行并记录结果；失败的请求不记录，重试会重新执行
+    """
+    calls = []
+
+    async def slow(db):
+        calls.append("slow")
+        await asyncio.sleep(0.05)
+        return {"id": 1}
+
+    async def failing(db):
+        calls.append("failing")
+        raise Exception("上游错误")
+
+    async def run():
+        # 每次调用使用新的会话，与每个请求各自的会话一致
+        def service():
+            return IdempotencyService(TestSession())
+
+        async def abandoned():
+            set_deadline(0.01)
+            await service().run("drawings.create", "key-2", {"title": "a"}, slow, "测试")
+
+        with pytest.raises(DeadlineExceededError):
+            await asyncio.ensure_future(abandoned())
+        await asyncio.sleep(0.1)
+        replay = await service().run("drawings.create", "key-2", {"title": "a"}, slow, "测试")
+
+        with pytest.raises(Exception, match="上游错误"):
+            await service().run("drawings.create", "key-3", {"title": "b"}, failing, "测试")
+        retried = await service().run("drawings.create", "key-3", {"title": "b"}, slow, "测试")
+        return replay, retried
+
+    replay, retried = asyncio.run(run())
+    assert replay == ({"id": 1}, True)
+    assert retried == ({"id": 1}, False)
+    assert calls == ["slow", "failing", "slow"]
+
+def test_processing_record_from_other_process_is_rejected(TestSession):
+    """
+    测试其他进程仍在处理同一个键时返回处理中错误
+    """
+    db = TestSession()
+    service = IdempotencyService(db)
+    record, claimed = service._claim("images.generate", "key-4", _request_hash({}))
+    assert claimed and record.status == "processing"
+
+    async def work(db):
+        return {}
+
+    with pytest.raises(IdempotencyInProgressError):
+        asyncio.run(service.run("images.generate", "key-4", {}, work, "测试"))
+
+def test_create_drawing_with_idempotency_key_saves_once(TestSession):
+    """
+    测试带相同幂等键重复保存画作时只写入一次
+    """
+    payload = {
+        "title": "小猫",
+        "prompt": "小猫",
+        "image_url": "https://dashscope-result-bj.oss-cn-beijing.aliyuncs.com/final.png",
+        "steps_images": ["https://dashscope-result-bj.oss-cn-beijing.aliyuncs.com/1.png"]
+    }
+    headers = {"Idempotency-Key": "drawing-1"}
+    first = client.post(f"{settings.API_V1_STR}/drawings/", json=payload, headers=headers)
+    retry = client.post(f"{settings.API_V1_STR}/drawings/", json=payload, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    conflict = client.post(f"{settings.API_V1_STR}/drawings/", json={**payload, "title": "小狗"}, headers=headers)
+    assert conflict.status_code == 422
+
+    db = TestSession()
+    assert db.query(Drawing).count() == 1
+    assert db.query(IdempotencyRecord).one().status == "completed"
+    db.close()
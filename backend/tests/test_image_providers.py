@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from PIL import Image
+from app.core.config import settings
+from app.services.image_providers import ImageProvider, LocalProvider, resolve_provider_name
+from app.services.image_service import ImageService
+
+@pytest.fixture
+def local_settings(tmp_path, monkeypatch):
+    """
+    使用本地绘制和临时资源目录
+    """
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", None)
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "local")
+    monkeypatch.setattr(settings, "LOCAL_PROVIDER_IMAGE_SIZE", 128)
+    monkeypatch.setattr(settings, "LOCAL_PROVIDER_LATENCY_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "LOCAL_PROVIDER_ERROR_RATE", 0.0)
+
+def _ink(provider: LocalProvider, url: str) -> int:
+    with Image.open(provider.asset_store.path_for(provider.asset_store.name_from_url(url))) as image:
+        return sum(image.histogram()[:128])
+
+def test_provider_selection(local_settings, monkeypatch):
+    """
+    测试本地绘制只能显式指定，auto和显式指定的服务不可用时报错而不是回退到本地绘制
+    """
+    assert resolve_provider_name() == "local"
+    assert ImageService().provider == "local"
+
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "auto")
+    with pytest.raises(Exception, match="IMAGE_PROVIDER=local"):
+        ImageService()
+
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "tongyi")
+    with pytest.raises(Exception):
+        ImageService()
+
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "auto")
+    assert resolve_provider_name() == "tongyi"
+
+def test_provider_must_implement_generate():
+    """
+    测试未实现generate的提供商无法实例化
+    """
+    class Incomplete(ImageProvider):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_local_provider_is_deterministic(local_settings):
+    """
+    测试相同提示词得到相同图像，步骤图是最终图的一部分
+    """
+    provider = LocalProvider()
+
+    async def run():
+        return await asyncio.gather(
+            provider.generate("小猫, simple line drawing"),
+            provider.generate("小猫, simple line drawing"),
+            provider.generate("小猫, simple line drawing, step 1 of 4, progressive drawing"),
+            provider.generate("小狗, simple line drawing")
+        )
+
+    final, again, first_step, other = asyncio.run(run())
+    assert final == again
+    assert other != final
+    assert _ink(provider, first_step) <= _ink(provider, final)
+
+def test_local_provider_simulates_errors(local_settings, monkeypatch):
+    """
+    测试可配置的模拟错误率
+    """
+    monkeypatch.setattr(settings, "LOCAL_PROVIDER_ERROR_RATE", 1.0)
+    with pytest.raises(Exception, match="模拟失败"):
+        asyncio.run(LocalProvider().generate("小猫"))
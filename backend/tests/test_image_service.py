@@ -0,0 +1,149 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.services.image_service import ImageService
+
+@pytest.fixture
+def image_service(monkeypatch):
+    """
+    构造使用测试配置的图像服务
+    """
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "IMAGE_REQUEST_CONCURRENCY", 5)
+    monkeypatch.setattr(settings, "IMAGE_MAX_RETRIES", 1)
+    return ImageService()
+
+def test_generate_images_concurrently_keeps_order(image_service, monkeypatch):
+    """
+    测试并发生成时步骤图像顺序保持不变
+    """
+    running = 0
+    max_running = 0
+
+    async def fake_call(prompt, size=None, seed=None, **kwargs):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        # 越靠前的提示词完成得越晚
+        await asyncio.sleep(0.01 * (5 - int(prompt)))
+        running -= 1
+        return f"url-{prompt}"
+
+    monkeypatch.setattr(image_service, "_call_provider", fake_call)
+    urls = asyncio.run(image_service._generate_images_concurrently(["0", "1", "2", "3", "4"]))
+
+    assert urls == ["url-0", "url-1", "url-2", "url-3", "url-4"]
+    assert max_running == 5
+
+def test_generate_images_concurrently_retries_only_failed(image_service, monkeypatch):
+    """
+    测试只重试失败的图像
+    """
+    calls = []
+
+    async def fake_call(prompt, size=None, seed=None, **kwargs):
+        calls.append(prompt)
+        if prompt == "2" and calls.count("2") == 1:
+            raise Exception("临时失败")
+        return f"url-{prompt}"
+
+    monkeypatch.setattr(image_service, "_call_provider", fake_call)
+    urls = asyncio.run(image_service._generate_images_concurrently(["0", "1", "2"]))
+
+    assert urls == ["url-0", "url-1", "url-2"]
+    assert sorted(calls) == ["0", "1", "2", "2"]
+
+def test_generate_images_concurrently_raises_after_retries(image_service, monkeypatch):
+    """
+    测试重试次数用尽后抛出异常
+    """
+    async def fake_call(prompt, size=None, seed=None, **kwargs):
+        if prompt == "1":
+            raise Exception("持续失败")
+        return f"url-{prompt}"
+
+    monkeypatch.setattr(image_service, "_call_provider", fake_call)
+    with pytest.raises(Exception, match="持续失败"):
+        asyncio.run(image_service._generate_images_concurrently(["0", "1"]))
+
+def test_identical_requests_are_coalesced(image_service, monkeypatch):
+    """
+    测试相同的并发请求只生成一次
+    """
+    calls = []
+
+    async def fake_generate(prompt, style, steps, on_image=None, user_id=None, quality="full", weight=1.0):
+        calls.append((prompt, style, steps))
+        await asyncio.sleep(0.02)
+        return {"final_image_url": "final", "step_images": ["s1", "s2"], "provider": "tongyi"}
+
+    monkeypatch.setattr(image_service, "_generate_with_provider", fake_generate)
+
+    async def run():
+        return await asyncio.gather(
+            image_service.generate_step_by_step_drawing("画一只小猫", steps=2),
+            image_service.generate_step_by_step_drawing(" 画一只小猫 ", steps=2),
+            image_service.generate_step_by_step_drawing("画一只小狗", steps=2),
+        )
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert results[0] == results[1]
+    assert results[0]["step_images"] is not results[1]["step_images"]
+
+def test_requests_with_different_weights_are_not_coalesced(image_service, monkeypatch):
+    """
+    测试正式请求不会加入低权重的后台生成，各自按自己的权重排队
+    """
+    weights = []
+
+    async def fake_generate(prompt, style, steps, on_image=None, user_id=None, quality="full", weight=1.0):
+        weights.append(weight)
+        await asyncio.sleep(0.02)
+        return {"final_image_url": "final", "step_images": [], "provider": "tongyi"}
+
+    monkeypatch.setattr(image_service, "_generate_with_provider", fake_generate)
+
+    async def run():
+        await asyncio.gather(
+            image_service.generate_step_by_step_drawing("画一只小猫", steps=0, weight=0.1),
+            image_service.generate_step_by_step_drawing("画一只小猫", steps=0),
+        )
+
+    asyncio.run(run())
+    assert sorted(weights) == [0.1, 1.0]
+
+def test_coalesced_request_survives_leader_cancel(image_service, monkeypatch):
+    """
+    测试发起者断开后其他等待者仍能拿到结果，全部断开后才取消生成
+    """
+    cancelled = []
+
+    async def fake_generate(prompt, style, steps, on_image=None, user_id=None, quality="full", weight=1.0):
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            cancelled.append(prompt)
+            raise
+        return {"final_image_url": "final", "step_images": [], "provider": "tongyi"}
+
+    monkeypatch.setattr(image_service, "_generate_with_provider", fake_generate)
+
+    async def run():
+        leader = asyncio.ensure_future(image_service.generate_step_by_step_drawing("小猫", steps=0))
+        follower = asyncio.ensure_future(image_service.generate_step_by_step_drawing("小猫", steps=0))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        result = await follower
+
+        lonely = asyncio.ensure_future(image_service.generate_step_by_step_drawing("小狗", steps=0))
+        await asyncio.sleep(0.01)
+        lonely.cancel()
+        await asyncio.sleep(0.01)
+        return result
+
+    result = asyncio.run(run())
+
+    assert result["final_image_url"] == "final"
+    assert cancelled == ["小狗"]
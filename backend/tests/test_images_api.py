@@ -0,0 +1,210 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.api.v1.endpoints import images as images_module
+from app.core.config import settings
+from app.main import app
+from app.services import cache_service as cache_module
+from app.services import job_service as job_module
+from app.services import upgrade_service as upgrade_module
+from app.services.cache_service import HotCache
+from app.services.image_service import ImageService
+from app.services.prompt_index import PromptIndex
+from app.models.drawing import Drawing
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def test_env(override_db, monkeypatch):
+    """
+    使用内存数据库、空缓存和假的图像生成
+    """
+    monkeypatch.setattr(images_module, "SessionLocal", override_db)
+    monkeypatch.setattr(job_module, "SessionLocal", override_db)
+    monkeypatch.setattr(upgrade_module, "SessionLocal", override_db)
+    monkeypatch.setattr(cache_module, "_hot_cache", HotCache(16))
+    monkeypatch.setattr(cache_module, "_prompt_index", PromptIndex())
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "ASSET_STORE_ENABLED", False)
+    monkeypatch.setattr(settings, "STEP_MODE", "provider")
+
+    calls = []
+
+    async def fake_call(self, prompt, size=None, seed=None, **kwargs):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return f"https://img/{len(calls)}.png"
+
+    monkeypatch.setattr(ImageService, "_call_provider", fake_call)
+    return calls
+
+def parse_sse(body: str):
+    """
+    解析SSE响应体
+    """
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_generate_stream_emits_each_image_then_done(test_env):
+    """
+    测试流式接口逐张推送图像，最后推送done事件，第二次请求命中缓存
+    """
+    url = f"{settings.API_V1_STR}/images/generate/stream"
+    response = client.post(url, json={"prompt": "画一只小猫", "steps": 2})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert sorted(names[:-1]) == ["final", "step", "step"]
+    assert names[-1] == "done"
+    done = events[-1][1]
+    assert done["from_cache"] is False
+    assert len(done["step_images"]) == 2
+    assert sorted(data["index"] for name, data in events if name == "step") == [0, 1]
+
+    cached = parse_sse(client.post(url, json={"prompt": "画一只小猫", "steps": 2}).text)
+    assert cached[-1][1]["from_cache"] is True
+    assert cached[-1][1]["final_image_url"] == done["final_image_url"]
+    assert len(test_env) == 3
+
+def test_generate_stream_reports_errors(monkeypatch):
+    """
+    测试生成失败时推送error事件
+    """
+    async def failing_call(self, prompt, size=None, seed=None, **kwargs):
+        raise Exception("上游不可用")
+
+    monkeypatch.setattr(ImageService, "_call_provider", failing_call)
+    response = client.post(f"{settings.API_V1_STR}/images/generate/stream", json={"prompt": "画一只小狗", "steps": 1})
+
+    events = parse_sse(response.text)
+    assert events[-1][0] == "error"
+    assert "上游不可用" in events[-1][1]["detail"]
+
+def test_image_job_lifecycle():
+    """
+    测试异步任务提交后立即返回，完成后可查询结果
+    """
+    import time
+
+    with TestClient(app) as job_client:
+        response = job_client.post(f"{settings.API_V1_STR}/images/jobs", json={"prompt": "画一辆小汽车", "steps": 2})
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] in ("queued", "running")
+
+        for _ in range(100):
+            job = job_client.get(f"{settings.API_V1_STR}/images/jobs/{job['job_id']}").json()
+            if job["status"] not in ("queued", "running"):
+                break
+            time.sleep(0.02)
+
+        assert job["status"] == "succeeded"
+        assert job["completed_images"] == 3
+        assert all(job["step_images"])
+
+        assert job_client.get(f"{settings.API_V1_STR}/images/jobs/unknown").status_code == 404
+
+    # 其他进程的任务管理器中没有该任务，从数据库读取
+    stored = job_module.JobManager().get(job["job_id"])
+    assert stored.to_dict() == job
+
+def test_step_count_is_bounded():
+    """
+    测试步骤数为负数或超过上限时直接拒绝，不会创建任务
+    """
+    for steps in (-1, settings.IMAGE_MAX_STEPS + 1):
+        for url in ("/images/jobs", "/images/generate", "/images/prefetch"):
+            response = client.post(f"{settings.API_V1_STR}{url}", json={"prompt": "小猫", "steps": steps})
+            assert response.status_code == 422
+        response = client.post(f"{settings.API_V1_STR}/drawings/from-text", json={"text": "小猫", "steps": steps})
+        assert response.status_code == 422
+
+def test_image_job_queue_limit(monkeypatch):
+    """
+    测试队列满时拒绝提交
+    """
+    monkeypatch.setattr(settings, "JOB_QUEUE_MAX_SIZE", 1)
+    monkeypatch.setattr(settings, "JOB_WORKERS", 1)
+
+    async def slow_call(self, prompt, size=None, seed=None, **kwargs):
+        await asyncio.sleep(1)
+        return "https://img/slow.png"
+
+    monkeypatch.setattr(ImageService, "_call_provider", slow_call)
+
+    with TestClient(app) as job_client:
+        statuses = [
+            job_client.post(f"{settings.API_V1_STR}/images/jobs", json={"prompt": f"画第{i}只猫", "steps": 0}).status_code
+            for i in range(4)
+        ]
+
+    assert 503 in statuses
+    assert statuses[0] == 202
+
+def test_preview_quality_upgrades_in_background(monkeypatch):
+    """
+    测试预览质量先返回低分辨率图，后台以同一随机种子升级为全分辨率后写入缓存
+    """
+    import time
+
+    sizes = []
+    seeds = []
+
+    async def sized_call(self, prompt, size=None, seed=None, **kwargs):
+        sizes.append(size)
+        seeds.append(seed)
+        await asyncio.sleep(0.01)
+        return f"https://img/{len(sizes)}-{size}.png"
+
+    monkeypatch.setattr(ImageService, "_call_provider", sized_call)
+    url = f"{settings.API_V1_STR}/images/generate"
+
+    with TestClient(app) as job_client:
+        preview = job_client.post(url, json={"prompt": "画一只小兔", "steps": 1, "quality": "preview"}).json()
+        assert preview["quality"] == "preview"
+        assert settings.IMAGE_SIZE_PREVIEW in preview["final_image_url"]
+        assert sizes[:2] == [settings.IMAGE_SIZE_PREVIEW, settings.IMAGE_SIZE_PREVIEW]
+
+        for _ in range(100):
+            if settings.IMAGE_SIZE_FULL in sizes:
+                break
+            time.sleep(0.02)
+        time.sleep(0.05)
+
+        upgraded = job_client.post(url, json={"prompt": "画一只小兔", "steps": 1}).json()
+
+    assert upgraded["from_cache"] is True
+    assert settings.IMAGE_SIZE_FULL in upgraded["final_image_url"]
+    assert upgraded["step_images"] == preview["step_images"]
+    assert seeds[0] is not None and set(seeds) == {seeds[0]}
+    assert job_client.post(url, json={"prompt": "画一只小兔", "quality": "huge"}).status_code == 422
+
+def test_upgrades_with_different_seeds_are_not_merged(override_db):
+    """
+    测试同一提示词、不同种子的预览分别升级，每幅画作只换成自己种子的高清图
+    """
+    db = override_db()
+    drawings = [Drawing(title="小兔", prompt="小兔", image_url=f"https://img/preview-{seed}.png", seed=seed) for seed in (1, 2)]
+    db.add_all(drawings)
+    db.commit()
+    drawing_ids = [drawing.id for drawing in drawings]
+
+    async def run():
+        for drawing_id, seed in zip(drawing_ids, (1, 2)):
+            preview = {"final_image_url": f"https://img/preview-{seed}.png", "step_images": [], "seed": seed}
+            upgrade_module.schedule_upgrade("小兔", "简笔画", 0, preview, "u1", drawing_id)
+        pending = list(upgrade_module._pending.get().values())
+        await asyncio.gather(*(upgrade.task for upgrade in pending))
+        return len(pending)
+
+    assert asyncio.run(run()) == 2
+    db.expire_all()
+    assert [db.get(Drawing, drawing_id).seed for drawing_id in drawing_ids] == [1, 2]
+    assert all(db.get(Drawing, drawing_id).quality == "full" for drawing_id in drawing_ids)
+    db.close()
@@ -0,0 +1,119 @@
+import asyncio
+from collections import OrderedDict
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.services import cache_service as cache_module
+from app.services import prefetch_service as prefetch_module
+from app.services.cache_service import CacheService, HotCache
+from app.services.image_service import ImageService
+from app.services.prefetch_service import get_prefetch_stats, record_prefetch_use, schedule_prefetch
+from app.services.prompt_index import PromptIndex
+
+client = TestClient(app)
+
+@pytest.fixture
+def prefetch(session_factory, monkeypatch):
+    """
+    使用内存数据库、空缓存和假的图像生成，返回记录生成调用的列表
+    """
+    monkeypatch.setattr(prefetch_module, "SessionLocal", session_factory)
+    monkeypatch.setattr(cache_module, "_hot_cache", HotCache(100))
+    monkeypatch.setattr(cache_module, "_prompt_index", PromptIndex(max_entries=100))
+    monkeypatch.setattr(prefetch_module, "_completed", OrderedDict())
+    monkeypatch.setattr(prefetch_module, "_prefetch_counters", dict.fromkeys(prefetch_module._prefetch_counters, 0))
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "ASSET_STORE_ENABLED", False)
+    monkeypatch.setattr(settings, "IMAGE_DEDUP_ENABLED", False)
+
+    calls = []
+
+    async def fake_generate(self, prompt, style="简笔画", steps=4, **kwargs):
+        calls.append((prompt, kwargs))
+        await asyncio.sleep(0.02)
+        return {
+            "final_image_url": f"https://img/{prompt}/final.png",
+            "step_images": [f"https://img/{prompt}/{index}.png" for index in range(steps)]
+        }
+
+    monkeypatch.setattr(ImageService, "generate_step_by_step_drawing", fake_generate)
+    return session_factory, calls
+
+def test_prefetch_fills_cache_at_low_priority(prefetch):
+    """
+    测试预取以低权重生成并写入缓存，随后的正式请求计为命中
+    """
+    TestSession, calls = prefetch
+
+    async def run():
+        db = TestSession()
+        status = await schedule_prefetch(db, "小猫", "简笔画", 2, "u1")
+        again = await schedule_prefetch(db, "小猫", "简笔画", 2, "u2")
+        await asyncio.sleep(0.05)
+        cached = await schedule_prefetch(db, "小猫", "简笔画", 2, "u1")
+
+        record_prefetch_use("小猫", "简笔画", 2)
+        result = await CacheService(db).get_image_generation_cache("小猫", "简笔画", 2)
+        db.close()
+        return status, again, cached, result
+
+    status, again, cached, result = asyncio.run(run())
+    assert (status, again, cached) == ("scheduled", "in_flight", "cached")
+    assert result["final_image_url"] == "https://img/小猫/final.png"
+    assert len(calls) == 1
+    assert calls[0][1]["weight"] == settings.PREFETCH_WEIGHT
+    assert calls[0][1]["user_id"] == prefetch_module.PREFETCH_SCHEDULING_USER
+
+    stats = get_prefetch_stats()
+    assert stats["hits"] == 1 and stats["completed"] == 1 and stats["hit_rate"] == 1.0
+
+def test_superseded_and_unused_prefetches_are_counted(prefetch, monkeypatch):
+    """
+    测试同一用户继续输入时取消之前的预取，完成后未被使用的预取计为浪费
+    """
+    TestSession, calls = prefetch
+    monkeypatch.setattr(settings, "PREFETCH_HIT_WINDOW_SECONDS", 0)
+
+    async def run():
+        db = TestSession()
+        await schedule_prefetch(db, "小", "简笔画", 2, "u1")
+        await asyncio.sleep(0)
+        await schedule_prefetch(db, "小狗", "简笔画", 2, "u1")
+        await asyncio.sleep(0.05)
+        db.close()
+
+    asyncio.run(run())
+    stats = get_prefetch_stats()
+    assert stats["superseded"] == 1
+    assert stats["completed"] == 1 and stats["wasted"] == 1
+    assert stats["pending"] == 0
+
+def test_real_request_overtakes_in_flight_prefetch(prefetch):
+    """
+    测试预取仍在进行时真实请求到达，预取被取消，不会让真实请求排在低权重队列里
+    """
+    TestSession, calls = prefetch
+
+    async def run():
+        db = TestSession()
+        await schedule_prefetch(db, "小猫", "简笔画", 2, "u1")
+        await asyncio.sleep(0)
+        record_prefetch_use("小猫", "简笔画", 2)
+        await asyncio.sleep(0.05)
+        db.close()
+
+    asyncio.run(run())
+    stats = get_prefetch_stats()
+    assert stats["overtaken"] == 1
+    assert stats["completed"] == 0 and stats["pending"] == 0
+
+def test_prefetch_is_dropped_under_load(prefetch, monkeypatch):
+    """
+    测试上游繁忙时预取接口直接丢弃请求
+    """
+    monkeypatch.setattr(settings, "PREFETCH_MAX_LOAD", 0)
+    response = client.post(f"{settings.API_V1_STR}/images/prefetch", json={"prompt": "彩虹", "steps": 2})
+    assert response.status_code == 202
+    assert response.json()["status"] == "dropped"
+    assert prefetch[1] == []
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from app.services.scheduler import UpstreamScheduler
+
+def test_fair_queuing_interleaves_users():
+    """
+    测试一个用户大量排队时，其他用户的请求不会排在最后
+    """
+    async def scenario():
+        scheduler = UpstreamScheduler(rate=1000, burst=1000, max_concurrency=1, user_max_concurrency=1)
+        order = []
+
+        async def call(user_id, index):
+            async with scheduler.slot(user_id):
+                order.append((user_id, index))
+                await asyncio.sleep(0.001)
+
+        tasks = [asyncio.create_task(call("greedy", i)) for i in range(6)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(call("kid", i)) for i in range(2)]
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(scenario())
+    kid_positions = [position for position, (user_id, _) in enumerate(order) if user_id == "kid"]
+    assert kid_positions[-1] <= 4
+
+def test_per_user_concurrency_cap():
+    """
+    测试单个用户的并发调用数受限，其他用户不受影响
+    """
+    async def scenario():
+        scheduler = UpstreamScheduler(rate=1000, burst=1000, max_concurrency=10, user_max_concurrency=2)
+        running = {"a": 0, "b": 0}
+        peak = {"a": 0, "b": 0}
+
+        async def call(user_id):
+            async with scheduler.slot(user_id):
+                running[user_id] += 1
+                peak[user_id] = max(peak[user_id], running[user_id])
+                await asyncio.sleep(0.01)
+                running[user_id] -= 1
+
+        await asyncio.gather(*(call("a") for _ in range(6)), *(call("b") for _ in range(2)))
+        return peak
+
+    assert asyncio.run(scenario()) == {"a": 2, "b": 2}
+
+def test_token_bucket_limits_rate_and_reports_wait():
+    """
+    测试令牌耗尽后按速率放行，并记录排队时间
+    """
+    async def scenario():
+        scheduler = UpstreamScheduler(rate=20, burst=2, max_concurrency=10, user_max_concurrency=10)
+        waits = []
+
+        async def call():
+            async with scheduler.slot("a") as ticket:
+                waits.append(ticket.wait_time)
+
+        await asyncio.gather(*(call() for _ in range(4)))
+        return waits, scheduler.get_stats()
+
+    waits, stats = asyncio.run(scenario())
+    assert sorted(waits)[:2] == pytest.approx([0, 0], abs=0.01)
+    assert max(waits) >= 0.08
+    assert stats["granted"] == 4
+    assert stats["queued"] == 0
+
+def test_cancelled_waiter_leaves_queue():
+    """
+    测试排队中取消的请求会被移出队列
+    """
+    async def scenario():
+        scheduler = UpstreamScheduler(rate=1000, burst=1000, max_concurrency=1, user_max_concurrency=1)
+        holder = await scheduler.acquire("a")
+        waiter = asyncio.create_task(scheduler.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        stats = scheduler.get_stats()
+        scheduler.release(holder)
+        return stats, scheduler.get_stats()
+
+    during, after = asyncio.run(scenario())
+    assert during["queued"] == 0
+    assert after["running"] == 0
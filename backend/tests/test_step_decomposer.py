@@ -0,0 +1,120 @@
+import asyncio
+import io
+import numpy as np
+from PIL import Image, ImageDraw
+from app.core.config import settings
+from app.services.image_service import ImageService
+from app.services.step_decomposer import _render_steps
+
+def _drawing_bytes() -> bytes:
+    image = Image.new("RGB", (512, 512), "white")
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((40, 40, 470, 470), outline="black", width=8)  # 大轮廓
+    draw.ellipse((150, 160, 200, 210), outline="black", width=6)  # 眼睛
+    draw.ellipse((310, 160, 360, 210), outline="black", width=6)
+    draw.arc((170, 250, 340, 380), 20, 160, fill="black", width=6)  # 嘴
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _ink(data: bytes) -> np.ndarray:
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image.convert("L")) < 128
+
+def test_render_steps_reveals_strokes_cumulatively():
+    """
+    测试步骤图逐步叠加，先画大轮廓，最后一步与原图一致
+    """
+    source = _drawing_bytes()
+    steps = [_ink(data) for data in _render_steps(source, 3)]
+
+    for previous, current in zip(steps, steps[1:]):
+        assert previous.sum() < current.sum()
+        assert not (previous & ~current).any()
+    assert (steps[-1] == _ink(source)).all()
+    # 第一步是最大的外轮廓
+    assert steps[0][40:60, 200:300].any()
+    assert not steps[0][150:210, 150:200].any()
+
+def test_render_steps_splits_single_stroke():
+    """
+    测试只有一个笔画时按从上到下的顺序拆分
+    """
+    image = Image.new("RGB", (256, 256), "white")
+    ImageDraw.Draw(image).ellipse((20, 20, 236, 236), outline="black", width=6)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+
+    steps = [_ink(data) for data in _render_steps(buffer.getvalue(), 4)]
+    counts = [step.sum() for step in steps]
+    assert counts == sorted(counts) and len(set(counts)) == 4
+    assert not steps[0][200:, :].any()
+
+def test_render_steps_last_step_is_colour_image():
+    """
+    测试彩色图像的色块不属于笔画，最后一步仍与最终图像完全一致
+    """
+    image = Image.new("RGB", (256, 256), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 160, 255, 255), fill=(120, 200, 120))  # 草地
+    draw.ellipse((60, 40, 200, 180), fill=(250, 200, 80), outline="black", width=4)  # 太阳
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+
+    steps = _render_steps(buffer.getvalue(), 3)
+    with Image.open(io.BytesIO(steps[-1])) as last:
+        assert (np.asarray(last.convert("RGB")) == np.asarray(image)).all()
+    with Image.open(io.BytesIO(steps[0])) as first:
+        assert not (np.asarray(first.convert("RGB")) == np.asarray(image)).all()
+
+def test_local_step_mode_calls_provider_once(tmp_path, monkeypatch):
+    """
+    测试本地步骤模式只调用一次服务提供商
+    """
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", None)
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "local")
+    monkeypatch.setattr(settings, "LOCAL_PROVIDER_IMAGE_SIZE", 256)
+    monkeypatch.setattr(settings, "STEP_MODE", "local")
+
+    service = ImageService()
+    calls = []
+    generate = service.backend.generate
+
+    async def counting_generate(prompt, size=None, seed=None):
+        calls.append(prompt)
+        return await generate(prompt, size, seed)
+
+    monkeypatch.setattr(service.backend, "generate", counting_generate)
+    images = []
+    result = asyncio.run(service.generate_step_by_step_drawing(
+        "画一只小兔子", steps=3, on_image=lambda index, url: images.append(index)
+    ))
+
+    assert len(calls) == 1
+    assert len(result["step_images"]) == 3
+    assert sorted(images) == [0, 1, 2, 3]
+
+def test_local_step_mode_generates_steps_for_colour_styles(tmp_path, monkeypatch):
+    """
+    测试彩色风格不在本地拆分，每个步骤单独调用服务提供商
+    """
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "DASHSCOPE_API_KEY", None)
+    monkeypatch.setattr(settings, "IMAGE_PROVIDER", "local")
+    monkeypatch.setattr(settings, "LOCAL_PROVIDER_IMAGE_SIZE", 64)
+    monkeypatch.setattr(settings, "STEP_MODE", "local")
+
+    service = ImageService()
+    calls = []
+    generate = service.backend.generate
+
+    async def counting_generate(prompt, size=None, seed=None):
+        calls.append(prompt)
+        return await generate(prompt, size, seed)
+
+    monkeypatch.setattr(service.backend, "generate", counting_generate)
+    result = asyncio.run(service.generate_step_by_step_drawing("画一只小兔子", style="卡通", steps=2))
+
+    assert len(calls) == 3
+    assert len(result["step_images"]) == 2
@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.services.task_poller import TaskPoller
+
+class FakeClient:
+    """
+    按查询次数返回任务状态的假客户端
+    """
+
+    def __init__(self, polls_until_done):
+        self.polls_until_done = polls_until_done
+        self.polls = {}
+
+    async def fetch_task(self, task_id):
+        self.polls[task_id] = self.polls.get(task_id, 0) + 1
+        if task_id.startswith("fail"):
+            return {"task_status": "FAILED", "message": "内容不合规"}
+        if self.polls[task_id] >= self.polls_until_done:
+            return {"task_status": "SUCCEEDED", "results": [{"url": f"https://img/{task_id}.png"}]}
+        return {"task_status": "RUNNING"}
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    """
+    缩短轮询间隔
+    """
+    monkeypatch.setattr(settings, "TASK_POLL_INITIAL_ESTIMATE", 0.01)
+    monkeypatch.setattr(settings, "TASK_POLL_MIN_INTERVAL", 0.005)
+    monkeypatch.setattr(settings, "TASK_POLL_MAX_INTERVAL", 0.02)
+
+def test_poller_resolves_many_tasks():
+    """
+    测试一个轮询器同时等待多个任务
+    """
+    client = FakeClient(polls_until_done=3)
+
+    async def run():
+        poller = TaskPoller(client=client)
+        outputs = await asyncio.gather(*(poller.wait(f"task-{i}", timeout=5) for i in range(20)))
+        return poller, outputs
+
+    poller, outputs = asyncio.run(run())
+
+    assert [output["results"][0]["url"] for output in outputs] == [f"https://img/task-{i}.png" for i in range(20)]
+    assert all(count == 3 for count in client.polls.values())
+    assert poller.get_stats()["pending_tasks"] == 0
+    assert poller.completed_tasks == 20
+
+def test_poller_propagates_failure_and_timeout():
+    """
+    测试任务失败和超时
+    """
+    client = FakeClient(polls_until_done=10 ** 6)
+
+    async def run():
+        poller = TaskPoller(client=client)
+        with pytest.raises(Exception, match="内容不合规"):
+            await poller.wait("fail-1", timeout=5)
+        with pytest.raises(Exception, match="超时"):
+            await poller.wait("slow-1", timeout=0.05)
+
+    asyncio.run(run())
+
+def test_poller_drops_cancelled_waiters():
+    """
+    测试调用方取消后不再查询该任务
+    """
+    client = FakeClient(polls_until_done=10 ** 6)
+
+    async def run():
+        poller = TaskPoller(client=client)
+        waiter = asyncio.ensure_future(poller.wait("abandoned", timeout=5))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        await asyncio.sleep(0.05)
+        polls = client.polls["abandoned"]
+        await asyncio.sleep(0.05)
+        return poller, polls
+
+    poller, polls = asyncio.run(run())
+
+    assert client.polls["abandoned"] == polls
+    assert poller.get_stats()["pending_tasks"] == 0
+
+def test_slow_status_fetch_does_not_block_other_tasks():
+    """
+    测试一个任务的状态查询很慢时，其他任务仍按节奏轮询并及时完成
+    """
+
+    class SlowClient(FakeClient):
+        async def fetch_task(self, task_id):
+            if task_id == "slow":
+                await asyncio.sleep(0.5)
+            return await super().fetch_task(task_id)
+
+    client = SlowClient(polls_until_done=3)
+
+    async def run():
+        poller = TaskPoller(client=client)
+        loop = asyncio.get_running_loop()
+        slow = asyncio.ensure_future(poller.wait("slow", timeout=5))
+        await asyncio.sleep(0.02)
+        started = loop.time()
+        await poller.wait("fast", timeout=5)
+        elapsed = loop.time() - started
+        slow.cancel()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.3
@@ -0,0 +1,93 @@
+import re
+import numpy as np
+from fastapi.testclient import TestClient
+from PIL import Image, ImageDraw
+from app.core.config import settings
+from app.main import app
+from app.services.asset_store import AssetStore
+from app.services.derivative_service import DerivativeService
+from app.services.vectorizer import trace_svg
+
+client = TestClient(app)
+
+def _drawing(path) -> np.ndarray:
+    image = Image.new("RGB", (512, 512), "white")
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((40, 40, 470, 470), outline="black", width=10)  # 大轮廓
+    draw.ellipse((150, 160, 210, 220), outline="black", width=6)  # 眼睛
+    image.save(path, format="PNG")
+    return np.asarray(image.convert("L")) < 128
+
+def _rasterize(svg: str, size: int) -> np.ndarray:
+    """
+    按evenodd规则把SVG路径栅格化，返回线条掩码
+    """
+    mask = np.zeros((size, size), dtype=bool)
+    for data in re.findall(r' d="([^"]+)"', svg):
+        for contour in data.split("Z"):
+            numbers = [float(value) for value in contour.lstrip("M").split()]
+            if not numbers:
+                continue
+            layer = Image.new("1", (size, size), 0)
+            ImageDraw.Draw(layer).polygon(list(zip(numbers[::2], numbers[1::2])), fill=1)
+            mask ^= np.asarray(layer)
+    return mask
+
+def test_trace_svg_matches_drawing(tmp_path):
+    """
+    测试描出的SVG与原图线条基本重合，每个笔画一个路径且大轮廓在前
+    """
+    path = tmp_path / "drawing.png"
+    ink = _drawing(path)
+
+    svg = trace_svg(str(path), 512, 0.75, 2.0).decode("utf-8")
+    traced = _rasterize(svg, 512)
+
+    assert 'viewBox="0 0 512 512"' in svg
+    assert (ink & traced).sum() / (ink | traced).sum() > 0.85
+    orders = re.findall(r'data-order="(\d+)" d="M([\d.]+) ([\d.]+)', svg)
+    assert [order for order, _, _ in orders] == ["0", "1"]
+    # 第一个路径是大轮廓，从图像上方开始
+    assert float(orders[0][2]) < 60
+
+def test_trace_svg_blank_image(tmp_path):
+    """
+    测试空白图像得到没有路径的SVG
+    """
+    path = tmp_path / "blank.png"
+    Image.new("RGB", (64, 64), "white").save(path, format="PNG")
+
+    svg = trace_svg(str(path), 512, 0.75, 2.0).decode("utf-8")
+    assert "<path" not in svg
+
+def test_get_asset_svg_variant(tmp_path, monkeypatch):
+    """
+    测试按需生成矢量图，体积小于原图
+    """
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    asset_store = AssetStore()
+    source = tmp_path / "drawing.png"
+    _drawing(source)
+    data = source.read_bytes()
+    name = asset_store.put_bytes(data, "png")
+
+    response = client.get(f"{settings.API_V1_STR}/assets/{name}/svg")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("image/svg+xml")
+    assert response.content.startswith(b"<svg")
+    assert len(response.content) < len(data)
+
+    svg_name = asset_store.put_bytes(b"<svg xmlns='http://www.w3.org/2000/svg'/>", "svg")
+    assert client.get(f"{settings.API_V1_STR}/assets/{svg_name}/svg").status_code == 404
+
+def test_svg_url_only_for_line_art_styles(tmp_path, monkeypatch):
+    """
+    测试只有线条画风格的画作返回矢量图URL
+    """
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    derivative_service = DerivativeService()
+    url = derivative_service.asset_store.url_for(derivative_service.asset_store.put_bytes(b"png", "png"))
+
+    assert derivative_service.svg_url(url, "简笔画") == f"{url}/svg"
+    assert derivative_service.svg_url(url, "水彩") is None
+    assert derivative_service.svg_url(url, None) is None
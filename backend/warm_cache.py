@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+图像缓存预热脚本
+按 主题 × 风格 × 步骤数 预先生成简笔画并写入图像生成缓存
+已在缓存中的组合会被跳过，中断后重新运行即可从断点继续
+"""
+
+import sys
+import os
+import time
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.core.database import create_tables, SessionLocal
+from app.services.asset_store import AssetStore
+from app.services.cache_service import CacheService
+from app.services.dedup_service import ImageDedupService
+from app.services.image_service import ImageService
+from app.services.step_decomposer import decomposes_steps
+
+# 常见的绘画主题
+DEFAULT_SUBJECTS = {
+    "动物": ["猫", "狗", "兔子", "小鸟", "鱼", "熊猫", "大象", "长颈鹿", "狮子", "老虎", "猴子", "小熊", "企鹅", "蝴蝶", "乌龟", "恐龙"],
+    "水果": ["苹果", "香蕉", "西瓜", "草莓", "葡萄", "橙子", "梨", "菠萝"],
+    "交通工具": ["汽车", "公交车", "火车", "飞机", "轮船", "自行车", "消防车", "火箭"],
+    "自然": ["太阳", "月亮", "星星", "花", "大树", "房子", "彩虹", "云朵"],
+}
+
+class RateLimiter:
+    """
+    令牌桶限速，按上游图像数计费
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                # 单次需求超过桶容量时，攒满即放行
+                needed = min(tokens, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= needed
+                    return
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+
+def upstream_images(style: str, steps: int) -> int:
+    """
+    生成一个组合需要调用上游的图像数
+    线条画风格在本地步骤模式下只生成最终图像，步骤图在本地拆分
+    """
+    if decomposes_steps(style) or steps <= 0:
+        return 1
+    return steps + 1
+
+class Progress:
+    """
+    进度和剩余时间统计
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def done(self) -> int:
+        return self.generated + self.skipped + self.failed
+
+    def report(self, label: str):
+        elapsed = time.monotonic() - self.started_at
+        remaining = self.total - self.done
+        # 跳过的组合几乎不耗时，按实际生成的速度估算剩余时间
+        processed = self.generated + self.failed
+        eta = elapsed / processed * remaining if processed else 0
+        print(
+            f"[{self.done}/{self.total}] {label} | "
+            f"生成 {self.generated} 跳过 {self.skipped} 失败 {self.failed} | "
+            f"已用 {elapsed:.0f}s 预计剩余 {eta:.0f}s"
+        )
+
+def load_subjects(args) -> list:
+    """
+    读取主题列表
+    """
+    if args.subjects_file:
+        with open(args.subjects_file, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if args.subjects:
+        return [s.strip() for s in args.subjects.split(",") if s.strip()]
+
+    categories = args.categories.split(",") if args.categories else list(DEFAULT_SUBJECTS)
+    subjects = []
+    for category in categories:
+        if category not in DEFAULT_SUBJECTS:
+            raise SystemExit(f"未知主题分类: {category}，可选: {', '.join(DEFAULT_SUBJECTS)}")
+        subjects.extend(DEFAULT_SUBJECTS[category])
+    return subjects
+
+async def warm_cache(subjects: list, styles: list, step_counts: list, concurrency: int, rate: float):
+    """
+    预热图像生成缓存
+    """
+    combos = [(subject, style, steps) for subject in subjects for style in styles for steps in step_counts]
+    progress = Progress(len(combos))
+    limiter = RateLimiter(rate, burst=max(upstream_images(style, steps) for style in styles for steps in step_counts))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    db = SessionLocal()
+    cache_service = CacheService(db)
+    image_service = ImageService()
+    asset_store = AssetStore()
+    dedup_service = ImageDedupService(db, asset_store)
+
+    async def warm_one(subject: str, style: str, steps: int):
+        label = f"{subject}/{style}/{steps}步"
+        async with semaphore:
+            # 预热查询不计入缓存命中率和热门提示词统计
+            if await cache_service.get_image_generation_cache(subject, style, steps, record_stats=False):
+                progress.skipped += 1
+                progress.report(f"{label} 已缓存")
+                return
+
+            # 按实际调用上游的图像数消耗配额
+            await limiter.acquire(upstream_images(style, steps))
+            try:
+                result = await image_service.generate_step_by_step_drawing(subject, style, steps)
+                # 与正式请求一样先转存到本地并去重，缓存中不保存会过期的上游地址
+                result = await asset_store.localize_result(result)
+                result = await dedup_service.deduplicate_result(result, subject, style, steps)
+                await cache_service.set_image_generation_cache(subject, style, steps, result)
+                progress.generated += 1
+                progress.report(f"{label} ✓")
+            except Exception as e:
+                progress.failed += 1
+                progress.report(f"{label} ❌ {e}")
+
+    print(f"开始预热: {len(subjects)}个主题 × {len(styles)}种风格 × {len(step_counts)}种步骤数 = {len(combos)}个组合")
+    try:
+        await asyncio.gather(*(warm_one(*combo) for combo in combos))
+    finally:
+        db.close()
+
+    print(f"🎉 预热完成: 生成 {progress.generated}，跳过 {progress.skipped}，失败 {progress.failed}")
+    return progress
+
+def main():
+    """
+    主函数
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="BabyDraw 图像缓存预热脚本")
+    parser.add_argument("--subjects", help="逗号分隔的主题列表，例如: 猫,狗,苹果")
+    parser.add_argument("--subjects-file", help="主题列表文件，每行一个主题")
+    parser.add_argument("--categories", help=f"内置主题分类，逗号分隔，可选: {', '.join(DEFAULT_SUBJECTS)}")
+    parser.add_argument(
+        "--styles",
+        default=",".join(ImageService.STYLE_PROMPTS),
+        help="逗号分隔的风格列表（默认全部风格）"
+    )
+    parser.add_argument("--steps", default="4", help="逗号分隔的步骤数列表（默认: 4）")
+    parser.add_argument("--concurrency", type=int, default=2, help="同时预热的组合数（默认: 2）")
+    parser.add_argument("--rate", type=float, default=1.0, help="每秒最多生成的图像数（默认: 1）")
+
+    args = parser.parse_args()
+
+    subjects = load_subjects(args)
+    styles = [s.strip() for s in args.styles.split(",") if s.strip()]
+    unknown_styles = [s for s in styles if s not in ImageService.STYLE_PROMPTS]
+    if unknown_styles:
+        raise SystemExit(f"未知风格: {', '.join(unknown_styles)}")
+    step_counts = [int(s) for s in args.steps.split(",") if s.strip()]
+
+    create_tables()
+
+    try:
+        progress = asyncio.run(warm_cache(subjects, styles, step_counts, max(1, args.concurrency), args.rate))
+    except KeyboardInterrupt:
+        print("\n⚠️  预热已中断，重新运行即可从断点继续")
+        sys.exit(130)
+
+    if progress.failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
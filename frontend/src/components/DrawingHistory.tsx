@@ -219,7 +219,7 @@ export function DrawingHistory({ onSelectDrawing, className }: DrawingHistoryPro
                   <div className="aspect-square bg-gray-100 relative">
                     {drawing.image_url ? (
                       <img
-                        src={drawing.image_url}
+                        src={drawing.image_variants?.small ?? drawing.image_url}
                         alt={drawing.title}
                         className="w-full h-full object-cover"
                       />
@@ -1,24 +1,39 @@
 'use client'
 
-import React, { useState } from 'react'
+import React, { useEffect, useState } from 'react'
 import { Send, Loader2 } from 'lucide-react'
 import { cn } from '@/lib/utils'
+import { apiService } from '@/services/api'
+
+// 输入停顿多久后预取图像（毫秒）
+const PREFETCH_DELAY_MS = 800
 
 interface TextInputProps {
   onSubmit: (text: string) => void
   isLoading?: boolean
   placeholder?: string
   className?: string
+  prefetch?: boolean // 输入停顿时预先生成图像，提交时直接命中缓存
 }
 
 export function TextInput({
   onSubmit,
   isLoading = false,
   placeholder = "输入你想画的内容...",
-  className
+  className,
+  prefetch = true
 }: TextInputProps) {
   const [text, setText] = useState('')
 
+  useEffect(() => {
+    const prompt = text.trim()
+    if (!prefetch || isLoading || prompt.length < 2) return
+    const timer = setTimeout(() => {
+      apiService.prefetchImage(prompt)
+    }, PREFETCH_DELAY_MS)
+    return () => clearTimeout(timer)
+  }, [text, prefetch, isLoading])
+
   const handleSubmit = (e: React.FormEvent) => {
     e.preventDefault()
     if (text.trim() && !isLoading) {
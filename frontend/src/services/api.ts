@@ -1,5 +1,6 @@
 import { 
   Drawing, 
+  DrawingBundle,
   CreateDrawingRequest, 
   SpeechRecognitionResponse, 
   ImageGenerationResponse, 
@@ -20,12 +21,13 @@ class ApiService {
     options: RequestInit = {}
   ): Promise<ApiResponse<T>> {
     try {
+      const { headers, ...rest } = options
       const response = await fetch(`${API_V1}${endpoint}`, {
+        ...rest,
         headers: {
           'Content-Type': 'application/json',
-          ...options.headers,
+          ...headers,
         },
-        ...options,
       })
 
       if (!response.ok) {
@@ -96,11 +98,20 @@ class ApiService {
     return this.request('/speech/test')
   }
 
-  // 生成图像
-  async generateImage(request: ImageGenerationRequest): Promise<ApiResponse<ImageGenerationResponse>> {
+  // 生成图像；重试时传入相同的幂等键，避免重复生成
+  async generateImage(request: ImageGenerationRequest, idempotencyKey?: string): Promise<ApiResponse<ImageGenerationResponse>> {
     return this.request<ImageGenerationResponse>('/images/generate', {
       method: 'POST',
       body: JSON.stringify(request),
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
+    })
+  }
+
+  // 预取图像：输入停顿时提交很可能的最终描述，后端低优先级生成并写入缓存
+  async prefetchImage(prompt: string, style: string = '简笔画', steps: number = 4): Promise<ApiResponse<{ status: string }>> {
+    return this.request<{ status: string }>('/images/prefetch', {
+      method: 'POST',
+      body: JSON.stringify({ prompt, style, steps }),
     })
   }
 
@@ -119,11 +130,40 @@ class ApiService {
     return this.request<Drawing>(`/drawings/${id}`)
   }
 
-  // 创建绘画
-  async createDrawing(request: CreateDrawingRequest): Promise<ApiResponse<Drawing>> {
+  // 获取绘画全部图像的精灵图和偏移表
+  async getDrawingBundle(id: number): Promise<ApiResponse<DrawingBundle>> {
+    return this.request<DrawingBundle>(`/drawings/${id}/bundle`)
+  }
+
+  // 一次请求获取精灵图，偏移表在X-Bundle-Layout响应头中；sprite_url为本地对象URL
+  async getDrawingBundleSprite(id: number): Promise<ApiResponse<DrawingBundle>> {
+    try {
+      const response = await fetch(`${API_V1}/drawings/${id}/bundle/sprite`)
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}))
+        throw new Error(errorData.detail || `HTTP error! status: ${response.status}`)
+      }
+
+      const layout = JSON.parse(response.headers.get('X-Bundle-Layout') || '{}')
+      return {
+        success: true,
+        data: { ...layout, sprite_url: URL.createObjectURL(await response.blob()) }
+      }
+    } catch (error) {
+      console.error('API request failed:', error)
+      return {
+        success: false,
+        error: error instanceof Error ? error.message : 'Unknown error'
+      }
+    }
+  }
+
+  // 创建绘画；重试时传入相同的幂等键，避免重复保存
+  async createDrawing(request: CreateDrawingRequest, idempotencyKey?: string): Promise<ApiResponse<Drawing>> {
     return this.request<Drawing>('/drawings/', {
       method: 'POST',
       body: JSON.stringify(request),
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
     })
   }
 
@@ -7,6 +7,11 @@ export interface Drawing {
   description?: string
   prompt: string
   image_url?: string
+  image_variants?: Record<string, string> // 缩略图等派生图URL，键为规格名（thumb/small/medium）
+  preview_image_url?: string // 低分辨率预览图
+  svg_url?: string // 描出的矢量图（仅线条画风格），path按data-order逐笔画显示
+  steps_svg_urls?: (string | null)[]
+  quality?: 'preview' | 'full' // preview表示高清图仍在后台生成
   step_images: string[]
   style: string
   steps: number
@@ -15,6 +20,23 @@ export interface Drawing {
   updated_at: string
 }
 
+/**
+ * 画作图像打包结果：一张精灵图和各图像在其中的位置
+ */
+export interface DrawingBundle {
+  sprite_url: string
+  width: number
+  height: number
+  frames: {
+    image: string // final 或 step_<序号>
+    source_url: string
+    x: number
+    y: number
+    width: number
+    height: number
+  }[]
+}
+
 /**
  * 创建绘画请求
  */
@@ -42,6 +64,7 @@ export interface ImageGenerationResponse {
   final_image_url: string
   step_images: string[]
   provider: string
+  quality?: 'preview' | 'full'
 }
 
 /**
@@ -51,6 +74,7 @@ export interface ImageGenerationRequest {
   prompt: string
   style?: string
   steps?: number
+  quality?: 'preview' | 'full' // preview先快速返回低分辨率图，高清图后台生成
 }
 
 /**